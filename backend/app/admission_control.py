@@ -0,0 +1,491 @@
+import logging
+import math
+import os
+import random
+import time
+from collections import OrderedDict
+from functools import cache
+from types import ModuleType
+from typing import Any
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+from database.manager import async_pool_metrics
+from database.pool_metrics import PoolMetrics
+from routes.auth.router import token_cache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_CONTROL = os.environ.get("ADMISSION_CONTROL", "true").lower() == "true"
+# Token buckets: requests per second sustained and the burst allowed on top. A rate of 0 disables the bucket.
+# Requests with an already verified bearer token are limited per user, all others per client IP. The client IP is
+# the one uvicorn takes from X-Forwarded-For, so SERVER_FORWARDED_ALLOW_IPS (server.py) must list exactly the proxies
+# in front of the app: with "*" a client picks its own address and escapes the IP limit.
+ADMISSION_USER_RATE = float(os.environ.get("ADMISSION_USER_RATE", "5"))
+ADMISSION_USER_BURST = float(os.environ.get("ADMISSION_USER_BURST", "30"))
+ADMISSION_IP_RATE = float(os.environ.get("ADMISSION_IP_RATE", "10"))
+ADMISSION_IP_BURST = float(os.environ.get("ADMISSION_IP_BURST", "60"))
+# Buckets kept per process; the least recently used are dropped beyond this.
+ADMISSION_BUCKETS_MAX_KEYS = int(os.environ.get("ADMISSION_BUCKETS_MAX_KEYS", "100000"))
+# Comma separated `route_class=limit` pairs capping concurrent requests per process, e.g. "export=2,sync=8".
+# Classes without a limit are not capped.
+ADMISSION_CONCURRENCY = os.environ.get("ADMISSION_CONCURRENCY", "sync=8,history=8,export=2")
+# Requests are shed once the p95 database pool checkout wait exceeds this; 0 disables shedding.
+ADMISSION_SHED_WAIT_MS = float(os.environ.get("ADMISSION_SHED_WAIT_MS", "250"))
+ADMISSION_SHED_INTERVAL_SECONDS = float(os.environ.get("ADMISSION_SHED_INTERVAL_SECONDS", "0.5"))
+# Route classes that may be shed. Auth requests do not use the database pool and are left alone by default.
+ADMISSION_SHED_CLASSES = os.environ.get("ADMISSION_SHED_CLASSES", "sync,history,export,default")
+ADMISSION_RETRY_AFTER_SECONDS = int(os.environ.get("ADMISSION_RETRY_AFTER_SECONDS", "2"))
+# Optional Redis holding the token buckets, so the limits hold across worker processes and hosts.
+ADMISSION_REDIS_URL = os.environ.get("ADMISSION_REDIS_URL")
+ADMISSION_REDIS_TIMEOUT_MS = float(os.environ.get("ADMISSION_REDIS_TIMEOUT_MS", "50"))
+# After a Redis error the per-process buckets are used for this long before Redis is tried again.
+ADMISSION_REDIS_RETRY_SECONDS = float(os.environ.get("ADMISSION_REDIS_RETRY_SECONDS", "10"))
+
+DEFAULT_CLASS = "default"
+# (method or None for any, path prefix, route class or None for exempt); the first match wins.
+ROUTE_CLASSES: list[tuple[str | None, str, str | None]] = [
+    (None, "/api/health/", None),
+    (None, "/api/stripe/webhook", None),
+    ("OPTIONS", "/", None),
+    ("POST", "/api/user/blocklist/sync", "sync"),
+    ("POST", "/api/user/blocklist/delta", "sync"),
+    ("GET", "/api/user/blocking_history/export", "export"),
+    ("GET", "/api/user/blocking_history/stream", "export"),
+    ("POST", "/api/user/blocking_history", "history"),
+    (None, "/api/auth/", "auth"),
+]
+
+# Refills and takes a token atomically, on Redis' clock so that hosts with skewed clocks agree.
+# KEYS[1]: the bucket; ARGV: rate, burst. Returns the seconds until a token is available, "0" if one was taken.
+_TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(state[1]) or burst
+local stamp = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - stamp) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+@cache
+def get_redis() -> ModuleType | None:
+    """
+    Import redis on first use, if installed.
+
+    Returns:
+        ModuleType | None: The `redis.asyncio` module, or None when the shared backend is unavailable.
+    """
+    try:
+        import redis.asyncio
+    except ImportError:
+        return None
+    return redis.asyncio
+
+
+def parse_limits(spec: str) -> dict[str, int]:
+    """
+    Parse comma separated `name=limit` pairs.
+
+    Args:
+        spec (str): The pairs, e.g. "export=2,sync=8".
+
+    Returns:
+        dict[str, int]: The limit per name.
+    """
+    limits = {}
+    for pair in spec.split(","):
+        if pair.strip():
+            name, _, limit = pair.partition("=")
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+def route_class(method: str, path: str) -> str | None:
+    """
+    Classify a request for concurrency limits and shedding.
+
+    Args:
+        method (str): The HTTP method.
+        path (str): The request path.
+
+    Returns:
+        str | None: The route class, or None for requests exempt from admission control.
+    """
+    for class_method, prefix, name in ROUTE_CLASSES:
+        if (class_method is None or class_method == method) and path.startswith(prefix):
+            return name
+    return DEFAULT_CLASS
+
+
+class TokenBuckets:
+    """
+    Per-process token buckets in a bounded LRU.
+
+    A dropped bucket starts full when its key returns, so `max_keys` should comfortably exceed the number of clients
+    active within a bucket's refill time.
+
+    Attributes:
+        max_keys (int): The maximum number of buckets kept.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """
+        Take a token from a bucket.
+
+        Args:
+            key (str): The bucket.
+            rate (float): Tokens added per second.
+            burst (float): The bucket's capacity.
+
+        Returns:
+            float: 0.0 if a token was taken, otherwise the seconds until one is available.
+        """
+        now = time.monotonic()
+        tokens, stamp = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - stamp) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RedisTokenBuckets:
+    """
+    Token buckets shared through Redis, updated atomically by a Lua script.
+
+    Unavailable (the package is missing, or Redis errored within the last `retry_seconds`) is reported as None, for
+    the caller to fall back on per-process buckets: admission control must not take the API down with Redis.
+
+    Attributes:
+        url (str): The Redis URL.
+        retry_seconds (float): How long Redis is left alone after an error.
+        errors (int): Number of failed Redis calls.
+    """
+
+    def __init__(self, url: str, timeout_seconds: float, retry_seconds: float, prefix: str = "admission:"):
+        self.url = url
+        self.timeout_seconds = timeout_seconds
+        self.retry_seconds = retry_seconds
+        self.prefix = prefix
+        self.errors = 0
+        self._script = None
+        self._unavailable_until = 0.0
+
+    def _get_script(self):
+        if self._script is None:
+            redis = get_redis()
+            if redis is None:
+                logger.warning("ADMISSION_REDIS_URL is set but redis is not installed; using per-process limits")
+                self._unavailable_until = math.inf
+                return None
+            client = redis.from_url(
+                self.url, socket_timeout=self.timeout_seconds, socket_connect_timeout=self.timeout_seconds
+            )
+            self._script = client.register_script(_TAKE_TOKEN_SCRIPT)
+        return self._script
+
+    async def take(self, key: str, rate: float, burst: float) -> float | None:
+        """
+        Take a token from a shared bucket.
+
+        Args:
+            key (str): The bucket.
+            rate (float): Tokens added per second.
+            burst (float): The bucket's capacity.
+
+        Returns:
+            float | None: 0.0 if a token was taken, otherwise the seconds until one is available; None when Redis
+            is unavailable.
+        """
+        if time.monotonic() < self._unavailable_until:
+            return None
+        script = self._get_script()
+        if script is None:
+            return None
+        try:
+            return float(await script(keys=[self.prefix + key], args=[rate, burst]))
+        except Exception as e:
+            self.errors += 1
+            self._unavailable_until = time.monotonic() + self.retry_seconds
+            logger.warning("Admission control Redis call failed, using per-process limits: %s", e)
+            return None
+
+    def available(self) -> bool:
+        return time.monotonic() >= self._unavailable_until
+
+
+class LoadShedder:
+    """
+    Sheds a share of requests while the database pool is saturated.
+
+    Every `interval_seconds` the p95 checkout wait of the connections taken since the previous check is compared
+    with the threshold; the shed fraction grows by `step` while it is exceeded (or checkouts timed out) and halves
+    otherwise. Only fresh waits count, so the fraction falls again once shedding has relieved the pool, and
+    `max_fraction` lets enough requests through to notice.
+
+    Attributes:
+        metrics (PoolMetrics): The pool's metrics.
+        wait_threshold_seconds (float): The p95 checkout wait above which the pool counts as saturated.
+        interval_seconds (float): How often the fraction is adjusted.
+        fraction (float): The share of sheddable requests currently rejected.
+        last_wait_p95 (float): The p95 checkout wait seen at the last check, in seconds.
+    """
+
+    def __init__(
+        self,
+        metrics: PoolMetrics,
+        wait_threshold_seconds: float,
+        interval_seconds: float,
+        step: float = 0.1,
+        max_fraction: float = 0.9,
+    ):
+        self.metrics = metrics
+        self.wait_threshold_seconds = wait_threshold_seconds
+        self.interval_seconds = interval_seconds
+        self.step = step
+        self.max_fraction = max_fraction
+        self.fraction = 0.0
+        self.last_wait_p95 = 0.0
+        self._checked_at = time.monotonic()
+        self._checkouts = metrics.checkouts
+        self._timeouts = metrics.checkout_timeouts
+
+    def _adjust(self, now: float) -> None:
+        self._checked_at = now
+        checkouts, timeouts = self.metrics.checkouts, self.metrics.checkout_timeouts
+        fresh = min(checkouts - self._checkouts, self.metrics.window)
+        self.last_wait_p95 = self.metrics.wait_percentile(0.95, last=fresh) if fresh > 0 else 0.0
+        overloaded = self.last_wait_p95 > self.wait_threshold_seconds or timeouts > self._timeouts
+        self._checkouts, self._timeouts = checkouts, timeouts
+        if overloaded:
+            self.fraction = min(self.max_fraction, self.fraction + self.step)
+        elif self.fraction:
+            self.fraction = self.fraction / 2 if self.fraction > self.step / 4 else 0.0
+
+    def should_shed(self) -> bool:
+        """
+        Decide whether to shed a request, adjusting the shed fraction when it is due.
+
+        Returns:
+            bool: True if the request should be rejected.
+        """
+        now = time.monotonic()
+        if now - self._checked_at >= self.interval_seconds:
+            self._adjust(now)
+        return self.fraction > 0 and random.random() < self.fraction
+
+
+class AdmissionController:
+    """
+    Decides which requests are admitted: per-user and per-IP rate limits, per route class concurrency limits, and
+    load shedding while the database pool is saturated.
+
+    Concurrency limits and shedding are per process, like the connection pool they protect; the token buckets are
+    shared across processes when a Redis URL is given.
+
+    Attributes:
+        concurrency_limits (dict[str, int]): The maximum concurrent requests per route class.
+        shed_classes (set[str]): The route classes that may be shed.
+        in_flight (dict[str, int]): The requests currently being handled per route class.
+    """
+
+    def __init__(
+        self,
+        user_rate: float,
+        user_burst: float,
+        ip_rate: float,
+        ip_burst: float,
+        max_keys: int,
+        concurrency_limits: dict[str, int],
+        shedder: LoadShedder | None,
+        shed_classes: set[str],
+        retry_after_seconds: int,
+        redis_buckets: RedisTokenBuckets | None = None,
+    ):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.buckets = TokenBuckets(max_keys)
+        self.redis_buckets = redis_buckets
+        self.concurrency_limits = concurrency_limits
+        self.shedder = shedder
+        self.shed_classes = shed_classes
+        self.retry_after_seconds = retry_after_seconds
+        self.in_flight: dict[str, int] = {}
+        self.admitted = 0
+        self.rate_limited = 0
+        self.concurrency_rejected: dict[str, int] = {}
+        self.shed: dict[str, int] = {}
+
+    def client_key(self, headers: Headers, client_host: str | None) -> tuple[str, float, float]:
+        """
+        Pick the token bucket for a request.
+
+        Only tokens already in the verification cache identify a user: verifying here would put the Supabase round
+        trip in front of the limit, and an invalid token must not buy a fresh bucket.
+
+        Returns:
+            tuple[str, float, float]: The bucket key, its rate and its burst.
+        """
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if token and scheme.lower() == "bearer":
+            user = token_cache.peek(token)
+            if user is not None:
+                return f"user:{user.supabase_user_id}", self.user_rate, self.user_burst
+        return f"ip:{client_host or 'unknown'}", self.ip_rate, self.ip_burst
+
+    async def take_token(self, key: str, rate: float, burst: float) -> float:
+        if rate <= 0:
+            return 0.0
+        if self.redis_buckets is not None:
+            wait = await self.redis_buckets.take(key, rate, burst)
+            if wait is not None:
+                return wait
+        return self.buckets.take(key, rate, burst)
+
+    async def admit(self, route_class: str, headers: Headers, client_host: str | None) -> JSONResponse | None:
+        """
+        Admit a request or produce its rejection.
+
+        An admitted request is counted in flight until `release` is called.
+
+        Args:
+            route_class (str): The request's route class.
+            headers (Headers): The request headers.
+            client_host (str | None): The client's address.
+
+        Returns:
+            JSONResponse | None: None if admitted, otherwise a 429 (rate limited) or 503 (overloaded) response
+            with Retry-After.
+        """
+        limit = self.concurrency_limits.get(route_class)
+        if limit is not None and self.in_flight.get(route_class, 0) >= limit:
+            self.concurrency_rejected[route_class] = self.concurrency_rejected.get(route_class, 0) + 1
+            return self._reject(503, "Too many concurrent requests, try again later", self.retry_after_seconds)
+        if self.shedder is not None and route_class in self.shed_classes and self.shedder.should_shed():
+            self.shed[route_class] = self.shed.get(route_class, 0) + 1
+            return self._reject(503, "Server is overloaded, try again later", self.retry_after_seconds)
+
+        # The slot is held while the token is taken, which may await Redis.
+        self.in_flight[route_class] = self.in_flight.get(route_class, 0) + 1
+        wait = await self.take_token(*self.client_key(headers, client_host))
+        if wait > 0:
+            self.release(route_class)
+            self.rate_limited += 1
+            return self._reject(429, "Too many requests", math.ceil(wait))
+        self.admitted += 1
+        return None
+
+    def release(self, route_class: str) -> None:
+        self.in_flight[route_class] -= 1
+
+    @staticmethod
+    def _reject(status_code: int, detail: str, retry_after: int) -> JSONResponse:
+        return JSONResponse({"detail": detail}, status_code=status_code, headers={"Retry-After": str(retry_after)})
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Report admission decisions and current load.
+
+        Returns:
+            dict[str, Any]: Admitted and rejected counters, in-flight requests and limits per route class, the
+            shed fraction and the checkout wait it is based on, and the token bucket backend.
+        """
+        return {
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "concurrency_rejected": dict(self.concurrency_rejected),
+            "shed": dict(self.shed),
+            "in_flight": dict(self.in_flight),
+            "concurrency_limits": dict(self.concurrency_limits),
+            "shed_fraction": self.shedder.fraction if self.shedder is not None else 0.0,
+            "wait_ms_p95": 1000 * self.shedder.last_wait_p95 if self.shedder is not None else 0.0,
+            "buckets": len(self.buckets),
+            "bucket_backend": "redis"
+            if self.redis_buckets is not None and self.redis_buckets.available()
+            else "process",
+            "redis_errors": self.redis_buckets.errors if self.redis_buckets is not None else 0,
+        }
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware applying an AdmissionController to HTTP requests.
+
+    Requests count as in flight until their response has been sent, streamed bodies included.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        client = scope.get("client")
+        rejection = await self.controller.admit(name, Headers(scope=scope), client[0] if client else None)
+        if rejection is not None:
+            await rejection(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name)
+
+
+admission_controller = AdmissionController(
+    user_rate=ADMISSION_USER_RATE,
+    user_burst=ADMISSION_USER_BURST,
+    ip_rate=ADMISSION_IP_RATE,
+    ip_burst=ADMISSION_IP_BURST,
+    max_keys=ADMISSION_BUCKETS_MAX_KEYS,
+    concurrency_limits=parse_limits(ADMISSION_CONCURRENCY),
+    shedder=LoadShedder(async_pool_metrics, ADMISSION_SHED_WAIT_MS / 1000, ADMISSION_SHED_INTERVAL_SECONDS)
+    if ADMISSION_SHED_WAIT_MS > 0
+    else None,
+    shed_classes={name.strip() for name in ADMISSION_SHED_CLASSES.split(",") if name.strip()},
+    retry_after_seconds=ADMISSION_RETRY_AFTER_SECONDS,
+    redis_buckets=RedisTokenBuckets(
+        ADMISSION_REDIS_URL, ADMISSION_REDIS_TIMEOUT_MS / 1000, ADMISSION_REDIS_RETRY_SECONDS
+    )
+    if ADMISSION_REDIS_URL
+    else None,
+)
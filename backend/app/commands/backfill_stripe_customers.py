@@ -0,0 +1,106 @@
+"""
+Store the Stripe customer, subscription and subscription status of paying users who checked out before they were
+mirrored on paying_user.
+
+Lists every Stripe customer and subscription (100 per API call) and matches customers to paying users by email, as
+the webhook handlers used to. Where Stripe has several customers for one email, the one with the most recent
+subscription wins. Only users without a customer id are changed, so the command can be run again safely.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.backfill_stripe_customers [--dry-run]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+from typing import Any
+
+from sqlalchemy import bindparam
+from sqlalchemy import select
+from sqlalchemy import update
+
+from database.manager import AsyncSessionLocal
+from database.manager import async_engine
+from database.models import PayingUser
+from routes.stripe.events import STRIPE_SECRET_KEY
+from routes.stripe.events import get_stripe
+
+PAGE_SIZE = 100
+
+
+def fetch_customers() -> dict[str, dict[str, Any]]:
+    """
+    Read the Stripe customers and their latest subscriptions.
+
+    Returns:
+        dict[str, dict[str, Any]]: Per customer email, the customer id, and the id, status and creation time of
+        the customer's latest subscription, if any.
+    """
+    stripe = get_stripe()
+    latest: dict[str, Any] = {}
+    for subscription in stripe.Subscription.list(status="all", limit=PAGE_SIZE).auto_paging_iter():
+        current = latest.get(subscription["customer"])
+        if current is None or subscription["created"] > current["created"]:
+            latest[subscription["customer"]] = subscription
+
+    by_email: dict[str, dict[str, Any]] = {}
+    for customer in stripe.Customer.list(limit=PAGE_SIZE).auto_paging_iter():
+        if not customer["email"]:
+            continue
+        subscription = latest.get(customer["id"])
+        candidate = {
+            "customer_id": customer["id"],
+            "subscription_id": subscription["id"] if subscription else None,
+            "status": subscription["status"] if subscription else None,
+            "created": subscription["created"] if subscription else 0,
+        }
+        current = by_email.get(customer["email"])
+        if current is None or candidate["created"] > current["created"]:
+            by_email[customer["email"]] = candidate
+    return by_email
+
+
+async def backfill(dry_run: bool) -> int:
+    customers = await asyncio.to_thread(fetch_customers)
+    print(f"Read {len(customers)} Stripe customers with an email", file=sys.stderr)
+    try:
+        async with AsyncSessionLocal() as db:
+            emails = (await db.scalars(select(PayingUser.email).where(PayingUser.stripe_customer_id.is_(None)))).all()
+            matched = [{"match_email": email, **customers[email]} for email in emails if email in customers]
+            print(
+                f"{len(emails)} paying users without a customer id: {len(matched)} matched, "
+                f"{len(emails) - len(matched)} not found in Stripe",
+                file=sys.stderr,
+            )
+            if matched and not dry_run:
+                statement = (
+                    update(PayingUser)
+                    .where(PayingUser.email == bindparam("match_email"), PayingUser.stripe_customer_id.is_(None))
+                    .values(
+                        stripe_customer_id=bindparam("customer_id"),
+                        stripe_subscription_id=bindparam("subscription_id"),
+                        subscription_status=bindparam("status"),
+                    )
+                )
+                await (await db.connection()).execute(statement, matched)
+                await db.commit()
+                print(f"Updated {len(matched)} paying users", file=sys.stderr)
+    finally:
+        await async_engine.dispose()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="report the matches without storing them")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    if STRIPE_SECRET_KEY is None:
+        print("STRIPE_SECRET_KEY environment variable is not set", file=sys.stderr)
+        sys.exit(2)
+    sys.exit(asyncio.run(backfill(args.dry_run)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Compare the blocking history upload against the previous per-row ORM implementation.
+
+Each size is uploaded twice per implementation into a scratch Postgres schema: once as all new entries, then
+again with every tenth entry changed, which is the common re-sync case.
+
+Usage (from the backend directory, against a development database):
+    PYTHONPATH=app python -m commands.benchmark_history_ingest [--sizes 100,10000,100000] [--skip-legacy]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime
+from datetime import timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from commands.scratch import scratch_schema
+from database.manager import AsyncSessionLocal
+from database.manager import async_engine
+from database.models import BlockingHistory
+from routes.user.api import BlockingHistoryRecord
+from routes.user.history_ingest import HistoryEntry
+from routes.user.history_ingest import upsert_blocking_history
+
+SCHEMA = "history_ingest_benchmark"
+
+
+async def legacy_upsert(
+    db: AsyncSession, supabase_user_id: str, records: list[BlockingHistoryRecord]
+) -> list[BlockingHistoryRecord]:
+    """The upload path before the set-based upsert: one IN query, per-row ORM changes, then a refresh per row."""
+    new_entries = {entry.timestamp: entry for entry in records}
+    result = await db.scalars(
+        select(BlockingHistory)
+        .where(BlockingHistory.supabase_user_id == supabase_user_id)
+        .where(BlockingHistory.timestamp.in_(new_entries.keys()))
+    )
+    updated_entries: list[BlockingHistory] = []
+    for entry in result.all():
+        new_entry = new_entries.pop(entry.timestamp)
+        if new_entry.url != entry.url or new_entry.pattern != entry.pattern:
+            entry.url = new_entry.url
+            entry.pattern = new_entry.pattern
+            updated_entries.append(entry)
+    for timestamp, entry in new_entries.items():
+        new_entry = BlockingHistory(
+            supabase_user_id=supabase_user_id, url=entry.url, pattern=entry.pattern, timestamp=timestamp
+        )
+        db.add(new_entry)
+        updated_entries.append(new_entry)
+    await db.commit()
+    for entry in updated_entries:
+        await db.refresh(entry)
+    return [
+        BlockingHistoryRecord(url=entry.url, pattern=entry.pattern, timestamp=entry.timestamp)
+        for entry in updated_entries
+    ]
+
+
+async def current_upsert(
+    db: AsyncSession, supabase_user_id: str, records: list[BlockingHistoryRecord]
+) -> list[HistoryEntry]:
+    """The set-based upsert used by the endpoint, committed the same way."""
+    changed = await upsert_blocking_history(db, supabase_user_id, records)
+    await db.commit()
+    return changed
+
+
+IMPLEMENTATIONS = {"legacy": legacy_upsert, "current": current_upsert}
+
+
+def make_records(size: int, changed_every: int = 0) -> list[BlockingHistoryRecord]:
+    start = datetime(2024, 1, 1)
+    return [
+        BlockingHistoryRecord(
+            url=f"https://example.com/{i}" + ("?changed" if changed_every and i % changed_every == 0 else ""),
+            pattern=f"pattern-{i % 20}",
+            timestamp=start + timedelta(seconds=i),
+        )
+        for i in range(size)
+    ]
+
+
+async def run(sizes: list[int], implementations: list[str]) -> None:
+    print(f"{'rows':>8} {'implementation':<15} {'pass':<10} {'seconds':>9} {'rows/s':>10} {'returned':>9}")
+    for size in sizes:
+        passes = [("new", make_records(size)), ("re-upload", make_records(size, changed_every=10))]
+        for name in implementations:
+            user_id = f"{name}-{size}"
+            for label, records in passes:
+                async with AsyncSessionLocal() as db:
+                    start = time.perf_counter()
+                    try:
+                        changed = await IMPLEMENTATIONS[name](db, user_id, records)
+                    except Exception as e:
+                        print(f"{size:>8} {name:<15} {label:<10} failed: {type(e).__name__}: {str(e)[:80]}")
+                        break
+                    seconds = time.perf_counter() - start
+                print(f"{size:>8} {name:<15} {label:<10} {seconds:>9.3f} {size / seconds:>10.0f} {len(changed):>9}")
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,10000,100000", help="comma separated upload sizes")
+    parser.add_argument("--skip-legacy", action="store_true", help="only run the current implementation")
+    parser.add_argument("--keep", action="store_true", help=f"keep the {SCHEMA} schema for manual inspection")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    implementations = ["current"] if args.skip_legacy else ["legacy", "current"]
+    with scratch_schema(SCHEMA, keep=args.keep):
+        asyncio.run(run(sizes, implementations))
+
+
+if __name__ == "__main__":
+    main()
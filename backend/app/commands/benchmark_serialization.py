@@ -0,0 +1,104 @@
+"""
+Compare the old `response_model` serialization of a large list response with the fast path.
+
+Serializes the same rows, shaped like GET /api/user/blocking_history, three ways: building a pydantic model per row
+and letting FastAPI validate and encode them through `response_model` (the previous route code), `fast_response`
+with orjson, and `fast_response` with MessagePack. Then reports the cost and size of each response compression.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.benchmark_serialization [--rows 10000] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from datetime import timedelta
+from typing import Any
+from typing import Callable
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from routes.user.api import BlockingHistoryRecord
+from routes.user.serialization import RESPONSE_COMPRESSION_MIN_BYTES
+from routes.user.serialization import RESPONSE_COMPRESSION_THREADPOOL_MIN_BYTES
+from routes.user.serialization import fast_response
+from routes.user.serialization import get_brotli
+from routes.user.serialization import get_msgpack
+
+
+def make_rows(count: int) -> list[dict[str, Any]]:
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "url": f"https://www.site{i % 50}.com/page/{i}",
+            "pattern": f"*site{i % 50}*",
+            "timestamp": start + timedelta(seconds=37 * i, microseconds=i % 1000),
+        }
+        for i in range(count)
+    ]
+
+
+def make_request(accept: str = "application/json", accept_encoding: str = "identity") -> Request:
+    headers = [(b"accept", accept.encode()), (b"accept-encoding", accept_encoding.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def response_model_path(rows: list[dict[str, Any]]) -> bytes:
+    field = create_model_field("Response", list[BlockingHistoryRecord], mode="serialization")
+    models = [BlockingHistoryRecord(**row) for row in rows]
+    content = asyncio.run(serialize_response(field=field, response_content=models))
+    return JSONResponse(content).body
+
+
+def timed(label: str, repeat: int, call: Callable[[], bytes]) -> bytes:
+    body = call()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    seconds = (time.perf_counter() - start) / repeat
+    print(f"  {label:<34} {seconds * 1000:8.2f} ms {len(body):>10} bytes")
+    return body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="rows in the response")
+    parser.add_argument("--repeat", type=int, default=20, help="timed repetitions per variant")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    loop = asyncio.new_event_loop()
+
+    def encoded(request: Request) -> bytes:
+        return bytes(loop.run_until_complete(fast_response(request, rows)).body)
+
+    print(f"Serialization of {args.rows} rows (mean of {args.repeat} runs):")
+    timed("pydantic models + response_model", args.repeat, lambda: response_model_path(rows))
+    json_request = make_request()
+    timed("fast_response, orjson", args.repeat, lambda: encoded(json_request))
+    if get_msgpack() is not None:
+        msgpack_request = make_request(accept="application/msgpack")
+        timed("fast_response, msgpack", args.repeat, lambda: encoded(msgpack_request))
+    else:
+        print("  fast_response, msgpack             skipped: msgpack is not installed")
+
+    print(
+        f"Compression, applied above {RESPONSE_COMPRESSION_MIN_BYTES} bytes, "
+        f"in the thread pool above {RESPONSE_COMPRESSION_THREADPOOL_MIN_BYTES}:"
+    )
+    gzip_request = make_request(accept_encoding="gzip")
+    timed("orjson + gzip", args.repeat, lambda: encoded(gzip_request))
+    if get_brotli() is not None:
+        br_request = make_request(accept_encoding="br")
+        timed("orjson + br", args.repeat, lambda: encoded(br_request))
+    else:
+        print("  orjson + br                        skipped: brotli is not installed")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
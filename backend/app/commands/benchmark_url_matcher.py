@@ -0,0 +1,99 @@
+"""
+Compare the compiled blocklist matcher with matching one pattern regex at a time.
+
+Classifies the same synthetic URLs against blocklists of increasing size three ways: building a regex per pattern
+on every check, as the extension's `matchesWildcard` does; regexes compiled once per pattern and tried in order;
+and `PatternMatcher`. Also checks that all three pick the same pattern for every URL.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.benchmark_url_matcher [--patterns 20,200,1000] [--urls 1000]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from typing import Callable
+
+from routes.user.url_matcher import PatternMatcher
+from routes.user.url_matcher import wildcard_regex
+
+WORDS = ["news", "video", "social", "shop", "mail", "game", "sport", "music", "forum", "blog", "wiki", "chat"]
+TLDS = ["com", "org", "net", "io"]
+
+
+def make_patterns(count: int, rng: random.Random) -> list[str]:
+    shapes = ["*{site}.{tld}*", "{site}.{tld}/*", "*.{site}.{tld}/?/*", "{site}", "*{site}*/watch?v=*"]
+    patterns = []
+    for i in range(count):
+        site = f"{rng.choice(WORDS)}{i}"
+        patterns.append(rng.choice(shapes).format(site=site, tld=rng.choice(TLDS)))
+    return patterns
+
+
+def make_urls(count: int, sites: int, rng: random.Random) -> list[str]:
+    return [
+        f"https://www.{rng.choice(WORDS)}{rng.randrange(sites * 2)}.{rng.choice(TLDS)}/{rng.choice(WORDS)}/"
+        f"watch?v={rng.randrange(10**6)}&ref=Home"
+        for _ in range(count)
+    ]
+
+
+def naive(patterns: list[str]) -> Callable[[list[str]], list[str | None]]:
+    def classify(urls: list[str]) -> list[str | None]:
+        return [
+            next((p for p in patterns if re.compile(wildcard_regex(p), re.IGNORECASE).search(url)), None)
+            for url in urls
+        ]
+
+    return classify
+
+
+def precompiled(patterns: list[str]) -> Callable[[list[str]], list[str | None]]:
+    regexes = [(p, re.compile(wildcard_regex(p), re.IGNORECASE)) for p in patterns]
+
+    def classify(urls: list[str]) -> list[str | None]:
+        return [next((p for p, regex in regexes if regex.search(url)), None) for url in urls]
+
+    return classify
+
+
+def compiled(patterns: list[str]) -> Callable[[list[str]], list[str | None]]:
+    return PatternMatcher(patterns).classify
+
+
+IMPLEMENTATIONS = {"naive": naive, "precompiled": precompiled, "PatternMatcher": compiled}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patterns", default="20,200,1000", help="comma separated blocklist sizes")
+    parser.add_argument("--urls", type=int, default=1000, help="URLs classified per blocklist")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the synthetic data")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'patterns':>8} {'implementation':<16} {'seconds':>8} {'us/url':>8} {'matched':>8}")
+    mismatches = 0
+    for size in (int(s) for s in args.patterns.split(",")):
+        patterns = make_patterns(size, rng)
+        urls = make_urls(args.urls, size, rng)
+        expected = None
+        for name, build in IMPLEMENTATIONS.items():
+            started = time.perf_counter()
+            classify = build(patterns)
+            result = classify(urls)
+            seconds = time.perf_counter() - started
+            matched = sum(pattern is not None for pattern in result)
+            print(f"{size:>8} {name:<16} {seconds:>8.3f} {seconds / len(urls) * 1e6:>8.1f} {matched:>8}")
+            if expected is None:
+                expected = result
+            elif result != expected:
+                mismatches += 1
+                print(f"         {name} disagrees with {next(iter(IMPLEMENTATIONS))}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Bulk import blocking history or blocklists, e.g. when migrating users from another blocker or replaying
+extension storage dumps.
+
+The file is loaded into a temporary staging table with COPY FROM, then merged set-based, a batch of whole users
+per transaction: history is de-duplicated on (supabase_user_id, timestamp) exactly like uploads and keeps the stats
+rollups current; blocklist patterns are added to the users' blocklists with a new revision. Each batch commits on
+its own and re-importing a file changes nothing, so an interrupted import can simply be run again. Uploads keep
+working meanwhile.
+
+Files are CSV with a header row or NDJSON, optionally gzip or zstd compressed, as written by
+`commands.export_history`:
+    history:   supabase_user_id, url, pattern, timestamp (ISO 8601; UTC unless it carries an offset)
+    blocklist: supabase_user_id, pattern, created_at (optional)
+supabase_user_id may be left out when --user is given.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.bulk_import history FILE [--user ID] [--format csv|ndjson] [--batch-rows N]
+    PYTHONPATH=app python -m commands.bulk_import blocklist FILE [--user ID] [--format csv|ndjson]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+import zlib
+from collections.abc import AsyncIterator
+from typing import BinaryIO
+
+from database.manager import async_engine
+from routes.user.bulk_import import IMPORT_BATCH_ROWS
+from routes.user.bulk_import import IMPORT_BATCH_USERS
+from routes.user.bulk_import import IMPORT_FORMATS
+from routes.user.bulk_import import BulkImportError
+from routes.user.bulk_import import merge_blocklist_batch
+from routes.user.bulk_import import merge_history_batch
+from routes.user.bulk_import import plan_batches
+from routes.user.bulk_import import stage_import
+from routes.user.history_codec import get_zstandard
+
+READ_SIZE = 1024 * 1024
+PROGRESS_INTERVAL_SECONDS = 2.0
+
+
+def file_format(path: str) -> str:
+    name = path.removesuffix(".gz").removesuffix(".zst")
+    return "ndjson" if name.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+async def read_file(file: BinaryIO, path: str) -> AsyncIterator[bytes]:
+    """Yield the file's uncompressed contents, printing how much has been read every few seconds."""
+    if path.endswith(".gz"):
+        decompress = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16).decompress
+    elif path.endswith(".zst"):
+        decompress = get_zstandard().ZstdDecompressor().decompressobj().decompress
+    else:
+        decompress = bytes
+    start = last_report = time.perf_counter()
+    read = 0
+    while chunk := file.read(READ_SIZE):
+        read += len(chunk)
+        if data := decompress(chunk):
+            yield data
+        if time.perf_counter() - last_report >= PROGRESS_INTERVAL_SECONDS:
+            last_report = time.perf_counter()
+            print(f"  staged {read / 1e6:.0f} MB ({read / 1e6 / (last_report - start):.1f} MB/s)", file=sys.stderr)
+
+
+async def run(args: argparse.Namespace, file: BinaryIO) -> int:
+    merge = merge_history_batch if args.kind == "history" else merge_blocklist_batch
+    start = time.perf_counter()
+    try:
+        async with async_engine.connect() as connection:
+            staged = await stage_import(connection, args.kind, read_file(file, args.file), args.format, args.user)
+            await connection.commit()
+            print(f"Staged {staged} rows in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+            batches = await plan_batches(connection, args.kind, args.batch_rows, args.batch_users)
+            merge_start = time.perf_counter()
+            merged = changed = 0
+            for users, rows in batches:
+                counts = await merge(connection, users)
+                await connection.commit()
+                merged += rows
+                changed += counts[0] + (counts[1] if args.kind == "history" else 0)
+                elapsed = time.perf_counter() - merge_start
+                print(
+                    f"  merged {merged}/{staged} rows, {len(users)} users: {counts[0]} "
+                    f"{'inserted' if args.kind == 'history' else 'added'}, "
+                    f"{counts[1]} {'updated' if args.kind == 'history' else 'users changed'} "
+                    f"({merged / elapsed:,.0f} rows/s)",
+                    file=sys.stderr,
+                )
+    except BulkImportError as e:
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        await async_engine.dispose()
+    elapsed = time.perf_counter() - start
+    print(
+        f"Imported {staged} rows ({changed} changes) in {elapsed:.1f} s: {staged / elapsed:,.0f} rows/s",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=["history", "blocklist"])
+    parser.add_argument("file", help="the file to import, or - for stdin (uncompressed)")
+    parser.add_argument("--user", help="Supabase user id of rows that do not name one")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="defaults to the file name's extension")
+    parser.add_argument("--batch-rows", type=int, default=IMPORT_BATCH_ROWS, help="staged rows per transaction")
+    parser.add_argument("--batch-users", type=int, default=IMPORT_BATCH_USERS, help="maximum users per transaction")
+    args = parser.parse_args()
+    args.format = args.format or file_format(args.file)
+    logging.disable(logging.INFO)
+
+    if args.file == "-":
+        sys.exit(asyncio.run(run(args, sys.stdin.buffer)))
+    with open(args.file, "rb") as file:
+        sys.exit(asyncio.run(run(args, file)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Check the admission control middleware, without a database.
+
+Serves stub handlers at the API's paths behind the middleware and checks that:
+
+- a client IP is rate limited after its burst, with Retry-After, and other IPs are not;
+- behind the proxies in SERVER_FORWARDED_ALLOW_IPS, a client cannot escape its IP limit by sending X-Forwarded-For;
+- a verified token is limited per user, not per IP, and an unverified one per IP;
+- a route class is capped at its concurrency limit, while exempt routes are not;
+- requests are shed while the pool's checkout wait is above the threshold, auth requests excepted, and shedding
+  stops once the pool recovers;
+- with --redis-url, two controllers (as two workers) share their token buckets;
+- an unreachable Redis falls back to per-process buckets.
+
+Also reports the middleware's overhead per admitted request. Exits non-zero if any check fails.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.check_admission_control [--redis-url redis://localhost:6379/15]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from admission_control import AdmissionController
+from admission_control import AdmissionControlMiddleware
+from admission_control import LoadShedder
+from admission_control import RedisTokenBuckets
+from admission_control import get_redis
+from database.pool_metrics import PoolMetrics
+from routes.auth.api import UserResponse
+from routes.auth.router import token_cache
+from server import SERVER_FORWARDED_ALLOW_IPS
+
+BURST = 5
+EXPORT_LIMIT = 2
+SHED_WAIT_SECONDS = 0.1
+
+
+def controller(metrics: PoolMetrics | None = None, redis_url: str | None = None) -> AdmissionController:
+    return AdmissionController(
+        user_rate=1,
+        user_burst=BURST * 2,
+        ip_rate=1,
+        ip_burst=BURST,
+        max_keys=1000,
+        concurrency_limits={"export": EXPORT_LIMIT},
+        shedder=LoadShedder(metrics, SHED_WAIT_SECONDS, interval_seconds=0) if metrics is not None else None,
+        shed_classes={"default", "export"},
+        retry_after_seconds=1,
+        redis_buckets=RedisTokenBuckets(redis_url, timeout_seconds=0.2, retry_seconds=60) if redis_url else None,
+    )
+
+
+def stub_app(release: asyncio.Event) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/user/blocklist")
+    async def get_blocklist():
+        return []
+
+    @app.get("/api/user/blocking_history/export")
+    async def export_blocking_history():
+        await release.wait()
+        return []
+
+    @app.post("/api/auth/refresh")
+    async def refresh():
+        return {}
+
+    @app.get("/api/health/check")
+    async def get_health():
+        return {"status": "ok"}
+
+    return app
+
+
+class Checker:
+    def __init__(self):
+        self.failures = 0
+        self.release = asyncio.Event()
+        self.app = stub_app(self.release)
+        self.metrics = PoolMetrics("check")
+
+    def check(self, name: str, ok: bool, detail: str = "") -> None:
+        self.failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {name}" + (f": {detail}" if detail else ""))
+
+    def client(
+        self, admission: AdmissionController | None, ip: str = "203.0.113.1", proxied: bool = False
+    ) -> httpx.AsyncClient:
+        """A client connecting from `ip`; with `proxied`, through uvicorn's proxy headers handling as served."""
+        app = AdmissionControlMiddleware(self.app, admission) if admission is not None else self.app
+        if proxied:
+            app = ProxyHeadersMiddleware(app, trusted_hosts=SERVER_FORWARDED_ALLOW_IPS)
+        transport = httpx.ASGITransport(app=app, client=(ip, 40000))
+        return httpx.AsyncClient(transport=transport, base_url="http://testserver")
+
+    async def statuses(
+        self,
+        client: httpx.AsyncClient,
+        count: int,
+        path: str = "/api/user/blocklist",
+        method: str = "GET",
+        wait: float | None = None,
+        **kwargs,
+    ) -> list[int]:
+        """Send `count` requests; with `wait`, each is preceded by a pool checkout that waited that long."""
+        statuses = []
+        for _ in range(count):
+            if wait is not None:
+                self.metrics.record_wait(wait)
+            statuses.append((await client.request(method, path, **kwargs)).status_code)
+        return statuses
+
+    async def check_ip_buckets(self) -> None:
+        admission = controller()
+        async with self.client(admission) as client, self.client(admission, ip="203.0.113.2") as other:
+            statuses = await self.statuses(client, BURST)
+            limited = await client.get("/api/user/blocklist")
+            other_status = (await other.get("/api/user/blocklist")).status_code
+        self.check(
+            "IP limited after its burst",
+            statuses == [200] * BURST and limited.status_code == 429 and int(limited.headers["retry-after"]) >= 1,
+            f"{statuses} then {limited.status_code}, Retry-After {limited.headers.get('retry-after')}",
+        )
+        self.check("other IPs unaffected", other_status == 200, str(other_status))
+
+    async def check_forwarded_for(self) -> None:
+        admission = controller()
+        proxy = SERVER_FORWARDED_ALLOW_IPS.split(",")[0].strip()
+        async with self.client(admission, ip=proxy, proxied=True) as client:
+            # The proxy appends the address it saw to whatever the client sent.
+            statuses = [
+                (
+                    await client.get("/api/user/blocklist", headers={"X-Forwarded-For": f"10.0.{i}.1, 203.0.113.9"})
+                ).status_code
+                for i in range(BURST + 1)
+            ]
+        self.check(
+            "spoofed X-Forwarded-For does not escape the IP limit",
+            statuses == [200] * BURST + [429],
+            f"SERVER_FORWARDED_ALLOW_IPS={SERVER_FORWARDED_ALLOW_IPS}: {statuses}",
+        )
+
+    async def check_user_buckets(self) -> None:
+        admission = controller()
+        token = f"check-{uuid.uuid4()}"
+        token_cache.put(token, UserResponse(supabase_user_id=str(uuid.uuid4())), None)
+        verified = {"Authorization": f"Bearer {token}"}
+        async with self.client(admission) as client:
+            exhausted = await self.statuses(client, BURST + 1)
+            user = await self.statuses(client, BURST * 2 + 1, headers=verified)
+            unverified = await self.statuses(client, 1, headers={"Authorization": "Bearer forged"})
+        token_cache.invalidate(token)
+        self.check(
+            "verified token limited per user, not per IP",
+            exhausted[-1] == 429 and user == [200] * BURST * 2 + [429],
+            f"IP exhausted, then user {user.count(200)} admitted and {user[-1]}",
+        )
+        self.check("unverified token limited per IP", unverified == [429], str(unverified))
+
+    async def check_concurrency(self) -> None:
+        admission = controller()
+        self.release.clear()
+        async with self.client(admission) as client:
+            held = [asyncio.create_task(client.get("/api/user/blocking_history/export")) for _ in range(EXPORT_LIMIT)]
+            await asyncio.sleep(0.05)
+            rejected = await client.get("/api/user/blocking_history/export")
+            other = (await client.get("/api/user/blocklist")).status_code
+            health = await self.statuses(client, BURST * 2, path="/api/health/check")
+            self.release.set()
+            held_statuses = [response.status_code for response in await asyncio.gather(*held)]
+            after = (await client.get("/api/user/blocking_history/export")).status_code
+        self.check(
+            "route class capped at its concurrency limit",
+            held_statuses == [200] * EXPORT_LIMIT and rejected.status_code == 503 and "retry-after" in rejected.headers,
+            f"{EXPORT_LIMIT} in flight, next {rejected.status_code}; other class {other}; after release {after}",
+        )
+        self.check("exempt routes not limited", health == [200] * BURST * 2, f"{health.count(200)} health checks")
+
+    async def check_shedding(self) -> None:
+        admission = controller(self.metrics)
+        admission.ip_rate = 0
+        async with self.client(admission) as client:
+            await self.statuses(client, 20, wait=SHED_WAIT_SECONDS * 2)
+            shed = await self.statuses(client, 100, wait=SHED_WAIT_SECONDS * 2)
+            auth = await self.statuses(client, 20, path="/api/auth/refresh", method="POST", wait=SHED_WAIT_SECONDS * 2)
+            peak = admission.shedder.fraction
+            await self.statuses(client, 20, wait=SHED_WAIT_SECONDS / 10)
+            recovered = await self.statuses(client, 20, wait=SHED_WAIT_SECONDS / 10)
+        self.check(
+            "shed while the pool is saturated",
+            shed.count(503) > 50 and auth == [200] * 20,
+            f"fraction {peak:.2f}, {shed.count(503)}/100 shed, auth {auth.count(200)}/20 admitted",
+        )
+        self.check(
+            "shedding stops once the pool recovers",
+            recovered == [200] * 20,
+            f"fraction {admission.shedder.fraction:.2f}, {recovered.count(200)}/20 admitted",
+        )
+
+    async def check_shared_buckets(self, redis_url: str) -> None:
+        first, second = controller(redis_url=redis_url), controller(redis_url=redis_url)
+        ip = f"198.51.100.{uuid.uuid4().int % 250}"
+        async with self.client(first, ip) as one, self.client(second, ip) as two:
+            statuses = [(await client.get("/api/user/blocklist")).status_code for client in [one, two] * BURST]
+        self.check(
+            "workers share buckets through Redis",
+            statuses.count(200) == BURST and first.redis_buckets.errors == second.redis_buckets.errors == 0,
+            f"{statuses.count(200)} of {len(statuses)} admitted across 2 controllers, burst {BURST}",
+        )
+
+    async def check_redis_fallback(self) -> None:
+        admission = controller(redis_url="redis://127.0.0.1:1/0")
+        async with self.client(admission) as client:
+            statuses = await self.statuses(client, BURST + 1)
+        stats = admission.stats()
+        self.check(
+            "unreachable Redis falls back to per-process buckets",
+            statuses == [200] * BURST + [429] and stats["bucket_backend"] == "process",
+            f"{statuses.count(200)} admitted, {stats['redis_errors']} Redis errors",
+        )
+
+    async def measure_overhead(self, requests: int) -> None:
+        timings = {}
+        for name, admission in (("without", None), ("with", controller())):
+            if admission is not None:
+                admission.ip_rate = 0
+            async with self.client(admission) as client:
+                await self.statuses(client, 10)
+                started = time.perf_counter()
+                await self.statuses(client, requests)
+                timings[name] = (time.perf_counter() - started) / requests * 1e6
+        print(
+            f"overhead: {timings['with'] - timings['without']:.1f} µs per request "
+            f"({timings['without']:.0f} µs without, {timings['with']:.0f} µs with, through httpx)"
+        )
+
+    async def run(self, redis_url: str | None, requests: int) -> None:
+        await self.check_ip_buckets()
+        await self.check_forwarded_for()
+        await self.check_user_buckets()
+        await self.check_concurrency()
+        await self.check_shedding()
+        if redis_url:
+            await self.check_shared_buckets(redis_url)
+        if get_redis() is not None:
+            await self.check_redis_fallback()
+        await self.measure_overhead(requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", help="a Redis to check the shared token buckets against")
+    parser.add_argument("--requests", type=int, default=2000, help="requests timed to measure the overhead")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    if args.redis_url and get_redis() is None:
+        print("--redis-url needs the redis package", file=sys.stderr)
+        sys.exit(2)
+
+    checker = Checker()
+    asyncio.run(checker.run(args.redis_url, args.requests))
+    sys.exit(1 if checker.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Check the Supabase auth gateway against a fake Supabase auth server, without Supabase.
+
+The fake answers the GoTrue endpoints the app uses through `httpx.MockTransport`; timeouts and unreachable servers use
+real local sockets. Checks that:
+
+- sessions and users are parsed, and the anon key is sent;
+- upstream errors keep their status and GoTrue message, whichever key or body format carries it;
+- a server that does not answer fails after the configured timeout, and an unreachable one at once, both as
+  AuthGatewayError without a status;
+- concurrent refreshes of the same token make one upstream call and share its result or error, while different
+  tokens and later refreshes make their own;
+- concurrent POST /api/auth/refresh requests with the same token make one upstream call, and a rejected refresh is a
+  401.
+
+Exits non-zero if any check fails.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.check_auth_gateway [--concurrency 20]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+from routes.auth import router as auth_router
+from routes.auth.gateway import AuthGatewayError
+from routes.auth.gateway import SupabaseAuthGateway
+
+BASE_URL = "https://fake.supabase.local"
+API_KEY = "anon-key"
+USER = {"id": "6f1f7c1e-0000-4000-8000-000000000001", "email": "user@example.com"}
+PASSWORD = "correct horse"
+UPSTREAM_LATENCY_SECONDS = 0.05
+
+
+class FakeSupabase:
+    """Answers the GoTrue endpoints the gateway calls, counting calls per endpoint."""
+
+    def __init__(self):
+        self.calls: Counter[str] = Counter()
+        self.api_keys: set[str] = set()
+
+    @staticmethod
+    def session(refresh_token: str) -> dict:
+        return {
+            "access_token": f"access-for-{refresh_token}",
+            "refresh_token": f"{refresh_token}-next",
+            "expires_in": 3600,
+            "token_type": "bearer",
+            "user": USER,
+        }
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix("/auth/v1")
+        grant_type = request.url.params.get("grant_type")
+        self.calls[f"{request.method} {path}" + (f" {grant_type}" if grant_type else "")] += 1
+        self.api_keys.add(request.headers.get("apikey", ""))
+        await asyncio.sleep(UPSTREAM_LATENCY_SECONDS)
+        body = json.loads(request.content) if request.content else {}
+
+        if path == "/token" and grant_type == "refresh_token":
+            token = body["refresh_token"]
+            if token.startswith("valid"):
+                return httpx.Response(200, json=self.session(token))
+            return httpx.Response(
+                400, json={"error": "invalid_grant", "error_description": "Invalid Refresh Token: Already Used"}
+            )
+        if path == "/token" and grant_type == "password":
+            if body["password"] == PASSWORD:
+                return httpx.Response(200, json=self.session("valid-login"))
+            return httpx.Response(
+                400, json={"error": "invalid_grant", "error_description": "Invalid login credentials"}
+            )
+        if path == "/user":
+            if request.headers["authorization"] == "Bearer valid-access":
+                return httpx.Response(200, json=USER)
+            return httpx.Response(401, json={"code": 401, "msg": "invalid JWT: unable to parse or verify signature"})
+        if path == "/signup":
+            if len(body["password"]) < 6:
+                return httpx.Response(422, json={"code": 422, "msg": "Password should be at least 6 characters"})
+            return httpx.Response(503, text="upstream unavailable")
+        return httpx.Response(404, json={"message": "no route"})
+
+
+class Checker:
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, name: str, ok: bool, detail: str = "") -> None:
+        self.failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {name}" + (f": {detail}" if detail else ""))
+
+    @staticmethod
+    def gateway(fake: FakeSupabase, **kwargs) -> SupabaseAuthGateway:
+        return SupabaseAuthGateway(BASE_URL, API_KEY, transport=httpx.MockTransport(fake.handle), **kwargs)
+
+    @staticmethod
+    async def error(call) -> AuthGatewayError | None:
+        try:
+            await call
+        except AuthGatewayError as e:
+            return e
+        return None
+
+    async def check_parsing(self) -> None:
+        fake = FakeSupabase()
+        gateway = self.gateway(fake)
+        session = await gateway.sign_in_with_password(USER["email"], PASSWORD)
+        user = await gateway.get_user("valid-access")
+        await gateway.aclose()
+        self.check(
+            "session and user parsed",
+            session.user is not None and session.user.id == user.id == USER["id"] and session.expires_in == 3600,
+            f"user {user.id}, session expires in {session.expires_in}s",
+        )
+        self.check("anon key sent", fake.api_keys == {API_KEY}, str(fake.api_keys))
+
+    async def check_error_mapping(self) -> None:
+        gateway = self.gateway(FakeSupabase())
+        cases = [
+            ("error_description", gateway.sign_in_with_password(USER["email"], "wrong"), 400, "Invalid login"),
+            ("msg", gateway.get_user("expired-access"), 401, "invalid JWT"),
+            ("validation", gateway.sign_up(USER["email"], "short"), 422, "at least 6 characters"),
+            ("non-JSON body", gateway.sign_up(USER["email"], "long enough"), 503, "upstream unavailable"),
+        ]
+        for name, call, status_code, message in cases:
+            e = await self.error(call)
+            self.check(
+                f"upstream error mapped ({name})",
+                e is not None and e.status_code == status_code and message in e.message,
+                f"{e.status_code} {e.message}" if e else "no error",
+            )
+        await gateway.aclose()
+
+    async def check_timeouts(self) -> None:
+        # Accepts connections and reads requests, but never answers.
+        async def hang(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            await reader.read(65536)
+            await asyncio.sleep(60)
+
+        server = await asyncio.start_server(hang, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        gateway = SupabaseAuthGateway(f"http://127.0.0.1:{port}", API_KEY, timeout=0.3, connect_timeout=0.3)
+        started = time.perf_counter()
+        e = await self.error(gateway.get_user("valid-access"))
+        elapsed = time.perf_counter() - started
+        await gateway.aclose()
+        server.close()
+        self.check(
+            "unanswered request times out",
+            e is not None and e.status_code is None and "Timeout" in e.message and elapsed < 1.5,
+            f"{e.message if e else 'no error'} after {elapsed:.2f}s (timeout 0.3s)",
+        )
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            closed_port = s.getsockname()[1]
+        gateway = SupabaseAuthGateway(f"http://127.0.0.1:{closed_port}", API_KEY, timeout=0.3, connect_timeout=0.3)
+        started = time.perf_counter()
+        e = await self.error(gateway.get_user("valid-access"))
+        elapsed = time.perf_counter() - started
+        await gateway.aclose()
+        self.check(
+            "unreachable server fails",
+            e is not None and e.status_code is None and "ConnectError" in e.message and elapsed < 0.3,
+            f"{e.message if e else 'no error'} after {elapsed:.2f}s",
+        )
+
+    async def check_single_flight(self, concurrency: int) -> None:
+        fake = FakeSupabase()
+        gateway = self.gateway(fake)
+        refresh = "POST /token refresh_token"
+
+        sessions = await asyncio.gather(*(gateway.refresh_session("valid-shared") for _ in range(concurrency)))
+        self.check(
+            "concurrent refreshes of one token coalesced",
+            fake.calls[refresh] == 1 and len({s.access_token for s in sessions}) == 1,
+            f"{concurrency} refreshes, {fake.calls[refresh]} upstream call",
+        )
+
+        fake.calls.clear()
+        errors = await asyncio.gather(
+            *(self.error(gateway.refresh_session("revoked-shared")) for _ in range(concurrency))
+        )
+        self.check(
+            "coalesced refresh shares its error",
+            fake.calls[refresh] == 1 and all(e is not None and e.status_code == 400 for e in errors),
+            f"{sum(e is not None for e in errors)} errors, {fake.calls[refresh]} upstream call",
+        )
+
+        fake.calls.clear()
+        await asyncio.gather(*(gateway.refresh_session(f"valid-{i}") for i in range(concurrency)))
+        await gateway.refresh_session("valid-shared")
+        self.check(
+            "different and later refreshes not coalesced",
+            fake.calls[refresh] == concurrency + 1,
+            f"{concurrency} tokens then a repeat, {fake.calls[refresh]} upstream calls",
+        )
+        await gateway.aclose()
+
+    async def check_refresh_endpoint(self, concurrency: int) -> None:
+        from main import app
+
+        fake = FakeSupabase()
+        app_gateway = auth_router.auth_gateway
+        auth_router.auth_gateway = self.gateway(fake)
+        try:
+            transport = httpx.ASGITransport(app=app, client=("203.0.113.50", 40000))
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                responses = await asyncio.gather(
+                    *(
+                        client.post("/api/auth/refresh", json={"refresh_token": "valid-endpoint"})
+                        for _ in range(concurrency)
+                    )
+                )
+                upstream_calls = fake.calls["POST /token refresh_token"]
+                rejected = await client.post("/api/auth/refresh", json={"refresh_token": "revoked-endpoint"})
+        finally:
+            await auth_router.auth_gateway.aclose()
+            auth_router.auth_gateway = app_gateway
+        statuses = Counter(response.status_code for response in responses)
+        self.check(
+            "concurrent /refresh requests make one upstream call",
+            statuses == {200: concurrency} and upstream_calls == 1,
+            f"{dict(statuses)}, {upstream_calls} upstream call for {concurrency} requests",
+        )
+        self.check("rejected refresh answered 401", rejected.status_code == 401, rejected.text)
+
+    async def run(self, concurrency: int) -> None:
+        await self.check_parsing()
+        await self.check_error_mapping()
+        await self.check_timeouts()
+        await self.check_single_flight(concurrency)
+        await self.check_refresh_endpoint(concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent refreshes sharing a token")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    checker = Checker()
+    asyncio.run(checker.run(args.concurrency))
+    sys.exit(1 if checker.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
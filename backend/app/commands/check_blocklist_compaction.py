@@ -0,0 +1,110 @@
+"""
+Check that blocklist compaction never changes which URLs are blocked.
+
+Generates random blocklists over a small alphabet, so that overlaps, case variants and redundant wildcards are
+common, together with URLs built from the patterns themselves (to hit matches and near misses) and random URLs.
+For every blocklist it checks these properties:
+
+- the compacted list blocks exactly the URLs the full list blocks;
+- every dropped pattern's cover blocks every URL the dropped pattern blocks;
+- each normalized pattern blocks exactly the URLs its original does;
+- compacting the compacted list changes nothing.
+
+Exits non-zero on the first counterexample, printing it.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.check_blocklist_compaction [--cases 2000] [--seed 1]
+"""
+
+import argparse
+import random
+import sys
+
+from routes.user.blocklist_compaction import compact_patterns
+from routes.user.blocklist_compaction import normalize_pattern
+from routes.user.url_matcher import PatternMatcher
+
+ALPHABET = ["a", "b", "A", "B", ".", "/", "*", "*", "?", "?", "com", "Com"]
+URL_ALPHABET = "abAB./c"
+
+
+def random_pattern(rng: random.Random) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 6)))
+
+
+def random_text(rng: random.Random, max_length: int) -> str:
+    return "".join(rng.choice(URL_ALPHABET) for _ in range(rng.randint(0, max_length)))
+
+
+def witness(pattern: str, rng: random.Random) -> str:
+    """A URL the pattern matches: wildcards filled in at random, letters in random case, text around it."""
+    body = []
+    for c in pattern:
+        if c == "*":
+            body.append(random_text(rng, 3))
+        elif c == "?":
+            body.append(rng.choice(URL_ALPHABET))
+        else:
+            body.append(c.upper() if rng.random() < 0.5 else c.lower())
+    return random_text(rng, 2) + "".join(body) + random_text(rng, 2)
+
+
+def near_miss(pattern: str, rng: random.Random) -> str:
+    """A witness with one character dropped or replaced, which the pattern often no longer matches."""
+    url = witness(pattern, rng)
+    if not url:
+        return url
+    position = rng.randrange(len(url))
+    return url[:position] + rng.choice(["", rng.choice(URL_ALPHABET)]) + url[position + 1 :]
+
+
+def check(patterns: list[str], rng: random.Random) -> str | None:
+    """Run every property on one blocklist; returns a description of the first violation, if any."""
+    kept, covered_by = compact_patterns(patterns)
+    urls = [random_text(rng, 8) for _ in range(20)]
+    for pattern in patterns:
+        urls.extend(witness(pattern, rng) for _ in range(3))
+        urls.extend(near_miss(pattern, rng) for _ in range(3))
+
+    full, compacted = PatternMatcher(patterns), PatternMatcher(kept)
+    for url in urls:
+        if (full.match(url) is None) != (compacted.match(url) is None):
+            return f"{url!r} is blocked by {full.match(url)!r} but compacted to {compacted.match(url)!r}"
+    for pattern, cover in covered_by.items():
+        single, covering = PatternMatcher([pattern]), PatternMatcher([cover])
+        for url in urls:
+            if single.match(url) is not None and covering.match(url) is None:
+                return f"{pattern!r} was dropped for {cover!r}, which does not block {url!r}"
+    for pattern in patterns:
+        normalized = normalize_pattern(pattern)
+        if normalized is None:
+            continue
+        original, canonical = PatternMatcher([pattern]), PatternMatcher([normalized])
+        for url in urls:
+            if (original.match(url) is None) != (canonical.match(url) is None):
+                return f"{pattern!r} normalizes to {normalized!r}, which disagrees on {url!r}"
+    if compact_patterns(kept)[0] != kept:
+        return f"compacting {kept!r} again gives {compact_patterns(kept)[0]!r}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=2000, help="number of random blocklists")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    dropped = 0
+    for case in range(args.cases):
+        patterns = list(dict.fromkeys(random_pattern(rng) for _ in range(rng.randint(1, 8))))
+        failure = check(patterns, rng)
+        if failure is not None:
+            print(f"case {case}: blocklist {patterns!r}: {failure}")
+            sys.exit(1)
+        dropped += len(compact_patterns(patterns)[1])
+    print(f"{args.cases} blocklists checked, {dropped} redundant patterns dropped, no behaviour change")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Check the blocking history upload codec, without a database.
+
+Decodes uploads in each format and encoding, and malformed ones, and checks that:
+
+- JSON and columnar uploads round-trip, identity, gzip or zstd encoded;
+- corrupt and truncated gzip bodies, and corrupt zstd bodies, are rejected with 400;
+- bodies decompressing past the size limit are rejected with 413;
+- unsupported encodings and content types are rejected with 415;
+- columnar uploads with mismatched columns or unknown indexes are rejected with 400.
+
+Exits non-zero if any check fails.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.check_history_codec
+"""
+
+import gzip
+import logging
+import sys
+from datetime import datetime
+from datetime import timedelta
+
+from routes.user.api import BlockingHistoryRecord
+from routes.user.api import BlockingHistoryRequest
+from routes.user.history_codec import COLUMNAR_CONTENT_TYPE
+from routes.user.history_codec import JSON_CONTENT_TYPE
+from routes.user.history_codec import HistoryUploadError
+from routes.user.history_codec import decompress
+from routes.user.history_codec import encode_columnar
+from routes.user.history_codec import get_zstandard
+from routes.user.history_codec import parse_history_upload
+
+LIMIT = 64 * 1024
+
+
+class Checker:
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, name: str, ok: bool, detail: str = "") -> None:
+        self.failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {name}" + (f": {detail}" if detail else ""))
+
+    def rejected(self, name: str, status_code: int, decode) -> None:
+        try:
+            decode()
+        except HistoryUploadError as e:
+            self.check(name, e.status_code == status_code, f"{e.status_code} {e.message}")
+            return
+        except Exception as e:
+            self.check(name, False, f"raised {type(e).__name__}: {e}")
+            return
+        self.check(name, False, "accepted")
+
+    def run(self) -> None:
+        zstandard = get_zstandard()
+        start = datetime(2026, 1, 1)
+        records = [
+            BlockingHistoryRecord(
+                url=f"https://site{i % 7}.example.com/page/{i}",
+                pattern=f"site{i % 7}.example.com",
+                timestamp=start + timedelta(seconds=i),
+            )
+            for i in range(500)
+        ]
+        expected = [(r.url, r.pattern, r.timestamp) for r in records]
+        bodies = {
+            JSON_CONTENT_TYPE: BlockingHistoryRequest(blocking_history=records).model_dump_json().encode(),
+            COLUMNAR_CONTENT_TYPE: encode_columnar(records).model_dump_json().encode(),
+        }
+        encoders = {
+            "identity": lambda body: body,
+            "gzip": gzip.compress,
+            "zstd": zstandard.ZstdCompressor().compress,
+        }
+        for content_type, body in bodies.items():
+            for encoding, encode in encoders.items():
+                decoded = parse_history_upload(encode(body), content_type, encoding)
+                self.check(
+                    f"{content_type} {encoding} round trip",
+                    [(r.url, r.pattern, r.timestamp) for r in decoded] == expected,
+                    f"{len(body)} bytes, {len(decoded)} records",
+                )
+
+        body = bodies[JSON_CONTENT_TYPE]
+        self.rejected("corrupt gzip body", 400, lambda: decompress(b"\x1f\x8b\x08\x00garbage-body", "gzip"))
+        self.rejected("truncated gzip body", 400, lambda: decompress(gzip.compress(body)[:-100], "gzip"))
+        self.rejected("corrupt zstd body", 400, lambda: decompress(b"\x28\xb5\x2f\xfd\x00garbage-body", "zstd"))
+        self.rejected("not a zstd body", 400, lambda: decompress(b"plain text", "zstd"))
+
+        bomb = b"[" + b" " * (LIMIT * 4) + b"]"
+        self.rejected("oversized gzip body", 413, lambda: decompress(gzip.compress(bomb), "gzip", LIMIT))
+        self.rejected(
+            "oversized zstd body", 413, lambda: decompress(zstandard.ZstdCompressor().compress(bomb), "zstd", LIMIT)
+        )
+        self.rejected("unsupported encoding", 415, lambda: decompress(body, "br"))
+        self.rejected("unsupported content type", 415, lambda: parse_history_upload(body, "text/csv", "identity"))
+
+        columnar = encode_columnar(records[:3])
+        mismatched = columnar.model_copy(update={"url_suffixes": columnar.url_suffixes[:2]})
+        self.rejected(
+            "columnar columns of different lengths",
+            400,
+            lambda: parse_history_upload(mismatched.model_dump_json().encode(), COLUMNAR_CONTENT_TYPE, "identity"),
+        )
+        unknown = columnar.model_copy(update={"pattern_ids": [0, 0, 5]})
+        self.rejected(
+            "columnar unknown pattern index",
+            400,
+            lambda: parse_history_upload(unknown.model_dump_json().encode(), COLUMNAR_CONTENT_TYPE, "identity"),
+        )
+
+
+def main():
+    logging.disable(logging.WARNING)
+    checker = Checker()
+    checker.run()
+    sys.exit(1 if checker.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Check blocking_history's partitioning against a real Postgres.
+
+Migrates an empty scratch schema to just before the partitioning migration, seeds history, then checks that:
+
+- migration 0006 keeps every row and its id, puts rows in their month's partition and ones older than its window in
+  the default partition, and new rows still get fresh ids;
+- it downgrades to an unpartitioned table without losing rows, and upgrades again to head;
+- create_partition moves a month's rows out of the default partition into the new partition;
+- expire_history archives the history it removes, detaches or drops the expired partitions, deletes expired rows
+  from the default partition, and bumps the history version of exactly the users who lost history.
+
+Exits non-zero if any check fails.
+
+Usage (from the backend directory, against a development database):
+    PYTHONPATH=app python -m commands.check_history_partitions [--keep]
+"""
+
+import argparse
+import logging
+import sys
+from datetime import UTC
+from datetime import date
+from datetime import datetime
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import text
+
+from commands.scratch import scratch_schema
+from database.manager import engine
+from database.partitions import DEFAULT_PARTITION
+from database.partitions import PARENT_TABLE
+from database.partitions import add_months
+from database.partitions import create_partitions
+from database.partitions import expire_history
+from database.partitions import list_partitions
+from database.partitions import partition_name
+
+SCHEMA = "history_partition_check"
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+CURRENT = datetime.now(UTC).date().replace(day=1)
+# Migration 0006 partitions at most this many months back; older rows stay in the default partition.
+MIGRATION_MONTHS_BACK = 120
+ANCIENT = add_months(CURRENT, -MIGRATION_MONTHS_BACK - 12)
+# Past the months partitioned ahead, so it lands in the default partition until its partition is created.
+FUTURE = add_months(CURRENT, 24)
+
+# (user, month, rows) seeded before the partitioning migration.
+SEED = [
+    ("user-ancient", ANCIENT, 2),
+    ("user-detached", add_months(CURRENT, -3), 3),
+    ("user-dropped", add_months(CURRENT, -2), 4),
+    ("user-current", CURRENT, 5),
+]
+
+
+def migrate(config: Config, action, revision: str) -> None:
+    """Run an alembic command on the scratch schema; alembic manages the transactions, as 0004 needs autocommit."""
+    with engine.connect() as connection:
+        config.attributes["connection"] = connection
+        action(config, revision)
+
+
+def insert_history(user: str, month: date, rows: int) -> None:
+    start = datetime.combine(month, datetime.min.time())
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                f"INSERT INTO {PARENT_TABLE} (supabase_user_id, url, pattern, timestamp) "
+                "SELECT :user, 'https://example.com/' || r, 'pattern', :start + r * interval '1 hour' "
+                "FROM generate_series(1, :rows) r"
+            ),
+            {"user": user, "start": start, "rows": rows},
+        )
+
+
+def count(table: str, where: str = "true") -> int:
+    with engine.connect() as connection:
+        return connection.scalar(text(f"SELECT count(*) FROM {table} WHERE {where}"))
+
+
+def versions() -> dict[str, int]:
+    with engine.connect() as connection:
+        return dict(connection.execute(text("SELECT supabase_user_id, version FROM blocking_history_version")).all())
+
+
+def table_exists(name: str) -> bool:
+    with engine.connect() as connection:
+        return connection.scalar(text("SELECT to_regclass(:name)"), {"name": name}) is not None
+
+
+class Checker:
+    def __init__(self):
+        self.failures = 0
+        self.config = Config(str(BACKEND_DIR / "alembic.ini"))
+        self.config.set_main_option("script_location", str(BACKEND_DIR / "migrations"))
+
+    def check(self, name: str, ok: bool, detail: str = "") -> None:
+        self.failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {name}" + (f": {detail}" if detail else ""))
+
+    def check_migration(self) -> None:
+        migrate(self.config, command.upgrade, "0005")
+        for user, month, rows in SEED:
+            insert_history(user, month, rows)
+        with engine.connect() as connection:
+            before = connection.execute(text(f"SELECT id, timestamp FROM {PARENT_TABLE} ORDER BY id")).all()
+
+        migrate(self.config, command.upgrade, "0006")
+        with engine.connect() as connection:
+            after = connection.execute(text(f"SELECT id, timestamp FROM {PARENT_TABLE} ORDER BY id")).all()
+            months = list_partitions(connection)
+        self.check("0006 keeps every row and id", after == before, f"{len(before)} rows before, {len(after)} after")
+        self.check(
+            "0006 partitions from the oldest month within its window to 3 months ahead",
+            months
+            and months[0] == add_months(CURRENT, -MIGRATION_MONTHS_BACK)
+            and months[-1] == add_months(CURRENT, 3),
+            f"{months[0]} to {months[-1]}" if months else "no partitions",
+        )
+        misplaced = [
+            (user, month)
+            for user, month, rows in SEED
+            if count(DEFAULT_PARTITION if month == ANCIENT else partition_name(month), f"supabase_user_id = '{user}'")
+            != rows
+        ]
+        self.check("0006 places rows by month", not misplaced, f"misplaced: {misplaced}" if misplaced else "")
+
+        insert_history("user-new", CURRENT, 1)
+        with engine.connect() as connection:
+            new_id = connection.scalar(text(f"SELECT id FROM {PARENT_TABLE} WHERE supabase_user_id = 'user-new'"))
+        self.check("0006 keeps the id sequence", new_id > before[-1].id, f"new id {new_id}, last {before[-1].id}")
+
+        migrate(self.config, command.downgrade, "0005")
+        with engine.connect() as connection:
+            relkind = connection.scalar(
+                text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"), {"t": PARENT_TABLE}
+            )
+        total = count(PARENT_TABLE)
+        self.check(
+            "0006 downgrades to a plain table without losing rows",
+            relkind == "r" and total == len(before) + 1,
+            f"relkind {relkind}, {total} rows",
+        )
+        migrate(self.config, command.upgrade, "head")
+        self.check("upgrades again to head", count(PARENT_TABLE) == total, f"{count(PARENT_TABLE)} rows")
+
+    def check_create_partition(self) -> None:
+        insert_history("user-future", FUTURE, 6)
+        in_default = count(DEFAULT_PARTITION, "supabase_user_id = 'user-future'")
+        total = count(PARENT_TABLE)
+        created = create_partitions(engine, FUTURE, FUTURE)
+        self.check(
+            "create_partition moves the month's rows out of the default partition",
+            created == [partition_name(FUTURE)]
+            and in_default == 6
+            and count(DEFAULT_PARTITION, "supabase_user_id = 'user-future'") == 0
+            and count(partition_name(FUTURE)) == 6
+            and count(PARENT_TABLE) == total,
+            f"created {created}, {in_default} rows moved",
+        )
+
+    def check_expire_history(self) -> None:
+        with engine.connect() as connection:
+            months = list_partitions(connection)
+        detached = [partition_name(month) for month in months if month < add_months(CURRENT, -2)]
+        dropped = partition_name(add_months(CURRENT, -2))
+        before = versions()
+        total = count(PARENT_TABLE)
+        first = expire_history(engine, datetime.combine(add_months(CURRENT, -2), datetime.min.time()), True)
+        second = expire_history(engine, datetime.combine(add_months(CURRENT, -1), datetime.min.time()))
+        after = versions()
+        with engine.connect() as connection:
+            remaining = list_partitions(connection)
+        self.check(
+            "expired partitions detached or dropped",
+            first == detached
+            and second == [dropped]
+            and all(map(table_exists, detached))
+            and not table_exists(dropped)
+            and remaining[0] == add_months(CURRENT, -1),
+            f"{len(first)} detached, {second} dropped, oldest kept {remaining[0]}",
+        )
+        removed = sum(rows for user, month, rows in SEED if month < add_months(CURRENT, -1))
+        with engine.connect() as connection:
+            archived = connection.scalar(text("SELECT coalesce(sum(count), 0) FROM blocking_history_archive"))
+        self.check(
+            "expired history archived and removed",
+            count(PARENT_TABLE) == total - removed and archived == removed and count(DEFAULT_PARTITION) == 0,
+            f"{removed} rows removed, {archived} archived",
+        )
+        bumped = sorted(user for user in after if after[user] != before.get(user, 0))
+        expected = sorted(user for user, month, rows in SEED if month < add_months(CURRENT, -1))
+        self.check("history versions bumped for affected users only", bumped == expected, f"bumped {bumped}")
+
+    def run(self) -> None:
+        self.check_migration()
+        self.check_create_partition()
+        self.check_expire_history()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep", action="store_true", help=f"keep the {SCHEMA} schema for manual inspection")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    checker = Checker()
+    with scratch_schema(SCHEMA, keep=args.keep, create_tables=False):
+        checker.run()
+    engine.dispose()
+    sys.exit(1 if checker.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Check that the API's queries use indexes on a realistically sized dataset.
+
+Creates the tables in a scratch Postgres schema, seeds them, calls every user-facing endpoint once through the app
+while recording the SQL it sends, then runs EXPLAIN on each statement. Exits non-zero if a statement sequentially
+scans one of the per-user tables, so a query or index change that loses its index fails CI.
+
+Usage (from the backend directory, against a development database):
+    PYTHONPATH=app python -m commands.check_query_plans [--users 2000] [--rows-per-user 100] [--keep]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from datetime import date
+from datetime import timedelta
+from typing import Any
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy import text
+
+from database.manager import async_engine
+from database.manager import engine
+from database.partitions import DEFAULT_PARTITION
+from database.partitions import PARENT_TABLE
+from database.partitions import create_partitions
+from database.partitions import is_partition_table
+from commands.scratch import scratch_schema
+
+SCHEMA = "query_plan_check"
+USER_ID = "user-1"
+
+# Tables that grow with the number of users; a sequential scan over any of them is a regression.
+CHECKED_TABLES = {
+    "paying_user",
+    "blocked_pattern",
+    "blocklist_revision",
+    "blocking_history",
+    "blocking_history_version",
+    "blocking_stats_user",
+    "blocking_stats_daily",
+    "blocking_stats_pattern",
+}
+
+ENDPOINTS: list[tuple[str, str, dict[str, Any] | None]] = [
+    ("GET", "/api/auth/session", None),
+    ("GET", "/api/user/blocklist", None),
+    (
+        "POST",
+        "/api/user/blocklist/sync",
+        {
+            "patterns": [
+                {"pattern": "pattern-1", "created_at": "2024-01-01T00:00:00"},
+                {"pattern": "new-*", "created_at": "2030-01-01T00:00:00"},
+            ]
+        },
+    ),
+    (
+        "POST",
+        "/api/user/blocklist/delta",
+        {"since_revision": 1, "changes": [{"pattern": "pattern-2", "deleted": True}]},
+    ),
+    ("POST", "/api/user/blocklist/classify", {"urls": ["https://example.com/pattern-3/a", "https://example.org"]}),
+    ("GET", "/api/user/blocking_history", None),
+    ("GET", "/api/user/blocking_history/page?limit=50&since=2024-02-01T00:00:00Z", None),
+    ("GET", "/api/user/blocking_history/page?limit=50&cursor=MjAyNC0wMy0wMVQwMDowMDowMHwx", None),
+    ("GET", "/api/user/blocking_history/stream?until=2024-02-01T00:00:00Z", None),
+    (
+        "POST",
+        "/api/user/blocking_history",
+        {
+            "blocking_history": [
+                {"url": "https://example.com", "pattern": "pattern-1", "timestamp": "2030-01-01T00:00:00Z"}
+            ]
+        },
+    ),
+    ("GET", "/api/user/stats", None),
+]
+
+# Spacing of each seeded user's history rows, starting 2024-01-01.
+SEED_ROW_INTERVAL = timedelta(minutes=37)
+
+SEED_SQL = [
+    """
+    INSERT INTO paying_user (supabase_user_id, email, is_paying)
+    SELECT 'user-' || u, 'user-' || u || '@example.com', u % 2 = 0 FROM generate_series(1, :users) u
+    """,
+    """
+    INSERT INTO blocked_pattern (supabase_user_id, pattern, created_at, revision, deleted)
+    SELECT 'user-' || u, 'pattern-' || p, now(), 1, false
+    FROM generate_series(1, :users) u, generate_series(1, 20) p
+    """,
+    """
+    INSERT INTO blocklist_revision (supabase_user_id, revision)
+    SELECT 'user-' || u, 1 FROM generate_series(1, :users) u
+    """,
+    """
+    INSERT INTO blocking_history (supabase_user_id, url, pattern, timestamp)
+    SELECT 'user-' || u, 'https://example.com/' || r, 'pattern-' || (r % 20),
+        timestamp '2024-01-01' + r * :interval
+    FROM generate_series(1, :users) u, generate_series(1, :rows) r
+    """,
+    """
+    INSERT INTO blocking_history_version (supabase_user_id, version)
+    SELECT 'user-' || u, 1 FROM generate_series(1, :users) u
+    """,
+    """
+    INSERT INTO blocking_stats_user (supabase_user_id, total_tabs_blocked, last_blocked)
+    SELECT supabase_user_id, count(*), max(timestamp) FROM blocking_history GROUP BY 1
+    """,
+    """
+    INSERT INTO blocking_stats_daily (supabase_user_id, day, tabs_blocked)
+    SELECT supabase_user_id, date(timestamp), count(*) FROM blocking_history GROUP BY 1, 2
+    """,
+    """
+    INSERT INTO blocking_stats_pattern (supabase_user_id, pattern, count)
+    SELECT supabase_user_id, pattern, count(*) FROM blocking_history GROUP BY 1, 2
+    """,
+]
+
+
+def seed(users: int, rows_per_user: int) -> None:
+    """
+    Fill the scratch schema with synthetic data.
+
+    Args:
+        users (int): Number of users to create.
+        rows_per_user (int): Blocking history rows per user.
+    """
+    # Seeded history starts in January 2024; partition the months it spans, like migrations do for live data.
+    create_partitions(engine, date(2024, 1, 1), date(2024, 1, 1) + rows_per_user * SEED_ROW_INTERVAL)
+    with engine.begin() as connection:
+        for statement in SEED_SQL:
+            connection.execute(text(statement), {"users": users, "rows": rows_per_user, "interval": SEED_ROW_INTERVAL})
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("ANALYZE"))
+
+
+def capture_statements() -> list[tuple[str, Any]]:
+    """
+    Call every endpoint in `ENDPOINTS` as `USER_ID` and record the SQL sent to the database.
+
+    Returns:
+        list[tuple[str, Any]]: The statements and their parameters, in execution order.
+    """
+    import main
+    from routes.auth.api import UserResponse
+    from routes.auth.router import get_current_user
+
+    statements: list[tuple[str, Any]] = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    main.app.dependency_overrides[get_current_user] = lambda: UserResponse(
+        supabase_user_id=USER_ID, email=f"{USER_ID}@example.com"
+    )
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        with TestClient(main.app) as client:
+            for method, path, body in ENDPOINTS:
+                response = client.request(method, path, json=body)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{method} {path} failed with {response.status_code}: {response.text}")
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+        main.app.dependency_overrides.clear()
+    return statements
+
+
+def _plan_nodes(plan: dict[str, Any]):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+async def explain(statements: list[tuple[str, Any]]) -> list[tuple[str, list[str], list[str]]]:
+    """
+    EXPLAIN each recorded statement.
+
+    Args:
+        statements (list[tuple[str, Any]]): Statements and parameters as recorded by `capture_statements`.
+
+    Returns:
+        list[tuple[str, list[str], list[str]]]: Per statement: its SQL, a summary of every scan in the plan, and
+        the checked tables it scans sequentially.
+    """
+    results = []
+    async with async_engine.connect() as connection:
+        for statement, parameters in statements:
+            result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+            plan = result.scalar_one()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans, seq_scans = [], []
+            for node in _plan_nodes(plan[0]["Plan"]):
+                relation = node.get("Relation Name")
+                # The default partition stays empty while the monthly partitions are maintained, so it is
+                # rightly seq scanned; the monthly ones count as the partitioned table.
+                if relation is not None and is_partition_table(relation):
+                    relation = f"{PARENT_TABLE} ({relation})" if relation != DEFAULT_PARTITION else relation
+                if relation is None and "Index Name" not in node:
+                    continue
+                scans.append(
+                    node["Node Type"]
+                    + (f" on {relation}" if relation else "")
+                    + (f" using {node['Index Name']}" if "Index Name" in node else "")
+                )
+                if node["Node Type"] == "Seq Scan" and relation.split(" ")[0] in CHECKED_TABLES:
+                    seq_scans.append(relation)
+            results.append((statement, scans, seq_scans))
+        await connection.rollback()
+    await async_engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--users",
+        type=int,
+        default=2000,
+        help="number of synthetic users; below ~1000 the planner rightly seq scans the small per-user tables",
+    )
+    parser.add_argument("--rows-per-user", type=int, default=100, help="blocking history rows per user")
+    parser.add_argument("--keep", action="store_true", help=f"keep the {SCHEMA} schema for manual inspection")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with scratch_schema(SCHEMA, keep=args.keep):
+        seed(args.users, args.rows_per_user)
+        results = asyncio.run(explain(capture_statements()))
+
+    failures = 0
+    for statement, scans, seq_scans in results:
+        status = "FAIL" if seq_scans else "ok"
+        failures += bool(seq_scans)
+        print(f"[{status}] {' '.join(statement.split())[:110]}")
+        for scan in scans:
+            print(f"         {scan}")
+    print(f"{len(results)} statements checked, {failures} with sequential scans over {sorted(CHECKED_TABLES)}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
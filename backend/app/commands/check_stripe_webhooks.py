@@ -0,0 +1,270 @@
+"""
+Check the Stripe webhook pipeline end to end, without Stripe.
+
+Creates the tables in a scratch Postgres schema, posts webhook payloads signed with a local secret to the app, and
+processes them with a worker whose Stripe API is a stub. Checks that:
+
+- a payload with a bad signature is rejected and not stored;
+- a repeated delivery of an event is stored once;
+- the endpoint answers without calling the Stripe API, and how fast;
+- a customer's events are applied in the order Stripe created them, not the order they arrived in;
+- checkouts mirror the Stripe customer, whose later events then need no Stripe API call;
+- a failing event is retried, holding back the customer's later events, and marked failed once its attempts are
+  used up, after which the customer's later events are processed.
+
+Exits non-zero if any check fails.
+
+Usage (from the backend directory, against a development database):
+    PYTHONPATH=app python -m commands.check_stripe_webhooks [--events 200] [--keep]
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from commands.scratch import scratch_schema
+from database.manager import AsyncSessionLocal
+from database.models import PayingUser
+from database.models import StripeWebhookEvent
+from routes.stripe import router as stripe_router
+from routes.stripe.events import StripeEventWorker
+
+SCHEMA = "stripe_webhook_check"
+SECRET = "whsec_local_check"
+MAX_ATTEMPTS = 3
+CUSTOMERS = {
+    "cus_ordered": "ordered@example.com",
+    "cus_flaky": "flaky@example.com",
+    "cus_broken": "broken@example.com",
+    "cus_waiting": "waiting@example.com",
+}
+
+
+class StubStripe:
+    """Stands in for the Stripe SDK: customers from CUSTOMERS, and calls for chosen customers fail."""
+
+    def __init__(self):
+        self.calls: list[str] = []
+        self.failures: dict[str, int] = {}
+        self.Customer = SimpleNamespace(retrieve=self._retrieve_customer)
+        self.checkout = SimpleNamespace(Session=SimpleNamespace(retrieve=self._retrieve_session))
+
+    def _retrieve_customer(self, customer_id: str) -> dict[str, Any]:
+        self.calls.append(customer_id)
+        if self.failures.get(customer_id, 0):
+            self.failures[customer_id] -= 1
+            raise ConnectionError(f"stubbed outage for {customer_id}")
+        return {"id": customer_id, "email": CUSTOMERS[customer_id]}
+
+    def _retrieve_session(self, session_id: str) -> dict[str, Any]:
+        customer_id = session_id.removeprefix("cs_")
+        self.calls.append(customer_id)
+        return {"id": session_id, "customer_details": {"email": CUSTOMERS[customer_id]}}
+
+
+def sign(payload: str, timestamp: int | None = None) -> str:
+    """A Stripe-Signature header for the payload, as Stripe computes it."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def stripe_event(event_id: str, event_type: str, created: int, data: dict[str, Any]) -> str:
+    return json.dumps(
+        {"id": event_id, "object": "event", "type": event_type, "created": created, "data": {"object": data}}
+    )
+
+
+def checkout_event(event_id: str, created: int, customer_id: str) -> str:
+    session = {
+        "id": f"cs_{customer_id}",
+        "customer": customer_id,
+        "subscription": f"sub_{customer_id.removeprefix('cus_')}",
+        "customer_details": {"email": CUSTOMERS[customer_id]},
+    }
+    return stripe_event(event_id, "checkout.session.completed", created, session)
+
+
+class Checker:
+    def __init__(self, client: TestClient, stub: StubStripe, worker: StripeEventWorker):
+        self.client = client
+        self.stub = stub
+        self.worker = worker
+        self.failures = 0
+
+    def check(self, name: str, ok: bool, detail: str = "") -> None:
+        self.failures += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {name}" + (f": {detail}" if detail else ""))
+
+    def post(self, payload: str, signature: str | None = None) -> dict[str, Any]:
+        headers = {"stripe-signature": signature or sign(payload), "content-type": "application/json"}
+        return self.client.post("/api/stripe/webhook", content=payload, headers=headers).json()
+
+    def drain(self) -> int:
+        return self.client.portal.call(self.worker.drain)
+
+    def query(self, statement) -> list[Any]:
+        async def run():
+            async with AsyncSessionLocal() as db:
+                return list((await db.execute(statement)).all())
+
+        return self.client.portal.call(run)
+
+    def seed_legacy_users(self, *customer_ids: str) -> None:
+        async def run():
+            async with AsyncSessionLocal() as db:
+                db.add_all(PayingUser(email=CUSTOMERS[customer_id], is_paying=True) for customer_id in customer_ids)
+                await db.commit()
+
+        self.client.portal.call(run)
+
+    def is_paying(self, customer_id: str) -> bool | None:
+        rows = self.query(select(PayingUser.is_paying).where(PayingUser.email == CUSTOMERS[customer_id]))
+        return rows[0][0] if rows else None
+
+    def run(self, events: int) -> None:
+        now = int(time.time())
+
+        payload = stripe_event("evt_forged", "charge.refunded", now, {"customer": "cus_ordered"})
+        response = self.post(payload, sign(payload).replace("v1=", "v1=0"))
+        stored = self.query(select(StripeWebhookEvent.id).where(StripeWebhookEvent.id == "evt_forged"))
+        self.check("bad signature rejected", response == {"error": "Invalid signature"} and not stored, str(response))
+
+        # The checkout arrives last, twice, but was created first.
+        deliveries = [
+            stripe_event(
+                "evt_cancel",
+                "customer.subscription.deleted",
+                now + 2,
+                {"id": "sub_ordered", "customer": "cus_ordered", "status": "canceled"},
+            ),
+            stripe_event(
+                "evt_update",
+                "customer.subscription.updated",
+                now + 1,
+                {"id": "sub_ordered", "customer": "cus_ordered", "status": "active"},
+            ),
+            checkout_event("evt_checkout", now, "cus_ordered"),
+        ]
+        deliveries.append(deliveries[-1])
+        responses = [self.post(payload) for payload in deliveries]
+        stored = self.query(select(StripeWebhookEvent.id))
+        self.check(
+            "repeated delivery stored once",
+            all(r == {"success": True} for r in responses) and len(stored) == 3,
+            f"{len(stored)} events stored",
+        )
+
+        timings = []
+        for i in range(events):
+            payload = stripe_event(f"evt_load_{i}", "customer.created", now, {"id": f"cus_load_{i}"})
+            started = time.perf_counter()
+            self.post(payload)
+            timings.append((time.perf_counter() - started) * 1000)
+        self.check(
+            "acknowledged without calling Stripe",
+            not self.stub.calls,
+            f"{events} events, median {statistics.median(timings):.1f} ms, "
+            f"p99 {sorted(timings)[int(len(timings) * 0.99)]:.1f} ms (through the test client)",
+        )
+
+        self.drain()
+        mirrored = self.query(
+            select(
+                PayingUser.stripe_customer_id, PayingUser.stripe_subscription_id, PayingUser.subscription_status
+            ).where(PayingUser.email == CUSTOMERS["cus_ordered"])
+        )
+        self.check(
+            "customer's events applied in creation order",
+            self.is_paying("cus_ordered") is False,
+            f"is_paying={self.is_paying('cus_ordered')} after checkout, update, cancellation",
+        )
+        self.check(
+            "customer mirrored and resolved without calling Stripe",
+            not self.stub.calls and mirrored == [("cus_ordered", "sub_ordered", "canceled")],
+            f"{mirrored}, {len(self.stub.calls)} API calls",
+        )
+
+        # Users who paid before customers were mirrored are looked up through the Stripe API, which the stub fails.
+        self.seed_legacy_users("cus_flaky", "cus_broken", "cus_waiting")
+        self.stub.failures = {"cus_flaky": 1, "cus_broken": MAX_ATTEMPTS}
+        for customer_id in ("cus_flaky", "cus_broken"):
+            self.post(stripe_event(f"evt_refund_{customer_id}", "charge.refunded", now, {"customer": customer_id}))
+        self.drain()
+        statuses = dict(self.query(select(StripeWebhookEvent.id, StripeWebhookEvent.status)))
+        attempts = dict(self.query(select(StripeWebhookEvent.id, StripeWebhookEvent.attempts)))
+        self.check(
+            "failing event retried",
+            statuses["evt_refund_cus_flaky"] == "processed" and attempts["evt_refund_cus_flaky"] == 2,
+            f"{attempts['evt_refund_cus_flaky']} attempts, {statuses['evt_refund_cus_flaky']}",
+        )
+        self.check(
+            "event given up after its attempts",
+            statuses["evt_refund_cus_broken"] == "failed" and attempts["evt_refund_cus_broken"] == MAX_ATTEMPTS,
+            f"{attempts['evt_refund_cus_broken']} attempts, {statuses['evt_refund_cus_broken']}",
+        )
+
+        self.stub.failures = {"cus_waiting": 1}
+        self.post(stripe_event("evt_fail_first", "invoice.payment_failed", now + 5, {"customer": "cus_waiting"}))
+        self.post(
+            stripe_event(
+                "evt_then_update",
+                "customer.subscription.updated",
+                now + 6,
+                {"id": "sub_waiting", "customer": "cus_waiting", "status": "active"},
+            )
+        )
+        self.worker.retry_base_seconds = self.worker.retry_max_seconds = 3600
+        self.drain()
+        statuses = dict(self.query(select(StripeWebhookEvent.id, StripeWebhookEvent.status)))
+        self.check(
+            "later events wait for a retry",
+            statuses["evt_fail_first"] == "pending" and statuses["evt_then_update"] == "pending",
+            f"{statuses['evt_fail_first']}, {statuses['evt_then_update']}",
+        )
+        self.post(stripe_event("evt_after_failure", "charge.refunded", now + 7, {"customer": "cus_broken"}))
+        self.drain()
+        statuses = dict(self.query(select(StripeWebhookEvent.id, StripeWebhookEvent.status)))
+        self.check(
+            "failed event does not block the customer",
+            statuses["evt_after_failure"] == "processed",
+            statuses["evt_after_failure"],
+        )
+        print(f"worker: {self.worker.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200, help="events posted to time the endpoint")
+    parser.add_argument("--keep", action="store_true", help=f"keep the {SCHEMA} schema for manual inspection")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    import main as app_main
+
+    stub = StubStripe()
+    worker = StripeEventWorker(
+        poll_interval=1, max_attempts=MAX_ATTEMPTS, retry_base_seconds=0, retry_max_seconds=0, stripe_api=stub
+    )
+    # The app's own worker would race the checks' worker for events.
+    app_main.STRIPE_EVENT_WORKER = False
+    stripe_router.STRIPE_WEBHOOK_SECRET = SECRET
+    with scratch_schema(SCHEMA, keep=args.keep):
+        with TestClient(app_main.app) as client:
+            checker = Checker(client, stub, worker)
+            checker.run(args.events)
+    sys.exit(1 if checker.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
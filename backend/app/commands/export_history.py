@@ -0,0 +1,70 @@
+"""
+Export blocking history to a file, for support requests and offline analysis.
+
+Streams one user's history, or every user's with a supabase_user_id column, straight out of Postgres with COPY, so
+memory use stays flat however many rows are exported. CSV and NDJSON are compressed when --compression is given or
+the output name ends in .gz or .zst; Parquet files are always compressed internally.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.export_history --output history.csv.gz [--user ID] [--format csv]
+        [--since 2024-01-01T00:00:00Z] [--until 2024-02-01T00:00:00Z] [--compression gzip|zstd]
+    PYTHONPATH=app python -m commands.export_history --output - --user ID --format ndjson | head
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from datetime import datetime
+from typing import BinaryIO
+
+from database.manager import async_engine
+from routes.user.history_export import EXPORT_ENCODINGS
+from routes.user.history_export import EXPORT_MEDIA_TYPES
+from routes.user.history_export import export_history
+
+SUFFIX_ENCODINGS = {".gz": "gzip", ".zst": "zstd"}
+
+
+async def export(args: argparse.Namespace, output: BinaryIO) -> int:
+    start = time.perf_counter()
+    written = 0
+    try:
+        async for chunk in export_history(args.format, args.user, args.since, args.until, args.compression):
+            output.write(chunk)
+            written += len(chunk)
+    finally:
+        await async_engine.dispose()
+    output.flush()
+    elapsed = time.perf_counter() - start
+    print(
+        f"Exported {written / 1e6:.1f} MB of {args.format} in {elapsed:.2f} s ({written / 1e6 / elapsed:.1f} MB/s)",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="file to write, or - for stdout")
+    parser.add_argument("--user", help="only this Supabase user id; all users by default")
+    parser.add_argument("--format", choices=list(EXPORT_MEDIA_TYPES), default="csv")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="only entries at or after this time")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="only entries before this time")
+    parser.add_argument("--compression", choices=EXPORT_ENCODINGS, help="defaults to the output's .gz or .zst suffix")
+    args = parser.parse_args()
+    if args.compression is None and args.format != "parquet":
+        args.compression = next(
+            (encoding for suffix, encoding in SUFFIX_ENCODINGS.items() if args.output.endswith(suffix)), None
+        )
+    logging.disable(logging.INFO)
+
+    if args.output == "-":
+        sys.exit(asyncio.run(export(args, sys.stdout.buffer)))
+    with open(args.output, "wb") as output:
+        sys.exit(asyncio.run(export(args, output)))
+
+
+if __name__ == "__main__":
+    main()
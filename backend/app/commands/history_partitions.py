@@ -0,0 +1,73 @@
+"""
+Maintain the monthly partitions of blocking_history.
+
+`status` lists the partitions and how many rows each one and the default partition hold. `maintain` creates the
+partitions for the current month and the months ahead, then, if a retention period is set, archives history older
+than it into blocking_history_archive and detaches and drops the expired partitions. Run `maintain` at least monthly,
+e.g. from cron; it does nothing when everything is in place.
+
+The retention period is always the app's HISTORY_RETENTION_MONTHS, so run the command with the app's environment.
+Uploads older than the period are dropped on ingest; had the command expired more than that, re-uploaded history
+would be stored, and counted by the stats rollups, a second time.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.history_partitions status
+    PYTHONPATH=app python -m commands.history_partitions maintain [--months-ahead 3] [--detach]
+"""
+
+import argparse
+import logging
+import sys
+from datetime import UTC
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database.manager import engine
+from database.partitions import DEFAULT_PARTITION
+from database.partitions import HISTORY_PARTITION_MONTHS_AHEAD
+from database.partitions import add_months
+from database.partitions import create_partitions
+from database.partitions import expire_history
+from database.partitions import list_partitions
+from database.partitions import partition_name
+from database.partitions import retention_cutoff
+
+
+def status() -> int:
+    with engine.connect() as connection:
+        names = [partition_name(month) for month in list_partitions(connection)] + [DEFAULT_PARTITION]
+        for name in names:
+            print(f"{name:32} {connection.scalar(text(f'SELECT count(*) FROM {name}')):>12} rows")
+    return 0
+
+
+def maintain(months_ahead: int, detach: bool) -> int:
+    today = datetime.now(UTC).date()
+    for name in create_partitions(engine, today, add_months(today, months_ahead)):
+        print(f"Created {name}")
+    cutoff = retention_cutoff(today)
+    if cutoff is not None:
+        for name in expire_history(engine, cutoff, keep_detached=detach):
+            print(f"{'Detached' if detach else 'Dropped'} {name}")
+        print(f"History before {cutoff:%Y-%m-%d} archived")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("action", choices=["status", "maintain"])
+    parser.add_argument("--months-ahead", type=int, default=HISTORY_PARTITION_MONTHS_AHEAD)
+    parser.add_argument("--detach", action="store_true", help="keep expired partitions as standalone tables")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    try:
+        if args.action == "status":
+            sys.exit(status())
+        sys.exit(maintain(args.months_ahead, args.detach))
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Throwaway copy of the schema for commands that seed synthetic data or migrate from scratch.
+
+`scratch_schema(name)` drops any schema called `name`, creates it empty and, unless told not to, creates the
+models' tables in it (blocking_history with its default partition, but no monthly partitions). It then makes both
+`engine` and `async_engine` set `search_path` to that schema alone on every new connection, so unqualified table
+names in app code, migrations and raw SQL all resolve to the scratch copy; `public` is not on the path.
+
+Only connections opened after entering are affected, so enter it before anything touches the database. On exit,
+normally or through an exception, the schema is dropped with everything in it unless `keep` is set. The engines
+keep pointing at it for the rest of the process, so a command uses one scratch schema and exits afterwards.
+"""
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy import text
+
+from database.manager import async_engine
+from database.manager import engine
+from database.models import Base
+
+
+@contextmanager
+def scratch_schema(name: str, keep: bool = False, create_tables: bool = True) -> Iterator[None]:
+    """
+    Point both database engines at a freshly created schema.
+
+    Every connection opened by `engine` or `async_engine` gets `search_path` set to the schema, so app code runs
+    unchanged against it. Must be entered before either engine opens its first connection.
+
+    Args:
+        name (str): The schema name. An existing schema of that name is dropped.
+        keep (bool): Leave the schema in place on exit, for manual inspection.
+        create_tables (bool): Create the models' tables in it; without, it starts empty, e.g. for migrations.
+    """
+
+    def use_schema(dbapi_connection, connection_record) -> None:
+        autocommit = dbapi_connection.autocommit
+        dbapi_connection.autocommit = True
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"SET SESSION search_path TO {name}")
+        cursor.close()
+        dbapi_connection.autocommit = autocommit
+
+    event.listen(engine, "connect", use_schema)
+    event.listen(async_engine.sync_engine, "connect", use_schema)
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {name} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {name}"))
+        if create_tables:
+            Base.metadata.create_all(connection)
+    try:
+        yield
+    finally:
+        if not keep:
+            with engine.begin() as connection:
+                connection.execute(text(f"DROP SCHEMA IF EXISTS {name} CASCADE"))
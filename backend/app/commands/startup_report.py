@@ -0,0 +1,116 @@
+"""
+Report how long a worker takes to import the app and run its lifespan start-up.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.startup_report [--top 15] [--skip-lifespan]
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# Runs in a fresh interpreter so nothing is already imported or cached.
+_PROBE = """
+import asyncio, json, resource, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+lifespan_seconds = None
+if {run_lifespan}:
+    async def run():
+        async with main.lifespan(main.app):
+            pass
+    lifespan_start = time.perf_counter()
+    asyncio.run(run())
+    lifespan_seconds = time.perf_counter() - lifespan_start
+print(json.dumps({{
+    "import_seconds": imported - start,
+    "lifespan_seconds": lifespan_seconds,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+
+def import_times(top: int) -> tuple[float, list[tuple[str, float]]]:
+    """
+    Profile `import main` with `python -X importtime`.
+
+    Args:
+        top (int): How many of the slowest direct dependencies to return.
+
+    Returns:
+        tuple[float, list[tuple[str, float]]]: Total import seconds, and the slowest modules imported directly by
+        `main` or its first-party packages with their cumulative seconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0.0
+    modules: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        cumulative = int(match.group(2)) / 1_000_000
+        depth = len(match.group(3)) // 2
+        name = match.group(4)
+        if name == "main":
+            total = cumulative
+        elif depth == 1:
+            top_level = name.split(".")[0]
+            modules[top_level] = max(modules.get(top_level, 0.0), cumulative)
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]
+    return total, slowest
+
+
+def startup_times(run_lifespan: bool) -> dict[str, float | None]:
+    """
+    Time app import and lifespan start-up in a fresh interpreter.
+
+    Args:
+        run_lifespan (bool): Whether to also run the lifespan hook, which needs the configured services.
+
+    Returns:
+        dict[str, float | None]: Import and lifespan seconds, and the probe's peak RSS in MB.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(run_lifespan=run_lifespan)],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument("--skip-lifespan", action="store_true", help="only measure imports")
+    args = parser.parse_args()
+
+    total, slowest = import_times(args.top)
+    print(f"import main: {total * 1000:.1f} ms (python -X importtime)")
+    for name, seconds in slowest:
+        print(f"  {name:<30} {seconds * 1000:8.1f} ms")
+
+    timings = startup_times(not args.skip_lifespan)
+    print(f"import (wall clock): {timings['import_seconds'] * 1000:.1f} ms")
+    if timings["lifespan_seconds"] is not None:
+        print(f"lifespan start-up:   {timings['lifespan_seconds'] * 1000:.1f} ms")
+    print(f"peak RSS:            {timings['max_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
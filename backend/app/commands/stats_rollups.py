@@ -0,0 +1,63 @@
+"""
+Rebuild or verify the stats rollups behind /api/user/stats.
+
+`check` compares every rollup row with the same aggregate computed from blocking_history, plus the archived counts
+of history removed by retention, and exits non-zero on any difference. `rebuild` recomputes the rollups from the
+same sources; uploads wait for it to commit.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.stats_rollups check [--user ID] [--limit 100]
+    PYTHONPATH=app python -m commands.stats_rollups rebuild [--user ID]
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from database.manager import AsyncSessionLocal
+from database.manager import async_engine
+from routes.user.stats_rollups import find_rollup_mismatches
+from routes.user.stats_rollups import rebuild_rollups
+
+
+async def check(user: str | None, limit: int) -> int:
+    async with AsyncSessionLocal() as db:
+        mismatches = await find_rollup_mismatches(db, user, limit)
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f"{len(mismatches)} mismatched rollup rows")
+    return 1 if mismatches else 0
+
+
+async def rebuild(user: str | None) -> int:
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        await rebuild_rollups(db, user)
+        await db.commit()
+    print(f"Rebuilt rollups for {user or 'all users'} in {time.perf_counter() - start:.2f} s")
+    return 0
+
+
+async def run(args: argparse.Namespace) -> int:
+    try:
+        if args.action == "check":
+            return await check(args.user, args.limit)
+        return await rebuild(args.user)
+    finally:
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("action", choices=["check", "rebuild"])
+    parser.add_argument("--user", help="only this Supabase user id")
+    parser.add_argument("--limit", type=int, default=100, help="maximum mismatches reported per rollup table")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Handle received Stripe webhook events, or report how many are waiting.
+
+The webhook endpoint only stores events; `run` applies them in the background until stopped with SIGINT or SIGTERM,
+retrying failures with backoff. Run one per deployment, e.g. as its own container next to the web workers; the web
+workers handle events themselves only with STRIPE_EVENT_WORKER=true. Set ENTITLEMENT_NOTIFY_CHANNEL as for the app,
+so its workers drop cached paying statuses the events change. `status` prints the backlog.
+
+Usage (from the backend directory):
+    PYTHONPATH=app python -m commands.stripe_events run
+    PYTHONPATH=app python -m commands.stripe_events status
+"""
+
+import argparse
+import asyncio
+import signal
+import sys
+
+from database.manager import AsyncSessionLocal
+from database.manager import dispose_engines
+from logging_config import configure_logging
+from routes.stripe.events import event_backlog
+from routes.stripe.events import stripe_event_worker
+
+
+async def run() -> int:
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    await stripe_event_worker.start()
+    await stopped.wait()
+    # Finishes the event being handled; the rest stay pending for the next run.
+    await stripe_event_worker.stop()
+    print(stripe_event_worker.stats())
+    return 0
+
+
+async def status() -> int:
+    async with AsyncSessionLocal() as db:
+        backlog = await event_backlog(db)
+    print(f"{backlog['pending']} pending events, oldest received {backlog['oldest_pending_seconds']:.0f} s ago")
+    return 0
+
+
+async def main_async(action: str) -> int:
+    try:
+        return await (run() if action == "run" else status())
+    finally:
+        await dispose_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("action", choices=["run", "status"])
+    args = parser.parse_args()
+    configure_logging()
+    sys.exit(asyncio.run(main_async(args.action)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,22 @@
 import os
+from typing import Any
+from typing import AsyncIterator
+from typing import Iterator
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.pool import QueuePool
 
 from database.models import Base
+from database.pool_metrics import PoolMetrics
 
 load_dotenv()
 
@@ -12,11 +24,76 @@ POSTGRES_DATABASE_URL = os.environ.get("POSTGRES_DATABASE_URL")
 if POSTGRES_DATABASE_URL is None:
     raise ValueError("POSTGRES_DATABASE_URL environment variable is not set")
 
-engine = create_engine(POSTGRES_DATABASE_URL)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_SECONDS = float(os.environ.get("DB_POOL_TIMEOUT_SECONDS", "30"))
+# Connections older than this are replaced on checkout; -1 disables recycling.
+DB_POOL_RECYCLE_SECONDS = int(os.environ.get("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Server-side per-statement timeout; 0 disables it.
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Schema changes are applied with `alembic upgrade head`; create_all on startup is only a development shortcut.
+DB_INIT_ON_STARTUP = os.environ.get("DB_INIT_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+
+def to_async_url(database_url: str) -> URL:
+    """
+    Convert a synchronous Postgres URL into its asyncpg equivalent.
+
+    Args:
+        database_url (str): A `postgres://`, `postgresql://` or `postgresql+psycopg2://` URL.
+
+    Returns:
+        URL: The same database addressed through the asyncpg driver.
+    """
+    url = make_url(database_url.replace("postgres://", "postgresql://", 1)).set(drivername="postgresql+asyncpg")
+    # asyncpg does not understand libpq's `sslmode`, it takes the same values through `ssl`.
+    sslmode = url.query.get("sslmode")
+    if sslmode is not None:
+        url = url.difference_update_query(["sslmode"]).update_query_dict({"ssl": sslmode})
+    return url
+
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+    "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+sync_pool_metrics = PoolMetrics("sync")
+async_pool_metrics = PoolMetrics("async")
+
+# Synchronous engine, kept for scripts and offline tooling.
+engine = create_engine(
+    POSTGRES_DATABASE_URL,
+    poolclass=sync_pool_metrics.pool_class(QueuePool),
+    connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"} if DB_STATEMENT_TIMEOUT_MS else {},
+    **POOL_OPTIONS,
+)
+sync_pool_metrics.attach(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Asynchronous engine used by the request handlers so queries do not block the event loop.
+async_engine = create_async_engine(
+    to_async_url(POSTGRES_DATABASE_URL),
+    poolclass=async_pool_metrics.pool_class(AsyncAdaptedQueuePool),
+    connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    if DB_STATEMENT_TIMEOUT_MS
+    else {},
+    **POOL_OPTIONS,
+)
+async_pool_metrics.attach(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 
-def get_db():
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_sync_db() -> Iterator[Session]:
     db = SessionLocal()
     try:
         yield db
@@ -24,5 +101,25 @@ def get_db():
         db.close()
 
 
+def pool_stats() -> dict[str, Any]:
+    """
+    Report connection pool configuration and instrumentation for both engines.
+
+    Returns:
+        dict[str, Any]: The pool options and a metrics snapshot per engine.
+    """
+    return {
+        "config": {**POOL_OPTIONS, "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS},
+        "async": async_pool_metrics.snapshot(),
+        "sync": sync_pool_metrics.snapshot(),
+    }
+
+
 def init_db():
+    """Create any missing tables directly from the models, bypassing migrations. For development only."""
     Base.metadata.create_all(engine)
+
+
+async def dispose_engines():
+    await async_engine.dispose()
+    engine.dispose()
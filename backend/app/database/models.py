@@ -1,10 +1,21 @@
 from datetime import UTC
+from datetime import date
 from datetime import datetime
 
+from sqlalchemy import DDL
+from sqlalchemy import BigInteger
 from sqlalchemy import Boolean
+from sqlalchemy import Date
 from sqlalchemy import DateTime
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
+from sqlalchemy import UniqueConstraint
+from sqlalchemy import event
+from sqlalchemy import false
+from sqlalchemy import func
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
@@ -21,22 +32,130 @@ class PayingUser(Base):
     supabase_user_id: Mapped[str | None] = mapped_column(String, unique=True, index=True, nullable=True)
     email: Mapped[str] = mapped_column(String, unique=True, index=True)
     is_paying: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Mirrored from Stripe, so webhook events resolve their user without calling the Stripe API.
+    stripe_customer_id: Mapped[str | None] = mapped_column(String, unique=True, index=True, nullable=True)
+    stripe_subscription_id: Mapped[str | None] = mapped_column(String, nullable=True)
+    subscription_status: Mapped[str | None] = mapped_column(String, nullable=True)
 
 
 class BlockedPattern(Base):
     __tablename__ = "blocked_pattern"
+    __table_args__ = (UniqueConstraint("supabase_user_id", "pattern", name="uq_blocked_pattern_user_pattern"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     supabase_user_id: Mapped[str] = mapped_column(String)
     pattern: Mapped[str] = mapped_column(String)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(UTC))
+    # Blocklist revision at which this row last changed; removed patterns are kept as tombstones.
+    revision: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    deleted: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false())
+
+
+class BlocklistRevision(Base):
+    __tablename__ = "blocklist_revision"
+
+    supabase_user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    revision: Mapped[int] = mapped_column(Integer, default=0)
 
 
 class BlockingHistory(Base, TimestampMixin):
     __tablename__ = "blocking_history"
+    __table_args__ = (
+        # Uploads are de-duplicated per user on timestamp; this also serves every per-user time range scan.
+        UniqueConstraint("supabase_user_id", "timestamp", name="uq_blocking_history_user_timestamp"),
+        Index("ix_blocking_history_user_pattern", "supabase_user_id", "pattern"),
+        # Monthly partitions plus a default one, managed by database/partitions.py.
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    # Unique keys of a partitioned table must include the partition key.
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True, autoincrement=True)
     supabase_user_id: Mapped[str] = mapped_column(String)
     url: Mapped[str] = mapped_column(String)
     pattern: Mapped[str] = mapped_column(String)
-    timestamp: Mapped[datetime] = mapped_column(DateTime)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+
+
+# Without its default partition a freshly created table could not store any row.
+event.listen(
+    BlockingHistory.__table__,
+    "after_create",
+    DDL("CREATE TABLE blocking_history_default PARTITION OF blocking_history DEFAULT"),
+)
+
+
+class BlockingHistoryArchive(Base):
+    """Daily per-pattern counts of blocking history removed by retention, so rollups can still be rebuilt."""
+
+    __tablename__ = "blocking_history_archive"
+
+    supabase_user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    pattern: Mapped[str] = mapped_column(String, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+    last_blocked: Mapped[datetime] = mapped_column(DateTime)
+
+
+class BlockingHistoryVersion(Base):
+    __tablename__ = "blocking_history_version"
+
+    supabase_user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+
+
+# Rollups of blocking_history maintained by the upload path; see routes/user/stats_rollups.py.
+class BlockingStatsUser(Base):
+    __tablename__ = "blocking_stats_user"
+
+    supabase_user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    total_tabs_blocked: Mapped[int] = mapped_column(BigInteger, default=0)
+    last_blocked: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class BlockingStatsDaily(Base):
+    __tablename__ = "blocking_stats_daily"
+
+    supabase_user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    tabs_blocked: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class BlockingStatsPattern(Base):
+    __tablename__ = "blocking_stats_pattern"
+
+    supabase_user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    pattern: Mapped[str] = mapped_column(String, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class StripeWebhookEvent(Base, TimestampMixin):
+    """
+    Stripe webhook events as received, processed in the background by routes/stripe/events.py.
+
+    created_at is when the event was received; Stripe's retries of an already received event are ignored.
+    """
+
+    __tablename__ = "stripe_webhook_event"
+    __table_args__ = (
+        # The worker's queue: events still to process, by when they are due.
+        Index("ix_stripe_webhook_event_pending", "next_attempt_at", postgresql_where=text("status = 'pending'")),
+        # A customer's events are processed in the order Stripe created them.
+        Index(
+            "ix_stripe_webhook_event_customer_pending",
+            "customer_id",
+            "stripe_created",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
+
+    id: Mapped[str] = mapped_column(String, primary_key=True)  # Stripe's event id
+    type: Mapped[str] = mapped_column(String)
+    customer_id: Mapped[str | None] = mapped_column(String, nullable=True)
+    stripe_created: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    payload: Mapped[dict] = mapped_column(JSONB)
+    # pending, processed, or failed once its retries are used up.
+    status: Mapped[str] = mapped_column(String, default="pending", server_default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    processed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
@@ -0,0 +1,202 @@
+import logging
+import os
+import re
+from datetime import date
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine import Engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Monthly partitions created ahead of the current month, so new history never lands in the default partition.
+HISTORY_PARTITION_MONTHS_AHEAD = int(os.environ.get("HISTORY_PARTITION_MONTHS_AHEAD", "3"))
+# Whole months of history kept before the current one; older history is archived and removed. 0 keeps everything.
+HISTORY_RETENTION_MONTHS = int(os.environ.get("HISTORY_RETENTION_MONTHS", "0"))
+
+PARENT_TABLE = "blocking_history"
+DEFAULT_PARTITION = "blocking_history_default"
+_PARTITION_NAME = re.compile(r"^blocking_history_p(\d{4})_(\d{2})$")
+
+# Folds removed history into blocking_history_archive, which the rollup checks count as history, and bumps the
+# history version of each user it belonged to, invalidating their history and stats ETags in the same transaction.
+_ARCHIVE_SQL = """
+    WITH {source_cte}
+    archived AS (
+        INSERT INTO blocking_history_archive (supabase_user_id, day, pattern, count, last_blocked)
+        SELECT supabase_user_id, date(timestamp), pattern, count(*), max(timestamp) FROM {source} GROUP BY 1, 2, 3
+        ON CONFLICT (supabase_user_id, day, pattern) DO UPDATE SET
+            count = blocking_history_archive.count + excluded.count,
+            last_blocked = greatest(blocking_history_archive.last_blocked, excluded.last_blocked)
+        RETURNING supabase_user_id
+    )
+    INSERT INTO blocking_history_version (supabase_user_id, version)
+    SELECT DISTINCT supabase_user_id, 1 FROM archived
+    ON CONFLICT (supabase_user_id) DO UPDATE SET version = blocking_history_version.version + 1
+"""
+
+
+def add_months(month: date, months: int) -> date:
+    """
+    Move a month forwards or backwards.
+
+    Args:
+        month (date): Any day of the month.
+        months (int): Number of months to add, negative to go back.
+
+    Returns:
+        date: The first day of the resulting month.
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """Name of the partition holding a month, e.g. blocking_history_p2024_01."""
+    return f"{PARENT_TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(name: str) -> date | None:
+    """The month a partition name stands for, or None if it is not a monthly partition name."""
+    match = _PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partition_table(name: str) -> bool:
+    """Whether a table is one of blocking_history's partitions, attached or detached; they are not in the models."""
+    return name == DEFAULT_PARTITION or partition_month(name) is not None
+
+
+def retention_cutoff(today: date, retention_months: int = HISTORY_RETENTION_MONTHS) -> datetime | None:
+    """
+    The oldest timestamp kept by the retention policy.
+
+    Args:
+        today (date): The current date.
+        retention_months (int): Whole months kept before the current one; 0 keeps everything.
+
+    Returns:
+        datetime | None: The start of the oldest kept month, or None if nothing expires.
+    """
+    if retention_months <= 0:
+        return None
+    return datetime.combine(add_months(today, -retention_months), datetime.min.time())
+
+
+def list_partitions(connection: Connection) -> list[date]:
+    """
+    The months that currently have a partition attached to blocking_history.
+
+    Args:
+        connection (Connection): A database connection.
+
+    Returns:
+        list[date]: First day of each partitioned month, oldest first.
+    """
+    names = connection.scalars(
+        text("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = :parent"),
+        {"parent": connection.scalar(text("SELECT to_regclass(:parent)::oid"), {"parent": PARENT_TABLE})},
+    )
+    return sorted(month for month in map(partition_month, names) if month is not None)
+
+
+def create_partition(connection: Connection, month: date) -> None:
+    """
+    Add the partition for a month, moving any of its rows out of the default partition.
+
+    Args:
+        connection (Connection): A connection inside a transaction; writes to blocking_history wait until it ends.
+        month (date): Any day of the month.
+    """
+    name = partition_name(month)
+    bounds = {
+        "lower": datetime.combine(add_months(month, 0), datetime.min.time()),
+        "upper": datetime.combine(add_months(month, 1), datetime.min.time()),
+    }
+    # Blocks writers, not readers, so no row for the month can reach the default partition until it is attached.
+    connection.execute(text(f"LOCK TABLE {PARENT_TABLE} IN SHARE ROW EXCLUSIVE MODE"))
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = connection.execute(
+        text(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """
+        ),
+        bounds,
+    ).rowcount
+    # Bounds are literals in DDL; they come from dates, never from input.
+    connection.execute(
+        text(
+            f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{bounds['lower'].isoformat()}') TO ('{bounds['upper'].isoformat()}')"
+        )
+    )
+    logger.info("Created partition %s, moving %s rows out of %s", name, moved, DEFAULT_PARTITION)
+
+
+def create_partitions(engine: Engine, first: date, last: date) -> list[str]:
+    """
+    Make sure every month from `first` to `last` has a partition, each created in its own transaction.
+
+    Args:
+        engine (Engine): The database engine.
+        first (date): Any day of the first month.
+        last (date): Any day of the last month.
+
+    Returns:
+        list[str]: The names of the partitions created.
+    """
+    with engine.connect() as connection:
+        existing = set(list_partitions(connection))
+    created = []
+    month = add_months(first, 0)
+    while month <= last:
+        if month not in existing:
+            with engine.begin() as connection:
+                create_partition(connection, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def expire_history(engine: Engine, cutoff: datetime, keep_detached: bool = False) -> list[str]:
+    """
+    Remove history older than the cutoff after archiving it into blocking_history_archive.
+
+    Whole partitions that end at or before the cutoff are archived and detached in one transaction, then dropped
+    unless kept; older rows that reached the default partition are archived and deleted. The stats rollups keep
+    counting the removed history, and the archive lets the rollup check and rebuild account for it. The history
+    version of every user who lost history is bumped with the removal, so clients do not revalidate a stale copy.
+
+    Args:
+        engine (Engine): The database engine.
+        cutoff (datetime): The oldest timestamp kept; should be the start of a month.
+        keep_detached (bool): Keep detached partitions as standalone tables, e.g. to dump them, instead of dropping.
+
+    Returns:
+        list[str]: The partitions detached or dropped.
+    """
+    with engine.connect() as connection:
+        expired = [month for month in list_partitions(connection) if add_months(month, 1) <= cutoff.date()]
+    removed = []
+    for month in expired:
+        name = partition_name(month)
+        with engine.begin() as connection:
+            connection.execute(text(f"LOCK TABLE {PARENT_TABLE} IN SHARE ROW EXCLUSIVE MODE"))
+            connection.execute(text(_ARCHIVE_SQL.format(source_cte="", source=name)))
+            connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            if not keep_detached:
+                connection.execute(text(f"DROP TABLE {name}"))
+        logger.info("%s partition %s", "Detached" if keep_detached else "Dropped", name)
+        removed.append(name)
+    with engine.begin() as connection:
+        expired_rows = f"expired AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < :cutoff RETURNING *),"
+        connection.execute(text(_ARCHIVE_SQL.format(source_cte=expired_rows, source="expired")), {"cutoff": cutoff})
+    return removed
@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class PoolMetrics:
+    """
+    Collects connection pool statistics for an engine.
+
+    Checkout wait time is measured by a pool subclass (see `pool_class`), everything else through SQLAlchemy pool
+    events registered by `attach`.
+
+    Attributes:
+        name (str): A label for the engine, used in reports.
+        window (int): Number of recent checkout waits kept for percentiles.
+    """
+
+    def __init__(self, name: str, window: int = 1024):
+        self.name = name
+        self.window = window
+        self._lock = threading.Lock()
+        self._engine: Engine | None = None
+        self._recent_waits: deque[float] = deque(maxlen=window)
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.in_use = 0
+        self.in_use_peak = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.overflow_connections = 0
+        self.lifetime_total = 0.0
+        self.lifetime_max = 0.0
+
+    def pool_class(self, base: type[Pool]) -> type[Pool]:
+        """
+        Build a pool class that reports checkout wait time to these metrics.
+
+        The metrics are bound as a class attribute so they survive `Pool.recreate()` on engine dispose.
+
+        Args:
+            base (type[Pool]): The pool class to instrument, e.g. QueuePool or AsyncAdaptedQueuePool.
+
+        Returns:
+            type[Pool]: The instrumented pool class.
+        """
+        metrics = self
+
+        class InstrumentedPool(base):  # type: ignore[valid-type, misc]
+            def _do_get(self):
+                start = time.perf_counter()
+                try:
+                    connection = super()._do_get()
+                except exc.TimeoutError:
+                    metrics.record_timeout()
+                    raise
+                metrics.record_wait(time.perf_counter() - start)
+                return connection
+
+        InstrumentedPool.__name__ = f"Instrumented{base.__name__}"
+        return InstrumentedPool
+
+    def attach(self, engine: Engine) -> None:
+        """
+        Register the pool event listeners on an engine.
+
+        Args:
+            engine (Engine): The synchronous engine (use `AsyncEngine.sync_engine` for async engines).
+        """
+        self._engine = engine
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "close", self._on_close)
+        event.listen(engine, "close_detached", self._on_close_detached)
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._recent_waits.append(seconds)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.checkout_timeouts += 1
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        connection_record.info["connected_at"] = time.monotonic()
+        overflow = self._engine is not None and self._engine.pool.overflow() > 0
+        with self._lock:
+            self.connections_opened += 1
+            if overflow:
+                self.overflow_connections += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        with self._lock:
+            self.in_use += 1
+            self.in_use_peak = max(self.in_use_peak, self.in_use)
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def _record_close(self, connected_at: float | None) -> None:
+        with self._lock:
+            self.connections_closed += 1
+            if connected_at is not None:
+                lifetime = time.monotonic() - connected_at
+                self.lifetime_total += lifetime
+                self.lifetime_max = max(self.lifetime_max, lifetime)
+
+    def _on_close(self, dbapi_connection, connection_record) -> None:
+        self._record_close(connection_record.info.get("connected_at"))
+
+    def _on_close_detached(self, dbapi_connection) -> None:
+        self._record_close(None)
+
+    def wait_percentile(self, fraction: float, last: int | None = None) -> float:
+        """
+        Report a percentile of recent checkout waits.
+
+        Args:
+            fraction (float): The percentile as a fraction, e.g. 0.95.
+            last (int | None): Only consider the most recent `last` waits (at most `window`), e.g. those since an
+                earlier reading of `checkouts`. All kept waits when None.
+
+        Returns:
+            float: The wait in seconds, or 0.0 when nothing has been recorded yet.
+        """
+        with self._lock:
+            waits = list(self._recent_waits)
+        if last is not None:
+            waits = waits[max(0, len(waits) - last) :]
+        return _percentile(sorted(waits), fraction)
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Report the collected statistics together with the pool's current state.
+
+        Returns:
+            dict[str, Any]: Checkout, wait, usage, overflow and lifetime statistics. Times are in milliseconds.
+        """
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            stats: dict[str, Any] = {
+                "name": self.name,
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "wait_ms_avg": 1000 * self.wait_total / self.checkouts if self.checkouts else 0.0,
+                "wait_ms_max": 1000 * self.wait_max,
+                "wait_ms_p50": 1000 * _percentile(waits, 0.50),
+                "wait_ms_p95": 1000 * _percentile(waits, 0.95),
+                "wait_ms_p99": 1000 * _percentile(waits, 0.99),
+                "in_use": self.in_use,
+                "in_use_peak": self.in_use_peak,
+                "connections_opened": self.connections_opened,
+                "connections_closed": self.connections_closed,
+                "overflow_connections": self.overflow_connections,
+                "lifetime_ms_avg": 1000 * self.lifetime_total / self.connections_closed
+                if self.connections_closed
+                else 0.0,
+                "lifetime_ms_max": 1000 * self.lifetime_max,
+            }
+        if self._engine is not None:
+            pool = self._engine.pool
+            stats["pool"] = {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            }
+        return stats
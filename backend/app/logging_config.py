@@ -0,0 +1,166 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+from datetime import UTC
+from datetime import datetime
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# "json" for structured output, "text" for the classic human readable format.
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+# Comma separated `logger.name=rate` pairs, e.g. "routes.auth.router=0.1". Rates apply to records below WARNING.
+LOG_SAMPLE_RATES = os.environ.get("LOG_SAMPLE_RATES", "")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_REDACTIONS = [
+    # JWTs (access tokens, anon keys)
+    (re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]*"), "[REDACTED_JWT]"),
+    (re.compile(r"(?i)(bearer\s+)[\w.~+/=-]+"), r"\1[REDACTED]"),
+    (
+        re.compile(r"(?i)((?:password|refresh_token|access_token|secret|api_key)['\"]?\s*[:=]\s*['\"]?)[^'\",\s}]+"),
+        r"\1[REDACTED]",
+    ),
+]
+
+
+def redact(message: str) -> str:
+    """
+    Mask credentials in a log message.
+
+    Args:
+        message (str): The formatted log message.
+
+    Returns:
+        str: The message with JWTs, bearer tokens and secret-looking key/value pairs masked.
+    """
+    for pattern, replacement in _REDACTIONS:
+        message = pattern.sub(replacement, message)
+    return message
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects with redacted messages."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, UTC).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+        }
+        if record.exc_info:
+            entry["exc"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str)
+
+
+class RedactingFormatter(logging.Formatter):
+    """Plain text formatter that redacts credentials from the output."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the low-severity records of selected loggers.
+
+    Attributes:
+        rates (dict[str, float]): Keep probability per logger name. Child loggers inherit their parent's rate.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def _rate(self, name: str) -> float:
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return rate
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Enqueues records without formatting them.
+
+    The stock QueueHandler formats the message on the calling thread so records can be pickled. Our queue never
+    leaves the process, so formatting (and redaction) is left entirely to the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block the request path on logging; drop the record instead.
+            pass
+
+
+def parse_sample_rates(value: str) -> dict[str, float]:
+    """
+    Parse `LOG_SAMPLE_RATES`.
+
+    Args:
+        value (str): Comma separated `logger.name=rate` pairs.
+
+    Returns:
+        dict[str, float]: Keep probability per logger name.
+    """
+    rates: dict[str, float] = {}
+    for item in value.split(","):
+        name, _, rate = item.strip().partition("=")
+        if name and rate:
+            rates[name] = float(rate)
+    return rates
+
+
+def configure_logging() -> QueueListener:
+    """
+    Route all logging through a background thread.
+
+    The root logger gets a single non-blocking queue handler. A listener thread formats the records and writes
+    them to stderr, and is stopped (flushing the queue) when the interpreter exits.
+
+    Returns:
+        QueueListener: The running listener.
+    """
+    formatter: logging.Formatter = JsonFormatter() if LOG_FORMAT == "json" else RedactingFormatter(TEXT_FORMAT)
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = LazyQueueHandler(log_queue)
+    rates = parse_sample_rates(LOG_SAMPLE_RATES)
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -5,23 +5,59 @@ from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from admission_control import ADMISSION_CONTROL
+from admission_control import AdmissionControlMiddleware
+from admission_control import admission_controller
+from database.manager import DB_INIT_ON_STARTUP
+from database.manager import POSTGRES_DATABASE_URL
+from database.manager import dispose_engines
 from database.manager import init_db
+from logging_config import configure_logging
+from routes.auth.entitlements import ENTITLEMENT_NOTIFY_CHANNEL
+from routes.auth.entitlements import EntitlementListener
+from routes.auth.entitlements import entitlement_cache
+from routes.auth.router import auth_gateway
 from routes.auth.router import router as auth_router
+from routes.auth.router import token_cache
 from routes.health.router import router as health_router
+from routes.stripe.events import STRIPE_EVENT_WORKER
+from routes.stripe.events import stripe_event_worker
 from routes.stripe.router import router as stripe_router
+from routes.user.history_queue import HISTORY_WRITE_BEHIND
+from routes.user.history_queue import history_queue
 from routes.user.router import router as user_router
 
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+# Configure logging; records are formatted and written on a background thread
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()
+    if DB_INIT_ON_STARTUP:
+        init_db()
+    entitlement_listener = None
+    if ENTITLEMENT_NOTIFY_CHANNEL:
+        entitlement_listener = EntitlementListener(
+            POSTGRES_DATABASE_URL, ENTITLEMENT_NOTIFY_CHANNEL, entitlement_cache, token_cache=token_cache
+        )
+        await entitlement_listener.start()
+    if HISTORY_WRITE_BEHIND:
+        await history_queue.start()
+    if STRIPE_EVENT_WORKER:
+        await stripe_event_worker.start()
     yield
+    if STRIPE_EVENT_WORKER:
+        await stripe_event_worker.stop()
+    if HISTORY_WRITE_BEHIND:
+        # Before the engines are disposed: writes whatever is still queued
+        await history_queue.stop()
+    if entitlement_listener is not None:
+        await entitlement_listener.stop()
+    await auth_gateway.aclose()
+    await dispose_engines()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -31,6 +67,10 @@ app.include_router(stripe_router, prefix="/api/stripe", tags=["stripe"])
 app.include_router(auth_router, prefix="/api/auth", tags=["auth"])
 app.include_router(health_router, prefix="/api/health", tags=["health"])
 
+if ADMISSION_CONTROL:
+    # Added before CORS so that rejections still carry the CORS headers.
+    app.add_middleware(AdmissionControlMiddleware, controller=admission_controller)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -47,4 +87,5 @@ if __name__ == "__main__":
     import uvicorn
 
     logger.info("Starting the application")
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, log_level="info", reload=True)
+    # log_config=None lets uvicorn's loggers propagate into our queue instead of writing to stderr directly
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, log_level="info", log_config=None, reload=True)
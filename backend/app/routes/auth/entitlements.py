@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import asyncpg
+from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from routes.auth.token_cache import VerifiedTokenCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ENTITLEMENT_CACHE_MAX_SIZE = int(os.environ.get("ENTITLEMENT_CACHE_MAX_SIZE", "10000"))
+ENTITLEMENT_CACHE_TTL_SECONDS = float(os.environ.get("ENTITLEMENT_CACHE_TTL_SECONDS", "300"))
+ENTITLEMENT_CACHE_NEGATIVE_TTL_SECONDS = float(os.environ.get("ENTITLEMENT_CACHE_NEGATIVE_TTL_SECONDS", "60"))
+# Postgres channel used to broadcast invalidations, and logout revocations, to every worker process. Empty disables
+# LISTEN/NOTIFY.
+ENTITLEMENT_NOTIFY_CHANNEL = os.environ.get("ENTITLEMENT_NOTIFY_CHANNEL", "")
+
+# Marks a revocation on the channel; every other payload is a Supabase user id to invalidate.
+_REVOCATION_PREFIX = "revoke:"
+
+
+class EntitlementCache:
+    """
+    Bounded LRU cache of paying status keyed by Supabase user id.
+
+    Non-payers are cached too, with their own (usually shorter) TTL. Stores are tagged with the invalidation
+    `version` observed before the database read, so a read that races a webhook cannot re-cache a stale value.
+
+    Attributes:
+        max_size (int): The maximum number of cached users.
+        ttl_seconds (float): How long a paying status stays cached.
+        negative_ttl_seconds (float): How long a non-paying status stays cached.
+        version (int): Incremented on every invalidation.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that required a database read.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, negative_ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, bool]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, supabase_user_id: str) -> bool | None:
+        """
+        Look up a user's paying status.
+
+        Args:
+            supabase_user_id (str): The Supabase user id.
+
+        Returns:
+            bool | None: The cached paying status, or None if absent or expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(supabase_user_id)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[supabase_user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(supabase_user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, supabase_user_id: str, is_paying: bool, version: int) -> None:
+        """
+        Cache a user's paying status.
+
+        Args:
+            supabase_user_id (str): The Supabase user id.
+            is_paying (bool): The paying status read from the database.
+            version (int): The cache `version` observed before the database read.
+        """
+        ttl = self.ttl_seconds if is_paying else self.negative_ttl_seconds
+        if self.max_size <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[supabase_user_id] = (time.monotonic() + ttl, is_paying)
+            self._entries.move_to_end(supabase_user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, supabase_user_id: str) -> None:
+        """
+        Drop a user's cached paying status.
+
+        Args:
+            supabase_user_id (str): The Supabase user id.
+        """
+        with self._lock:
+            self.version += 1
+            self._entries.pop(supabase_user_id, None)
+
+    def clear(self) -> None:
+        """Drop every cached paying status."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        """
+        Report cache effectiveness.
+
+        Returns:
+            dict[str, int | float]: Hit and miss counters, hit ratio, and current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+
+entitlement_cache = EntitlementCache(
+    max_size=ENTITLEMENT_CACHE_MAX_SIZE,
+    ttl_seconds=ENTITLEMENT_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=ENTITLEMENT_CACHE_NEGATIVE_TTL_SECONDS,
+)
+
+
+async def publish_invalidation(db: AsyncSession, supabase_user_id: str | None) -> None:
+    """
+    Queue an invalidation for every worker as part of the current transaction.
+
+    Postgres only delivers the notification once the transaction commits. The local cache still has to be
+    invalidated by the caller after committing, since this worker may not be listening.
+
+    Args:
+        db (AsyncSession): The session whose transaction changes the user's paying status.
+        supabase_user_id (str | None): The affected user, if linked to a Supabase account.
+    """
+    if ENTITLEMENT_NOTIFY_CHANNEL and supabase_user_id:
+        await db.execute(select(func.pg_notify(ENTITLEMENT_NOTIFY_CHANNEL, supabase_user_id)))
+
+
+async def publish_revocation(db: AsyncSession, token_digest: str, exp: float | None) -> None:
+    """
+    Queue a logged-out token's revocation for every worker as part of the current transaction.
+
+    As with invalidations, the caller revokes the token in its own cache and commits.
+
+    Args:
+        db (AsyncSession): The session to send the notification on.
+        token_digest (str): The token's digest; the raw token is never broadcast.
+        exp (float | None): The token's `exp` claim as a Unix timestamp, if any.
+    """
+    if ENTITLEMENT_NOTIFY_CHANNEL:
+        payload = f"{_REVOCATION_PREFIX}{token_digest}:{'' if exp is None else exp}"
+        await db.execute(select(func.pg_notify(ENTITLEMENT_NOTIFY_CHANNEL, payload)))
+
+
+class EntitlementListener:
+    """
+    Applies invalidations broadcast over Postgres LISTEN/NOTIFY to the local cache.
+
+    The listener holds a dedicated asyncpg connection outside the SQLAlchemy pool. If that connection drops,
+    the whole cache is cleared since invalidations may have been missed, and a reconnect is attempted. Revocations
+    broadcast on the same channel are applied to the verified-token cache; any sent while disconnected are lost, and
+    the token is then only refused by the worker that logged it out.
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        channel: str,
+        cache: EntitlementCache,
+        reconnect_delay: float = 5.0,
+        token_cache: VerifiedTokenCache | None = None,
+    ):
+        # asyncpg takes a plain libpq DSN.
+        self._dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self._channel = channel
+        self._cache = cache
+        self._token_cache = token_cache
+        self._reconnect_delay = reconnect_delay
+        self._connection: asyncpg.Connection | None = None
+        self._reconnect_task: asyncio.Task | None = None
+        self._closed = False
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        if not payload.startswith(_REVOCATION_PREFIX):
+            self._cache.invalidate(payload)
+        elif self._token_cache is not None:
+            digest, _, exp = payload.removeprefix(_REVOCATION_PREFIX).partition(":")
+            self._token_cache.revoke_digest(digest, float(exp) if exp else None)
+
+    def _on_terminate(self, connection) -> None:
+        logger.warning("Entitlement listener connection lost, clearing cache")
+        self._cache.clear()
+        self._connection = None
+        if not self._closed:
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        while not self._closed and self._connection is None:
+            await asyncio.sleep(self._reconnect_delay)
+            try:
+                await self.start()
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning("Entitlement listener reconnect failed: %s", e)
+
+    async def start(self) -> None:
+        """Connect and start listening on the channel."""
+        connection = await asyncpg.connect(self._dsn)
+        connection.add_termination_listener(self._on_terminate)
+        await connection.add_listener(self._channel, self._on_notify)
+        self._connection = connection
+        # Anything invalidated while we were not listening is unknown, so start from an empty cache.
+        self._cache.clear()
+
+    async def stop(self) -> None:
+        """Stop listening and close the connection."""
+        self._closed = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
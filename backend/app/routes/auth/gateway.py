@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import TypeVar
+
+import httpx
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+
+class AuthGatewayError(Exception):
+    """
+    Raised when the Supabase auth API rejects a call or cannot be reached.
+
+    Attributes:
+        status_code (int | None): The upstream HTTP status, or None for transport failures.
+        message (str): The upstream error message.
+    """
+
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class AuthUser(BaseModel):
+    """
+    Represents a Supabase auth user.
+
+    Attributes:
+        id (str): The Supabase user id.
+        email (str | None): The user's email, if any.
+    """
+
+    id: str
+    email: str | None = None
+
+
+class AuthSession(BaseModel):
+    """
+    Represents a Supabase auth session.
+
+    Attributes:
+        access_token (str): The access token string.
+        refresh_token (str): The refresh token string.
+        expires_in (int): Token expiry time in seconds.
+        token_type (str): The type of the token (e.g., "bearer").
+        user (AuthUser | None): The user the session belongs to.
+    """
+
+    access_token: str
+    refresh_token: str
+    expires_in: int
+    token_type: str
+    user: AuthUser | None = None
+
+
+class SupabaseAuthGateway:
+    """
+    Non-blocking client for the Supabase auth (GoTrue) REST API.
+
+    Calls share a pooled keep-alive `httpx.AsyncClient` that is created on first use, so each worker process and
+    event loop gets its own pool. Concurrent refreshes of the same refresh token are coalesced into one upstream call.
+
+    Attributes:
+        base_url (str): The Supabase project URL.
+        api_key (str): The Supabase anon key.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        timeout: float = 5.0,
+        connect_timeout: float = 2.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._inflight: dict[str, asyncio.Future[Any]] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=f"{self.base_url}/auth/v1",
+                headers={"apikey": self.api_key, "Authorization": f"Bearer {self.api_key}"},
+                timeout=self._timeout,
+                limits=self._limits,
+                transport=self._transport,
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, path: str, **kwargs: Any) -> dict[str, Any]:
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            raise AuthGatewayError(f"Supabase auth request failed: {type(e).__name__}") from e
+        if response.is_error:
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            message = body.get("msg") or body.get("error_description") or body.get("message") or response.text
+            raise AuthGatewayError(message, status_code=response.status_code)
+        return response.json()
+
+    async def _single_flight(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `call` once for all concurrent callers sharing `key`.
+
+        Args:
+            key (str): Identifies equivalent calls.
+            call (Callable[[], Awaitable[T]]): Produces the upstream call.
+
+        Returns:
+            T: The shared result. Errors are shared the same way.
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(call())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield so that one cancelled caller does not cancel the call for everyone else.
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def _parse_user(body: dict[str, Any]) -> AuthUser:
+        return AuthUser(id=body["id"], email=body.get("email"))
+
+    @classmethod
+    def _parse_session(cls, body: dict[str, Any]) -> AuthSession:
+        user = body.get("user")
+        return AuthSession(
+            access_token=body["access_token"],
+            refresh_token=body["refresh_token"],
+            expires_in=body["expires_in"],
+            token_type=body["token_type"],
+            user=cls._parse_user(user) if user else None,
+        )
+
+    async def sign_up(self, email: str, password: str, redirect_to: str | None = None) -> AuthUser:
+        """
+        Register a new user.
+
+        Args:
+            email (str): The user's email.
+            password (str): The user's password.
+            redirect_to (str | None): Where the confirmation email should send the user.
+
+        Returns:
+            AuthUser: The created user.
+        """
+        params = {"redirect_to": redirect_to} if redirect_to else None
+        body = await self._request("POST", "/signup", json={"email": email, "password": password}, params=params)
+        # With email confirmation enabled the user is returned directly, otherwise it is wrapped in a session.
+        return self._parse_user(body.get("user") or body)
+
+    async def sign_in_with_password(self, email: str, password: str) -> AuthSession:
+        """
+        Sign a user in with their email and password.
+
+        Args:
+            email (str): The user's email.
+            password (str): The user's password.
+
+        Returns:
+            AuthSession: The new session.
+        """
+        body = await self._request(
+            "POST", "/token", params={"grant_type": "password"}, json={"email": email, "password": password}
+        )
+        return self._parse_session(body)
+
+    async def refresh_session(self, refresh_token: str) -> AuthSession:
+        """
+        Exchange a refresh token for a new session.
+
+        Concurrent calls with the same refresh token share a single upstream request.
+
+        Args:
+            refresh_token (str): The refresh token.
+
+        Returns:
+            AuthSession: The refreshed session.
+        """
+
+        async def call() -> AuthSession:
+            body = await self._request(
+                "POST", "/token", params={"grant_type": "refresh_token"}, json={"refresh_token": refresh_token}
+            )
+            return self._parse_session(body)
+
+        key = "refresh:" + hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+        return await self._single_flight(key, call)
+
+    async def get_user(self, access_token: str) -> AuthUser:
+        """
+        Fetch the user an access token belongs to.
+
+        Args:
+            access_token (str): The user's access token.
+
+        Returns:
+            AuthUser: The token's user.
+        """
+
+        async def call() -> AuthUser:
+            body = await self._request("GET", "/user", headers={"Authorization": f"Bearer {access_token}"})
+            return self._parse_user(body)
+
+        key = "user:" + hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+        return await self._single_flight(key, call)
@@ -12,11 +12,8 @@ from fastapi.security import OAuth2PasswordRequestForm
 from jose import ExpiredSignatureError
 from jose import JWTError
 from jose import jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
-from supabase import Client
-from supabase import create_client
-from supabase.lib.client_options import ClientOptions
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.manager import get_db
 from database.models import PayingUser
@@ -26,11 +23,15 @@ from routes.auth.api import SessionResponse
 from routes.auth.api import Token
 from routes.auth.api import UserCreate
 from routes.auth.api import UserResponse
+from routes.auth.entitlements import entitlement_cache
+from routes.auth.entitlements import publish_revocation
+from routes.auth.gateway import SupabaseAuthGateway
+from routes.auth.token_cache import VerifiedTokenCache
+from routes.auth.token_cache import token_digest
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
 router = APIRouter()
 
@@ -47,20 +48,27 @@ SUPABASE_JWT_PUBLIC_KEY = os.environ.get("SUPABASE_JWT_PUBLIC_KEY")
 if SUPABASE_JWT_PUBLIC_KEY is None:
     raise ValueError("SUPABASE_JWT_PUBLIC_KEY environment variable is not set")
 
-# Create a Supabase client
-supabase_client: Client = create_client(
+# Non-blocking Supabase auth client with a pooled keep-alive connection
+auth_gateway = SupabaseAuthGateway(
     SUPABASE_URL,
     SUPABASE_ANON_KEY,
-    options=ClientOptions(
-        auto_refresh_token=False,
-        persist_session=False,
-    ),
+    timeout=float(os.environ.get("SUPABASE_AUTH_TIMEOUT_SECONDS", "5")),
+    connect_timeout=float(os.environ.get("SUPABASE_AUTH_CONNECT_TIMEOUT_SECONDS", "2")),
+    max_connections=int(os.environ.get("SUPABASE_AUTH_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.environ.get("SUPABASE_AUTH_MAX_KEEPALIVE_CONNECTIONS", "10")),
 )
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Verified principals are cached so repeated requests with the same bearer token skip the Supabase round trip.
+AUTH_TOKEN_CACHE_MAX_SIZE = int(os.environ.get("AUTH_TOKEN_CACHE_MAX_SIZE", "10000"))
+AUTH_TOKEN_CACHE_TTL_SECONDS = float(os.environ.get("AUTH_TOKEN_CACHE_TTL_SECONDS", "300"))
+# When enabled, a valid signature is trusted without confirming the user with Supabase.
+AUTH_LOCAL_VERIFY_ONLY = os.environ.get("AUTH_LOCAL_VERIFY_ONLY", "false").lower() in ("1", "true", "yes")
+
+token_cache = VerifiedTokenCache(max_size=AUTH_TOKEN_CACHE_MAX_SIZE, ttl_seconds=AUTH_TOKEN_CACHE_TTL_SECONDS)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
@@ -72,14 +80,14 @@ def require_supabase_jwt_key() -> str:
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    # db: Session = Depends(get_db),
+    # db: AsyncSession = Depends(get_db),
 ) -> UserResponse:
     """
     Get the current authenticated user.
 
     Args:
         token (str): The JWT token from the request.
-        db (Session): The database session.
+        db (AsyncSession): The database session.
 
     Returns:
         User: The authenticated user.
@@ -87,7 +95,11 @@ async def get_current_user(
     Raises:
         HTTPException: If the credentials are invalid or the user is not found.
     """
-    logger.info(f"Attempting to get current user with token: {token[:10]}...")
+    cached_user = token_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+
+    logger.info("Attempting to get current user from bearer token")
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -108,7 +120,7 @@ async def get_current_user(
         if uuid is None:
             logger.info("UUID not found in token payload")
             raise credentials_exception
-        logger.info(f"UUID extracted from token: {uuid}")
+        logger.info("UUID extracted from token: %s", uuid)
     except ExpiredSignatureError:
         logger.info("JWT token has expired")
         raise HTTPException(
@@ -120,17 +132,25 @@ async def get_current_user(
         logger.info("JWT decoding failed", exc_info=True)
         raise credentials_exception
 
-    logger.info(f"Checking supbase for user with uuid: {uuid}")
+    if token_cache.is_revoked(token):
+        logger.info("Rejecting revoked token for uuid: %s", uuid)
+        raise credentials_exception
+
+    if AUTH_LOCAL_VERIFY_ONLY:
+        user = UserResponse(supabase_user_id=uuid, email=payload.get("email"))
+        token_cache.put(token, user, payload.get("exp"))
+        return user
+
+    logger.info("Checking supbase for user with uuid: %s", uuid)
 
     try:
-        response = supabase_client.auth.get_user(token)
-        if response is None:
-            logger.info(f"User not found for email: {uuid}")
-            raise credentials_exception
+        auth_user = await auth_gateway.get_user(token)
     except Exception as e:
-        logger.error(f"Error querying Supabase for user: {str(e)}")
+        logger.error("Error querying Supabase for user: %s", e)
         raise credentials_exception
-    return UserResponse(supabase_user_id=response.user.id, email=response.user.email)
+    user = UserResponse(supabase_user_id=auth_user.id, email=auth_user.email)
+    token_cache.put(token, user, payload.get("exp"))
+    return user
 
 
 @router.post("/register", response_model=RegistrationResponse)
@@ -145,41 +165,28 @@ async def register(user_create: UserCreate) -> RegistrationResponse:
     Returns:
         RegistrationResponse: The registration response containing user information and verification status.
     """
-    logger.info(f"Attempting to register user: {user_create.username}")
+    logger.info("Attempting to register user: %s", user_create.username)
     try:
         # Construct the redirect URL
         base_url = "https://untab.xyz/"
         redirect_url = f"{base_url}register?email={user_create.username}"
 
         # Attempt to sign up the user using Supabase
-        response = supabase_client.auth.sign_up(
-            {
-                "email": user_create.username,
-                "password": user_create.password,
-                "options": {"email_redirect_to": redirect_url},
-            },
-        )
-
-        if response.user is None:
-            logger.error(f"Registration failed for user: {user_create.username}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Registration failed: User could not be created",
-            )
+        auth_user = await auth_gateway.sign_up(user_create.username, user_create.password, redirect_to=redirect_url)
 
         # User created successfully
-        logger.info(f"User successfully registered: {user_create.username}")
+        logger.info("User successfully registered: %s", user_create.username)
 
         return RegistrationResponse(
             message="Registration successful. Please check your email to confirm your account.",
-            user_id=str(response.user.id),
-            email=response.user.email or user_create.username,
+            user_id=str(auth_user.id),
+            email=auth_user.email or user_create.username,
             requires_verification=True,
         )
 
     except Exception as e:
         # Handle any errors that occur during registration
-        logger.error(f"Registration failed for user {user_create.username}: {str(e)}")
+        logger.error("Registration failed for user %s: %s", user_create.username, e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Registration failed: {str(e)}",
@@ -187,13 +194,13 @@ async def register(user_create: UserCreate) -> RegistrationResponse:
 
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)) -> Token:
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)) -> Token:
     """
     Authenticate a user and return an access token.
 
     Args:
         form_data (OAuth2PasswordRequestForm): The login credentials.
-        db (Session): The database session.
+        db (AsyncSession): The database session.
 
     Returns:
         Token: The access token for the authenticated user.
@@ -201,35 +208,21 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     Raises:
         HTTPException: If login fails or credentials are incorrect.
     """
-    logger.info(f"Attempting to register user: {form_data}")
+    logger.info("Attempting to log in user: %s", form_data.username)
     try:
         # Attempt to sign in the user with Supabase
-        response = supabase_client.auth.sign_in_with_password(
-            {
-                "email": form_data.username,
-                "password": form_data.password,
-            }
-        )
-        if response.user is None:
+        session = await auth_gateway.sign_in_with_password(form_data.username, form_data.password)
+        if session.user is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        if response.session is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Login failed: Session not found",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-
-        access_token = response.session.access_token
-        refresh_token = response.session.refresh_token
-        expires_in = response.session.expires_in
-        token_type = response.session.token_type
-
-        logger.info(f"access_token: {access_token}")
+        access_token = session.access_token
+        refresh_token = session.refresh_token
+        expires_in = session.expires_in
+        token_type = session.token_type
 
         return Token(
             access_token=access_token,
@@ -249,7 +242,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
 @router.get("/session", response_model=SessionResponse)
 async def get_session(
     current_user: UserResponse = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ) -> SessionResponse:
     """
     Get the current user's session information.
@@ -260,11 +253,18 @@ async def get_session(
     Returns:
         SessionResponse: The session information for the current user.
     """
-    logger.info(f"Session requested for user: {current_user.email}")
-
-    # Check if the user is in the paying_users table
-    paying_user = db.query(PayingUser).filter(PayingUser.supabase_user_id == current_user.supabase_user_id).first()
-    is_paying = paying_user is not None and paying_user.is_paying
+    logger.info("Session requested for user: %s", current_user.email)
+
+    # Paying status only changes through Stripe webhooks, which invalidate the cache
+    is_paying = entitlement_cache.get(current_user.supabase_user_id)
+    if is_paying is None:
+        version = entitlement_cache.version
+        # Check if the user is in the paying_users table
+        paying_user = await db.scalar(
+            select(PayingUser).where(PayingUser.supabase_user_id == current_user.supabase_user_id).limit(1)
+        )
+        is_paying = paying_user is not None and paying_user.is_paying
+        entitlement_cache.put(current_user.supabase_user_id, is_paying, version)
 
     return SessionResponse(
         supabase_user_id=current_user.supabase_user_id,
@@ -274,15 +274,27 @@ async def get_session(
 
 
 @router.post("/logout")
-async def logout() -> Dict[str, str]:
+async def logout(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Dict[str, str]:
     """
     Log out the current user.
 
+    Args:
+        token (str): The JWT token from the request.
+        db (AsyncSession): The database session, to broadcast the revocation to the other workers.
+
     Returns:
         Dict[str, str]: A message indicating successful logout.
     """
-    # In a stateless JWT system, logout is typically handled client-side
-    # by removing the token. Here we can add any server-side logout logic if needed.
+    # In a stateless JWT system, logout is typically handled client-side by removing the token.
+    # Server-side we revoke it in the verified-token cache so it is not served from cache afterwards.
+    try:
+        exp = jwt.get_unverified_claims(token).get("exp")
+    except JWTError:
+        exp = None
+    token_cache.revoke(token, exp)
+    # Every worker has its own cache; the others learn of the revocation over ENTITLEMENT_NOTIFY_CHANNEL.
+    await publish_revocation(db, token_digest(token), exp)
+    await db.commit()
     return {"message": "Logged out successfully"}
 
 
@@ -298,39 +310,26 @@ async def refresh_token(request: RefreshTokenRequest) -> Token:
         Token: The new access token along with a new refresh token and expiry.
     """
     logger.info("Attempting to refresh access token")
-    logger.info(f"Received refresh token: {request.refresh_token[:10]}...")
 
     try:
-        logger.info("Calling supabase_client.auth.refresh_session")
-        response = supabase_client.auth.refresh_session(request.refresh_token)
-
-        logger.info(f"Supabase response: {response}")  # Log entire response for debugging
-
-        if response.session is None:
-            logger.warning("Refresh session returned None")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Refresh token invalid",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+        logger.info("Calling auth_gateway.refresh_session")
+        session = await auth_gateway.refresh_session(request.refresh_token)
 
         logger.info("Successfully refreshed session")
-        logger.info(f"New access token: {response.session.access_token[:10]}...")
-        logger.info(f"New refresh token: {response.session.refresh_token[:10]}...")
-        logger.info(f"Token expires in: {response.session.expires_in} seconds")
+        logger.info("Token expires in: %s seconds", session.expires_in)
 
-        access_token = response.session.access_token
-        refresh_token = response.session.refresh_token
-        expires_in = response.session.expires_in
-        token_type = response.session.token_type
+        access_token = session.access_token
+        refresh_token = session.refresh_token
+        expires_in = session.expires_in
+        token_type = session.token_type
 
         return Token(
             access_token=access_token, refresh_token=refresh_token, expires_in=expires_in, token_type=token_type
         )
     except Exception as e:
-        logger.error(f"Token refresh failed: {str(e)}", exc_info=True)  # Log full exception traceback
-        logger.info(f"Exception type: {type(e).__name__}")
-        logger.info(f"Exception args: {e.args}")
+        logger.error("Token refresh failed: %s", e, exc_info=True)  # Log full exception traceback
+        logger.info("Exception type: %s", type(e).__name__)
+        logger.info("Exception args: %s", e.args)
 
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,198 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from routes.auth.api import UserResponse
+
+
+def token_digest(token: str) -> str:
+    """
+    Compute the cache key for a bearer token.
+
+    Args:
+        token (str): The raw bearer token.
+
+    Returns:
+        str: The hex SHA-256 digest of the token, so raw tokens are never held as keys.
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of verified principals keyed by token digest.
+
+    Each entry lives for at most `ttl_seconds` and never past the token's own `exp` claim. Revoked tokens are
+    remembered until they expire so that a logged-out token cannot be re-admitted by a concurrent request.
+
+    Attributes:
+        max_size (int): The maximum number of cached principals.
+        ttl_seconds (float): The upper bound on how long a principal stays cached.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that required verification.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, UserResponse]] = OrderedDict()
+        self._revoked: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _deadline(self, exp: float | None) -> float:
+        """Translate a wall-clock `exp` claim into a monotonic deadline capped by the TTL."""
+        lifetime = self.ttl_seconds
+        if exp is not None:
+            lifetime = min(lifetime, exp - time.time())
+        return time.monotonic() + lifetime
+
+    def get(self, token: str) -> UserResponse | None:
+        """
+        Look up the principal for a token.
+
+        Args:
+            token (str): The raw bearer token.
+
+        Returns:
+            UserResponse | None: The cached principal, or None if absent or expired.
+        """
+        key = token_digest(token)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, token: str) -> UserResponse | None:
+        """
+        Look up the principal for a token without counting the lookup or refreshing its recency.
+
+        Args:
+            token (str): The raw bearer token.
+
+        Returns:
+            UserResponse | None: The cached principal, or None if absent or expired.
+        """
+        key = token_digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, token: str, user: UserResponse, exp: float | None) -> None:
+        """
+        Cache a verified principal.
+
+        Args:
+            token (str): The raw bearer token.
+            user (UserResponse): The verified principal.
+            exp (float | None): The token's `exp` claim as a Unix timestamp, if any.
+        """
+        if self.max_size <= 0:
+            return
+        key = token_digest(token)
+        deadline = self._deadline(exp)
+        if deadline <= time.monotonic():
+            return
+        with self._lock:
+            if key in self._revoked:
+                return
+            self._entries[key] = (deadline, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str) -> None:
+        """
+        Drop a token from the cache without revoking it.
+
+        Args:
+            token (str): The raw bearer token.
+        """
+        with self._lock:
+            self._entries.pop(token_digest(token), None)
+
+    def revoke(self, token: str, exp: float | None) -> None:
+        """
+        Drop a token from the cache and refuse it until it expires.
+
+        Args:
+            token (str): The raw bearer token.
+            exp (float | None): The token's `exp` claim as a Unix timestamp, if any.
+        """
+        self.revoke_digest(token_digest(token), exp)
+
+    def revoke_digest(self, key: str, exp: float | None) -> None:
+        """
+        Revoke a token known only by its digest, as broadcast by another worker.
+
+        Args:
+            key (str): The token's `token_digest`.
+            exp (float | None): The token's `exp` claim as a Unix timestamp, if any.
+        """
+        # Revocations must outlive the cache TTL, so only the token's own expiry bounds them.
+        lifetime = exp - time.time() if exp is not None else self.ttl_seconds
+        deadline = time.monotonic() + lifetime
+        with self._lock:
+            self._entries.pop(key, None)
+            self._revoked[key] = deadline
+            self._revoked.move_to_end(key)
+            now = time.monotonic()
+            while self._revoked and (len(self._revoked) > self.max_size or next(iter(self._revoked.values())) <= now):
+                self._revoked.popitem(last=False)
+
+    def is_revoked(self, token: str) -> bool:
+        """
+        Check whether a token has been revoked.
+
+        Args:
+            token (str): The raw bearer token.
+
+        Returns:
+            bool: True if the token was revoked and has not yet expired.
+        """
+        key = token_digest(token)
+        with self._lock:
+            deadline = self._revoked.get(key)
+            if deadline is None:
+                return False
+            if deadline <= time.monotonic():
+                del self._revoked[key]
+                return False
+            return True
+
+    def clear(self) -> None:
+        """Empty the cache and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._revoked.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int | float]:
+        """
+        Report cache effectiveness.
+
+        Returns:
+            dict[str, int | float]: Hit and miss counters, hit ratio, and current sizes.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "revoked": len(self._revoked),
+            }
@@ -1,4 +1,16 @@
 from fastapi import APIRouter
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from admission_control import admission_controller
+from database.manager import get_db
+from database.manager import pool_stats
+from routes.auth.entitlements import entitlement_cache
+from routes.auth.router import token_cache
+from routes.stripe.events import event_backlog
+from routes.stripe.events import stripe_event_worker
+from routes.user.history_queue import history_queue
+from routes.user.url_matcher import matcher_cache
 
 router = APIRouter()
 
@@ -6,3 +18,38 @@ router = APIRouter()
 @router.get("/check")
 async def get_health():
     return {"status": "ok"}
+
+
+@router.get("/admission")
+async def get_admission_stats():
+    return admission_controller.stats()
+
+
+@router.get("/auth_cache")
+async def get_auth_cache_stats():
+    return token_cache.stats()
+
+
+@router.get("/entitlement_cache")
+async def get_entitlement_cache_stats():
+    return entitlement_cache.stats()
+
+
+@router.get("/db_pool")
+async def get_db_pool_stats():
+    return pool_stats()
+
+
+@router.get("/history_queue")
+async def get_history_queue_stats():
+    return history_queue.stats()
+
+
+@router.get("/url_matcher_cache")
+async def get_url_matcher_cache_stats():
+    return matcher_cache.stats()
+
+
+@router.get("/stripe_events")
+async def get_stripe_event_stats(db: AsyncSession = Depends(get_db)):
+    return {**stripe_event_worker.stats(), **await event_backlog(db)}
@@ -0,0 +1,372 @@
+import asyncio
+import logging
+import os
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
+from functools import cache
+from types import ModuleType
+from typing import Any
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import exists
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from database.manager import AsyncSessionLocal
+from database.models import PayingUser
+from database.models import StripeWebhookEvent
+from routes.auth.entitlements import entitlement_cache
+from routes.auth.entitlements import publish_invalidation
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
+# Whether each app worker process handles received webhook events in the background. Off by default: one
+# `commands.stripe_events run` per deployment handles them instead of every web worker polling.
+STRIPE_EVENT_WORKER = os.environ.get("STRIPE_EVENT_WORKER", "false").lower() == "true"
+# How often the worker looks for events received by other processes or due for a retry.
+STRIPE_EVENT_POLL_SECONDS = float(os.environ.get("STRIPE_EVENT_POLL_SECONDS", "1"))
+# Attempts at an event before it is marked failed and left for manual inspection.
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.environ.get("STRIPE_EVENT_MAX_ATTEMPTS", "8"))
+# Delay before the first retry, doubled for every further one up to STRIPE_EVENT_RETRY_MAX_SECONDS.
+STRIPE_EVENT_RETRY_BASE_SECONDS = float(os.environ.get("STRIPE_EVENT_RETRY_BASE_SECONDS", "10"))
+STRIPE_EVENT_RETRY_MAX_SECONDS = float(os.environ.get("STRIPE_EVENT_RETRY_MAX_SECONDS", "3600"))
+
+PENDING = "pending"
+PROCESSED = "processed"
+FAILED = "failed"
+
+_SUBSCRIPTION_EVENTS = ("customer.subscription.updated", "customer.subscription.deleted")
+# Events that end a customer's entitlement, whatever their subscription's status.
+_UNPAID_EVENTS = ("charge.refunded", "invoice.payment_failed")
+
+
+@cache
+def get_stripe() -> ModuleType:
+    """
+    Import the Stripe SDK on first use, configured with STRIPE_SECRET_KEY.
+
+    The SDK is large and only needed when a webhook arrives, so keeping it out of module import
+    shortens worker start-up and lowers idle memory.
+
+    Returns:
+        ModuleType: The `stripe` module.
+    """
+    import stripe
+
+    stripe.api_key = STRIPE_SECRET_KEY
+    return stripe
+
+
+async def record_event(db: AsyncSession, event: dict[str, Any]) -> bool:
+    """
+    Store a verified webhook event for the background worker.
+
+    Stripe delivers an event again until it is acknowledged, and sometimes even then; the event id is the primary
+    key, so a repeated delivery is ignored. The caller commits.
+
+    Args:
+        db (AsyncSession): The request's session.
+        event (dict[str, Any]): The event as Stripe sent it.
+
+    Returns:
+        bool: False if the event had been received before.
+    """
+    customer_id = event["data"]["object"].get("customer")
+    if isinstance(customer_id, dict):
+        customer_id = customer_id["id"]
+    statement = (
+        insert(StripeWebhookEvent)
+        .values(
+            id=event["id"],
+            type=event["type"],
+            customer_id=customer_id,
+            stripe_created=datetime.fromtimestamp(event["created"], UTC),
+            payload=event,
+        )
+        .on_conflict_do_nothing(index_elements=[StripeWebhookEvent.id])
+        .returning(StripeWebhookEvent.id)
+    )
+    return (await db.execute(statement)).first() is not None
+
+
+async def _customer_user(db: AsyncSession, stripe: Any, customer_id: str) -> PayingUser | None:
+    paying_user = await db.scalar(select(PayingUser).where(PayingUser.stripe_customer_id == customer_id))
+    if paying_user is not None:
+        return paying_user
+    # A customer who paid before customer ids were stored and whom `commands.backfill_stripe_customers` has not
+    # covered: found by email this once, then mirrored.
+    customer = await run_in_threadpool(stripe.Customer.retrieve, customer_id)
+    paying_user = await db.scalar(select(PayingUser).where(PayingUser.email == customer["email"]).limit(1))
+    if paying_user is None:
+        logger.warning(f"No paying user found for Stripe customer {customer_id}")
+        return None
+    paying_user.stripe_customer_id = customer_id
+    return paying_user
+
+
+async def _set_paying(db: AsyncSession, paying_user: PayingUser, is_paying: bool) -> str | None:
+    logger.info(f"Updating user payment status to {is_paying}: {paying_user.email}")
+    paying_user.is_paying = is_paying
+    await publish_invalidation(db, paying_user.supabase_user_id)
+    return paying_user.supabase_user_id
+
+
+async def handle_event(db: AsyncSession, stripe: Any, event: dict[str, Any]) -> str | None:
+    """
+    Apply a webhook event to the paying users. The caller commits.
+
+    Users are found by their mirrored Stripe customer id, which checkouts store; the Stripe API is only called for
+    customers not mirrored yet, on a worker thread, since the SDK blocks.
+
+    Args:
+        db (AsyncSession): The session to make the changes in.
+        stripe (Any): The Stripe SDK, or a stand-in with the same `checkout.Session` and `Customer` API.
+        event (dict[str, Any]): The event as Stripe sent it.
+
+    Returns:
+        str | None: The Supabase user id whose paying status changed, whose cached entitlement must be dropped
+        after committing.
+    """
+    event_type = event["type"]
+    data = event["data"]["object"]
+    logger.info(f"Processing {event_type} event {event['id']}")
+
+    if event_type == "checkout.session.completed":
+        customer_email = (data.get("customer_details") or {}).get("email")
+        if customer_email is None:
+            # Retrieve the session to get customer details
+            checkout_session = await run_in_threadpool(stripe.checkout.Session.retrieve, data["id"])
+            customer_email = checkout_session["customer_details"]["email"]
+        paying_user = await db.scalar(select(PayingUser).where(PayingUser.email == customer_email).limit(1))
+        if paying_user is None:
+            logger.info(f"Creating new paying user: {customer_email}")
+            paying_user = PayingUser(email=customer_email)
+            db.add(paying_user)
+        if data.get("customer"):
+            paying_user.stripe_customer_id = data["customer"]
+        if data.get("subscription"):
+            paying_user.stripe_subscription_id = data["subscription"]
+        return await _set_paying(db, paying_user, True)
+
+    if event_type in _SUBSCRIPTION_EVENTS or event_type in _UNPAID_EVENTS:
+        paying_user = await _customer_user(db, stripe, data["customer"])
+        if paying_user is None:
+            return None
+        if event_type in _SUBSCRIPTION_EVENTS:
+            paying_user.stripe_subscription_id = data["id"]
+            paying_user.subscription_status = data["status"]
+        is_paying = event_type == "customer.subscription.updated" and data["status"] == "active"
+        return await _set_paying(db, paying_user, is_paying)
+
+    logger.info(f"Unhandled event type: {event_type}")
+    return None
+
+
+_earlier = aliased(StripeWebhookEvent)
+# The next due event that no earlier pending event of the same customer is waiting in front of. Rows being handled
+# by another worker are skipped, and so are that customer's later events, which still see the locked one pending.
+_CLAIM_NEXT_EVENT = (
+    select(StripeWebhookEvent)
+    .where(
+        StripeWebhookEvent.status == PENDING,
+        StripeWebhookEvent.next_attempt_at <= func.now(),
+        ~exists().where(
+            _earlier.status == PENDING,
+            _earlier.customer_id == StripeWebhookEvent.customer_id,
+            tuple_(_earlier.stripe_created, _earlier.created_at, _earlier.id)
+            < tuple_(StripeWebhookEvent.stripe_created, StripeWebhookEvent.created_at, StripeWebhookEvent.id),
+        ),
+    )
+    .order_by(StripeWebhookEvent.next_attempt_at)
+    .limit(1)
+    .with_for_update(skip_locked=True, of=StripeWebhookEvent)
+)
+
+
+class StripeEventWorker:
+    """
+    Background processor of received Stripe webhook events.
+
+    Every app worker process runs one, and they share the work through row locks. Each event is handled in a
+    transaction of its own, after every earlier pending event of the same customer, so a cancellation is never
+    applied before the checkout it follows. A failing event is retried with exponential backoff, holding back that
+    customer's later events, and marked failed once its attempts are used up.
+
+    Attributes:
+        poll_interval (float): Seconds between looks for events received by other processes or due for a retry.
+        max_attempts (int): Attempts at an event before it is marked failed.
+        retry_base_seconds (float): Delay before the first retry, doubled for each further one.
+        retry_max_seconds (float): The longest delay between retries.
+    """
+
+    def __init__(
+        self,
+        poll_interval: float,
+        max_attempts: int,
+        retry_base_seconds: float,
+        retry_max_seconds: float,
+        stripe_api: Any = None,
+    ):
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._stripe_api = stripe_api
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closed = False
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self.last_error: str | None = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the worker has been started and not stopped."""
+        return self._task is not None and not self._closed
+
+    def notify(self) -> None:
+        """Look for due events now rather than at the next poll, e.g. right after one was received."""
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        """Start processing in the background."""
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Finish the event being handled, then stop. Pending events stay in the table."""
+        self._closed = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                # E.g. the database is unreachable; everything is still in the table for the next poll.
+                logger.exception("Processing Stripe webhook events failed")
+                self.last_error = type(e).__name__
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self) -> int:
+        """
+        Handle events until none is due.
+
+        Returns:
+            int: The number of events handled, successfully or not.
+        """
+        handled = 0
+        while not self._closed and await self.process_next():
+            handled += 1
+        return handled
+
+    async def process_next(self) -> bool:
+        """
+        Handle the next due event, if any.
+
+        Returns:
+            bool: False if no event was due.
+        """
+        async with AsyncSessionLocal() as db:
+            event = await db.scalar(_CLAIM_NEXT_EVENT)
+            if event is None:
+                return False
+            supabase_user_id = None
+            event.attempts += 1
+            try:
+                # The handler's changes are rolled back on failure; the claimed row stays locked.
+                async with db.begin_nested():
+                    supabase_user_id = await handle_event(db, self._stripe_api or get_stripe(), event.payload)
+            except Exception as e:
+                self._record_failure(event, e)
+            else:
+                event.status = PROCESSED
+                event.processed_at = func.now()
+                event.last_error = None
+                self.processed += 1
+                self.last_lag_seconds = (datetime.now(UTC) - event.created_at).total_seconds()
+                self.max_lag_seconds = max(self.max_lag_seconds, self.last_lag_seconds)
+            await db.commit()
+        if supabase_user_id:
+            entitlement_cache.invalidate(supabase_user_id)
+        return True
+
+    def _record_failure(self, event: StripeWebhookEvent, error: Exception) -> None:
+        event.last_error = repr(error)
+        # Only the type: the stats are served unauthenticated, and messages can carry customer or database details.
+        self.last_error = type(error).__name__
+        if event.attempts >= self.max_attempts:
+            logger.error(f"Giving up on Stripe event {event.id} after {event.attempts} attempts: {error!r}")
+            event.status = FAILED
+            self.failed += 1
+            return
+        delay = min(self.retry_base_seconds * 2 ** (event.attempts - 1), self.retry_max_seconds)
+        logger.warning(f"Stripe event {event.id} failed (attempt {event.attempts}), retrying in {delay:.0f} s")
+        event.next_attempt_at = func.now() + timedelta(seconds=delay)
+        self.retried += 1
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Report this worker's activity.
+
+        Returns:
+            dict[str, Any]: Event counters, the time from receipt to processing of the last and slowest event, and
+            the type of the last error; the full error is logged and kept on the event's row.
+        """
+        return {
+            "enabled": self.running,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "last_lag_seconds": self.last_lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "last_error": self.last_error,
+        }
+
+
+async def event_backlog(db: AsyncSession) -> dict[str, Any]:
+    """
+    Report the events still waiting across all workers.
+
+    Args:
+        db (AsyncSession): A session to query with.
+
+    Returns:
+        dict[str, Any]: The number of pending events and how long ago the oldest of them was received.
+    """
+    pending, oldest = (
+        await db.execute(
+            select(func.count(), func.min(StripeWebhookEvent.created_at)).where(StripeWebhookEvent.status == PENDING)
+        )
+    ).one()
+    return {
+        "pending": pending,
+        "oldest_pending_seconds": (datetime.now(UTC) - oldest).total_seconds() if oldest is not None else 0.0,
+    }
+
+
+stripe_event_worker = StripeEventWorker(
+    poll_interval=STRIPE_EVENT_POLL_SECONDS,
+    max_attempts=STRIPE_EVENT_MAX_ATTEMPTS,
+    retry_base_seconds=STRIPE_EVENT_RETRY_BASE_SECONDS,
+    retry_max_seconds=STRIPE_EVENT_RETRY_MAX_SECONDS,
+)
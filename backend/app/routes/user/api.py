@@ -1,8 +1,25 @@
+from datetime import UTC
 from datetime import date
 from datetime import datetime
 from typing import List
 
 from pydantic import BaseModel
+from pydantic import field_validator
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """
+    Convert a datetime to naive UTC, matching the `timestamp without time zone` columns.
+
+    Args:
+        value (datetime): A naive (assumed UTC) or timezone-aware datetime.
+
+    Returns:
+        datetime: The same instant as a naive UTC datetime.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(UTC).replace(tzinfo=None)
 
 
 class BlockedPattern(BaseModel):
@@ -42,6 +59,92 @@ class SyncBlockedPatternsResponse(BaseModel):
     blocked_patterns: List[BlockedPattern]
 
 
+class BlocklistChange(BaseModel):
+    """
+    Represents a single change to a blocklist
+    Attributes:
+        pattern (str): The blocked URL pattern.
+        created_at (str | None): The creation timestamp of an added pattern.
+        deleted (bool): Whether the pattern was removed (a tombstone).
+    """
+
+    pattern: str
+    created_at: str | None = None
+    deleted: bool = False
+
+
+class BlocklistDeltaRequest(BaseModel):
+    """
+    Represents the request to exchange blocklist changes since a known revision
+    Attributes:
+        since_revision (int): The last revision the client has seen, 0 for a full snapshot.
+        changes (list[BlocklistChange]): The client's local changes since that revision.
+    """
+
+    since_revision: int = 0
+    changes: List[BlocklistChange] = []
+
+
+class BlocklistDeltaResponse(BaseModel):
+    """
+    Represents the response to a blocklist delta sync
+    Attributes:
+        revision (int): The blocklist revision after applying the client's changes.
+        changes (list[BlocklistChange]): Server-side changes since `since_revision` the client has not seen.
+    """
+
+    revision: int
+    changes: List[BlocklistChange]
+
+
+class RedundantPattern(BaseModel):
+    """
+    Represents a blocklist pattern made redundant by another one
+    Attributes:
+        pattern (str): The redundant pattern.
+        subsumed_by (str): The kept pattern that blocks every URL it blocks.
+    """
+
+    pattern: str
+    subsumed_by: str
+
+
+class BlocklistCompactionResponse(BaseModel):
+    """
+    Represents the minimal equivalent form of a blocklist
+    Attributes:
+        revision (int): The blocklist revision that was analyzed.
+        patterns (list[str]): The patterns to keep, oldest first; they block exactly the same URLs.
+        redundant (list[RedundantPattern]): The patterns that can be removed.
+    """
+
+    revision: int
+    patterns: list[str]
+    redundant: list[RedundantPattern]
+
+
+class ClassifyUrlsRequest(BaseModel):
+    """
+    Represents a batch of URLs to check against the blocklist
+    Attributes:
+        urls (list[str]): The URLs to classify.
+    """
+
+    urls: list[str]
+
+
+class ClassifyUrlsResponse(BaseModel):
+    """
+    Represents the blocklist verdict for a batch of URLs
+    Attributes:
+        revision (int): The blocklist revision the URLs were checked against.
+        patterns (list[str | None]): Per URL, in request order, the pattern that blocks it, or None.
+    """
+
+    revision: int
+    patterns: list[str | None]
+
+
 class BlockingHistoryRecord(BaseModel):
     url: str
     pattern: str
@@ -50,11 +153,55 @@ class BlockingHistoryRecord(BaseModel):
     class Config:
         from_attributes = True
 
+    @field_validator("timestamp")
+    @classmethod
+    def normalize_timestamp(cls, value: datetime) -> datetime:
+        return to_naive_utc(value)
+
 
 class BlockingHistoryRequest(BaseModel):
     blocking_history: list[BlockingHistoryRecord]
 
 
+class ColumnarBlockingHistoryRequest(BaseModel):
+    """
+    Represents a blocking history upload in the compact columnar encoding.
+
+    Entry i has url `url_prefixes[url_prefix_ids[i]] + url_suffixes[i]`, pattern `patterns[pattern_ids[i]]`, and a
+    timestamp of `base_timestamp_ms` plus the sum of `timestamp_deltas_ms[0..i]`, in milliseconds since the epoch.
+
+    Attributes:
+        patterns (list[str]): Distinct patterns.
+        pattern_ids (list[int]): Index into `patterns`, per entry.
+        url_prefixes (list[str]): Distinct url prefixes, typically scheme and host.
+        url_prefix_ids (list[int]): Index into `url_prefixes`, per entry.
+        url_suffixes (list[str]): The rest of the url, per entry.
+        base_timestamp_ms (int): Epoch milliseconds the deltas start from.
+        timestamp_deltas_ms (list[int]): Milliseconds since the previous entry (or the base, for the first one).
+    """
+
+    patterns: list[str]
+    pattern_ids: list[int]
+    url_prefixes: list[str]
+    url_prefix_ids: list[int]
+    url_suffixes: list[str]
+    base_timestamp_ms: int = 0
+    timestamp_deltas_ms: list[int]
+
+
+class BlockingHistoryPage(BaseModel):
+    """
+    Represents one page of a user's blocking history, oldest first.
+
+    Attributes:
+        items (list[BlockingHistoryRecord]): The entries on this page.
+        next_cursor (str | None): Opaque cursor for the following page, or None on the last page.
+    """
+
+    items: list[BlockingHistoryRecord]
+    next_cursor: str | None = None
+
+
 class GetStatsResponse(BaseModel):
     """
     Represents the response to a get statistics request.
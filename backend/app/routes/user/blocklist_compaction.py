@@ -0,0 +1,123 @@
+import re
+from collections.abc import Sequence
+
+# The extension's `.` never matches these, so a literal one cannot be covered by a wildcard; leave such patterns be.
+_LINE_TERMINATORS = re.compile("[\n\r\u2028\u2029]")
+_WILDCARD_RUN = re.compile(r"[*?]+")
+
+
+def normalize_pattern(pattern: str) -> str | None:
+    """
+    Rewrite a blocklist pattern to a canonical pattern that blocks exactly the same URLs.
+
+    ASCII letters are lowercased, since matching ignores case. Each run of wildcards becomes its `?`s followed by
+    at most one `*`, and stars at either end are dropped, since a pattern may match anywhere in the URL anyway.
+    Patterns that only differ in these respects normalize to the same string.
+
+    Args:
+        pattern (str): The blocklist pattern.
+
+    Returns:
+        str | None: The canonical pattern, or None if the pattern contains a line terminator and is left alone.
+    """
+    if _LINE_TERMINATORS.search(pattern):
+        return None
+    folded = "".join(c.lower() if c.isascii() else c for c in pattern)
+
+    def canonical_run(run: re.Match) -> str:
+        at_edge = run.start() == 0 or run.end() == len(folded)
+        star = "*" in run.group() and not at_edge
+        return "?" * run.group().count("?") + ("*" if star else "")
+
+    return _WILDCARD_RUN.sub(canonical_run, folded)
+
+
+def _literal_text(normalized: str) -> str:
+    # Literal runs separated by a character no pattern literal can contain, for substring pre-checks.
+    return _WILDCARD_RUN.sub("\0", normalized)
+
+
+def _covers(general: str, specific: str) -> bool:
+    """
+    Whether every URL matched by `specific` is matched by `general`; both normalized and wrapped in stars.
+
+    `general` is matched against `specific` read as a word in which a `*` can only be absorbed by a `*`, a `?` by
+    a `?` or `*`, and a literal by the same literal, a `?` or a `*`. Success proves containment; a failure can in
+    rare cases miss one, which only leaves a redundant pattern in place.
+    """
+    reachable = [True] + [False] * len(specific)
+    for token in general:
+        if token == "*":
+            seen = False
+            for position, matched in enumerate(reachable):
+                seen = seen or matched
+                reachable[position] = seen
+        else:
+            step = [False] * (len(specific) + 1)
+            for position, symbol in enumerate(specific):
+                if reachable[position] and (symbol != "*" if token == "?" else symbol == token):
+                    step[position + 1] = True
+            reachable = step
+    return reachable[-1]
+
+
+def subsumes(general: str, specific: str) -> bool:
+    """
+    Check whether one blocklist pattern blocks every URL another one blocks.
+
+    Args:
+        general (str): The pattern that may make the other redundant.
+        specific (str): The pattern that may be redundant.
+
+    Returns:
+        bool: True if `general` provably blocks every URL `specific` blocks. Equivalent patterns subsume each other.
+    """
+    return _subsumes_normalized(normalize_pattern(general), normalize_pattern(specific))
+
+
+def _subsumes_normalized(general: str | None, specific: str | None) -> bool:
+    if general is None or specific is None:
+        return False
+    if general == specific:
+        return True
+    # Every literal run of `general` has to be matched by consecutive literals of `specific`.
+    specific_text = _literal_text(specific)
+    if any(run not in specific_text for run in _WILDCARD_RUN.split(general) if run):
+        return False
+    return _covers(f"*{general}*", f"*{specific}*")
+
+
+def compact_patterns(patterns: Sequence[str]) -> tuple[list[str], dict[str, str]]:
+    """
+    Drop the patterns whose URLs are all blocked by another pattern of the same blocklist.
+
+    Of equivalent patterns, e.g. case variants, the first one is kept. The result blocks exactly the URLs the
+    original list blocks, although a URL may be attributed to a different pattern than before.
+
+    Args:
+        patterns (Sequence[str]): The blocklist, oldest first.
+
+    Returns:
+        tuple[list[str], dict[str, str]]: The kept patterns in their original order and spelling, and for each
+        dropped pattern, the kept pattern that blocks everything it did.
+    """
+    normalized = {pattern: normalize_pattern(pattern) for pattern in patterns}
+    kept: dict[str, None] = {}
+    covered_by: dict[str, str] = {}
+    for pattern in patterns:
+        if pattern in kept or pattern in covered_by:
+            continue
+        cover = next((k for k in kept if _subsumes_normalized(normalized[k], normalized[pattern])), None)
+        if cover is not None:
+            covered_by[pattern] = cover
+            continue
+        for other in [k for k in kept if _subsumes_normalized(normalized[pattern], normalized[k])]:
+            del kept[other]
+            covered_by[other] = pattern
+        kept[pattern] = None
+    # A pattern dropped in favour of one that was dropped itself later is covered by that one's cover.
+    for pattern, cover in covered_by.items():
+        while cover not in kept:
+            cover = covered_by[cover]
+        covered_by[pattern] = cover
+    return list(kept), covered_by
@@ -0,0 +1,137 @@
+from datetime import UTC
+from datetime import datetime
+
+from sqlalchemy import Boolean
+from sqlalchemy import DateTime
+from sqlalchemy import String
+from sqlalchemy import and_
+from sqlalchemy import case
+from sqlalchemy import column
+from sqlalchemy import func
+from sqlalchemy import literal
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import BlockedPattern
+from database.models import BlocklistRevision
+from routes.user.api import BlocklistChange
+from routes.user.api import to_naive_utc
+
+
+def _changed_since(supabase_user_id: str, since_revision: int, exclude: list[str]):
+    """Join condition selecting the user's rows changed after `since_revision`, minus the client's own changes."""
+    condition = and_(
+        BlockedPattern.supabase_user_id == supabase_user_id,
+        BlockedPattern.revision > since_revision,
+        # A full snapshot has no use for tombstones.
+        or_(literal(since_revision) > 0, BlockedPattern.deleted.is_(False)),
+    )
+    if exclude:
+        condition = and_(condition, BlockedPattern.pattern.not_in(exclude))
+    return condition
+
+
+async def apply_blocklist_changes(
+    db: AsyncSession,
+    supabase_user_id: str,
+    since_revision: int | None,
+    changes: list[BlocklistChange],
+) -> tuple[int, list[BlocklistChange]]:
+    """
+    Apply a client's blocklist changes and collect the server-side changes it has not seen.
+
+    When there are changes, this bumps the user's revision, which locks it until the caller commits, then upserts
+    every change (a removal becomes a tombstone) stamped with the new revision, and reads back the rows changed after
+    `since_revision`, in three statements. Patterns the client just changed are excluded from the result since the
+    client already has them. Without changes it only reads the current revision and the changed rows, in one.
+
+    Args:
+        db (AsyncSession): The database session. The caller commits.
+        supabase_user_id (str): The user whose blocklist is synced.
+        since_revision (int | None): The last revision the client has seen, or None to skip reading changes.
+        changes (list[BlocklistChange]): The client's changes. The last change to a pattern wins.
+
+    Returns:
+        tuple[int, list[BlocklistChange]]: The new revision and the server-side changes.
+    """
+    latest = {change.pattern: change for change in changes}
+    now = datetime.now(UTC).replace(tzinfo=None)
+    rows = [
+        (
+            change.pattern,
+            to_naive_utc(datetime.fromisoformat(change.created_at)) if change.created_at else now,
+            change.deleted,
+        )
+        for change in latest.values()
+    ]
+
+    if rows:
+        # Lock the user's revision row in a statement of its own. Under READ COMMITTED each later statement takes a
+        # fresh snapshot, so the read below sees every change committed by whoever held the lock before; read in the
+        # same statement, changes committed while this one waited for the lock would be skipped yet stamped below
+        # the revision returned to the client.
+        new_revision = (
+            await db.execute(
+                pg_insert(BlocklistRevision)
+                .values(supabase_user_id=supabase_user_id, revision=1)
+                .on_conflict_do_update(
+                    index_elements=[BlocklistRevision.supabase_user_id],
+                    set_={"revision": BlocklistRevision.revision + 1},
+                )
+                .returning(BlocklistRevision.revision)
+            )
+        ).scalar_one()
+        incoming = values(
+            column("pattern", String), column("created_at", DateTime), column("deleted", Boolean), name="incoming"
+        ).data(rows)
+        upsert = pg_insert(BlockedPattern).from_select(
+            ["supabase_user_id", "pattern", "created_at", "revision", "deleted"],
+            select(
+                literal(supabase_user_id, String),
+                incoming.c.pattern,
+                incoming.c.created_at,
+                literal(new_revision),
+                incoming.c.deleted,
+            ),
+        )
+        upsert = upsert.on_conflict_do_update(
+            constraint="uq_blocked_pattern_user_pattern",
+            set_={
+                "deleted": upsert.excluded.deleted,
+                "revision": upsert.excluded.revision,
+                # A re-added pattern takes the client's creation time, a tombstone keeps the original one.
+                "created_at": case(
+                    (upsert.excluded.deleted, BlockedPattern.created_at), else_=upsert.excluded.created_at
+                ),
+            },
+            # Re-sending a pattern's current state is not a change and must not bump its revision.
+            where=BlockedPattern.deleted.is_distinct_from(upsert.excluded.deleted),
+        )
+        await db.execute(upsert)
+        revision = select(literal(new_revision).label("revision")).cte("revision")
+    else:
+        current = (
+            select(BlocklistRevision.revision)
+            .where(BlocklistRevision.supabase_user_id == supabase_user_id)
+            .scalar_subquery()
+        )
+        revision = select(func.coalesce(current, 0).label("revision")).cte("revision")
+    statement = select(revision.c.revision)
+
+    if since_revision is not None:
+        statement = statement.add_columns(BlockedPattern.pattern, BlockedPattern.created_at, BlockedPattern.deleted)
+        statement = statement.select_from(revision).outerjoin(
+            BlockedPattern, _changed_since(supabase_user_id, since_revision, list(latest))
+        )
+    result = (await db.execute(statement)).all()
+
+    new_revision = result[0].revision
+    server_changes = [
+        BlocklistChange(pattern=row.pattern, created_at=row.created_at.isoformat(), deleted=row.deleted)
+        for row in result
+        if since_revision is not None and row.pattern is not None
+    ]
+    return new_revision, server_changes
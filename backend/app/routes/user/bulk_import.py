@@ -0,0 +1,365 @@
+import csv
+import io
+import json
+import os
+from collections.abc import AsyncIterator
+from datetime import UTC
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import String
+from sqlalchemy import bindparam
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database.partitions import retention_cutoff
+from routes.user.history_ingest import HISTORY_LOCK_CLASS
+
+load_dotenv()
+
+# Staged rows merged per transaction; each batch holds whole users, so a larger user makes a larger batch.
+IMPORT_BATCH_ROWS = int(os.environ.get("IMPORT_BATCH_ROWS", "200000"))
+# Users per transaction, which takes one advisory lock per user; the shared lock table is small.
+IMPORT_BATCH_USERS = int(os.environ.get("IMPORT_BATCH_USERS", "500"))
+# Sort memory of a merge, enough to de-duplicate a default batch without spilling to disk.
+IMPORT_WORK_MEM = os.environ.get("IMPORT_WORK_MEM", "128MB")
+
+IMPORT_FORMATS = ("csv", "ndjson")
+# Columns of each kind of import, as named in CSV headers and NDJSON keys; the rest are optional.
+IMPORT_COLUMNS = {
+    "history": ("supabase_user_id", "url", "pattern", "timestamp"),
+    "blocklist": ("supabase_user_id", "pattern", "created_at"),
+}
+_REQUIRED_COLUMNS = {"history": {"url", "pattern", "timestamp"}, "blocklist": {"pattern"}}
+
+# Same trick as the exports: valid JSON never contains a raw \x01 or \x02, so every line is copied as one value.
+_JSON_LINES = {"format": "csv", "quote": "\x01", "delimiter": "\x02"}
+
+_MERGE_HISTORY_SQL = text(
+    """
+    WITH incoming AS (
+        -- The last row for a timestamp wins, as in uploads.
+        SELECT DISTINCT ON (supabase_user_id, timestamp) supabase_user_id, url, pattern, timestamp
+        FROM (
+            SELECT line, supabase_user_id, url, pattern, timestamp::timestamptz AT TIME ZONE 'UTC' AS timestamp
+            FROM import_history
+            WHERE supabase_user_id = ANY(:users)
+        ) staged
+        WHERE timestamp >= :cutoff
+        ORDER BY supabase_user_id, timestamp, line DESC
+    ),
+    existing AS (
+        SELECT h.supabase_user_id, h.timestamp, h.url, h.pattern
+        FROM blocking_history h
+        JOIN incoming i ON h.supabase_user_id = i.supabase_user_id AND h.timestamp = i.timestamp
+        WHERE h.supabase_user_id = ANY(:users)
+    ),
+    -- The batch holds its users' upload locks, so no row can appear or change between reading `existing` and
+    -- writing: plain inserts and updates do, without the cost of ON CONFLICT's speculative insertion.
+    inserted AS (
+        INSERT INTO blocking_history (supabase_user_id, url, pattern, timestamp)
+        SELECT i.supabase_user_id, i.url, i.pattern, i.timestamp
+        FROM incoming i
+        WHERE NOT EXISTS (
+            SELECT FROM existing e WHERE e.supabase_user_id = i.supabase_user_id AND e.timestamp = i.timestamp
+        )
+        RETURNING supabase_user_id, pattern, timestamp, NULL::varchar AS previous_pattern
+    ),
+    changed AS MATERIALIZED (
+        SELECT i.supabase_user_id, i.url, i.pattern, i.timestamp, e.pattern AS previous_pattern
+        FROM incoming i
+        JOIN existing e ON e.supabase_user_id = i.supabase_user_id AND e.timestamp = i.timestamp
+        WHERE e.url <> i.url OR e.pattern <> i.pattern
+    ),
+    updated AS (
+        UPDATE blocking_history h
+        SET url = c.url, pattern = c.pattern, updated_at = now()
+        FROM changed c
+        WHERE h.supabase_user_id = c.supabase_user_id AND h.timestamp = c.timestamp
+        RETURNING h.supabase_user_id, h.pattern, h.timestamp, c.previous_pattern
+    ),
+    changes AS (
+        SELECT * FROM inserted UNION ALL SELECT * FROM updated
+    ),
+    -- The rollup updates of apply_history_changes, for every user of the batch at once, from one pass over the
+    -- changed rows.
+    summary AS (
+        SELECT supabase_user_id, date(timestamp) AS day, pattern, previous_pattern, count(*) AS rows,
+            max(timestamp) AS last_blocked
+        FROM changes
+        GROUP BY 1, 2, 3, 4
+    ),
+    user_rollups AS (
+        INSERT INTO blocking_stats_user (supabase_user_id, total_tabs_blocked, last_blocked)
+        SELECT supabase_user_id, sum(rows), max(last_blocked) FROM summary WHERE previous_pattern IS NULL GROUP BY 1
+        ON CONFLICT (supabase_user_id) DO UPDATE SET
+            total_tabs_blocked = blocking_stats_user.total_tabs_blocked + excluded.total_tabs_blocked,
+            last_blocked = greatest(blocking_stats_user.last_blocked, excluded.last_blocked)
+    ),
+    daily_rollups AS (
+        INSERT INTO blocking_stats_daily (supabase_user_id, day, tabs_blocked)
+        SELECT supabase_user_id, day, sum(rows) FROM summary WHERE previous_pattern IS NULL GROUP BY 1, 2
+        ON CONFLICT (supabase_user_id, day) DO UPDATE SET
+            tabs_blocked = blocking_stats_daily.tabs_blocked + excluded.tabs_blocked
+    ),
+    pattern_rollups AS (
+        INSERT INTO blocking_stats_pattern (supabase_user_id, pattern, count)
+        SELECT supabase_user_id, pattern, sum(delta)
+        FROM (
+            SELECT supabase_user_id, pattern, rows AS delta FROM summary
+            UNION ALL
+            SELECT supabase_user_id, previous_pattern, -rows FROM summary WHERE previous_pattern IS NOT NULL
+        ) deltas
+        GROUP BY 1, 2
+        HAVING sum(delta) <> 0
+        ON CONFLICT (supabase_user_id, pattern) DO UPDATE SET count = blocking_stats_pattern.count + excluded.count
+    ),
+    versions AS (
+        INSERT INTO blocking_history_version (supabase_user_id, version)
+        SELECT DISTINCT supabase_user_id, 1 FROM summary
+        ON CONFLICT (supabase_user_id) DO UPDATE SET version = blocking_history_version.version + 1
+    )
+    SELECT coalesce(sum(rows) FILTER (WHERE previous_pattern IS NULL), 0)::bigint,
+        coalesce(sum(rows) FILTER (WHERE previous_pattern IS NOT NULL), 0)::bigint
+    FROM summary
+    """
+).bindparams(bindparam("users", type_=ARRAY(String)))
+
+_DELETE_EMPTIED_PATTERNS_SQL = text(
+    "DELETE FROM blocking_stats_pattern WHERE supabase_user_id = ANY(:users) AND count <= 0"
+).bindparams(bindparam("users", type_=ARRAY(String)))
+
+_MERGE_BLOCKLIST_SQL = text(
+    """
+    WITH incoming AS (
+        SELECT DISTINCT ON (supabase_user_id, pattern) supabase_user_id, pattern,
+            coalesce(created_at::timestamptz AT TIME ZONE 'UTC', now() AT TIME ZONE 'UTC') AS created_at
+        FROM import_blocklist
+        WHERE supabase_user_id = ANY(:users)
+        ORDER BY supabase_user_id, pattern, line
+    ),
+    -- Patterns already on a blocklist are left alone; only new and previously removed ones are changes.
+    added AS (
+        SELECT i.*
+        FROM incoming i
+        LEFT JOIN blocked_pattern p ON p.supabase_user_id = i.supabase_user_id AND p.pattern = i.pattern
+        WHERE p.id IS NULL OR p.deleted
+    ),
+    revisions AS (
+        INSERT INTO blocklist_revision (supabase_user_id, revision)
+        SELECT DISTINCT supabase_user_id, 1 FROM added
+        ON CONFLICT (supabase_user_id) DO UPDATE SET revision = blocklist_revision.revision + 1
+        RETURNING supabase_user_id, revision
+    ),
+    applied AS (
+        INSERT INTO blocked_pattern (supabase_user_id, pattern, created_at, revision, deleted)
+        SELECT a.supabase_user_id, a.pattern, a.created_at, r.revision, false
+        FROM added a
+        JOIN revisions r ON r.supabase_user_id = a.supabase_user_id
+        ON CONFLICT ON CONSTRAINT uq_blocked_pattern_user_pattern DO UPDATE SET
+            deleted = false, revision = excluded.revision, created_at = excluded.created_at
+        WHERE blocked_pattern.deleted
+        RETURNING supabase_user_id
+    )
+    SELECT count(*), count(DISTINCT supabase_user_id) FROM applied
+    """
+).bindparams(bindparam("users", type_=ARRAY(String)))
+
+
+class BulkImportError(Exception):
+    """Raised when an import file does not have the columns its kind of import needs."""
+
+
+async def _split_header(source: AsyncIterator[bytes]) -> tuple[list[str], AsyncIterator[bytes]]:
+    head = b""
+    async for chunk in source:
+        head += chunk
+        if b"\n" in head:
+            break
+    line, _, rest = head.partition(b"\n")
+    columns = next(csv.reader(io.StringIO(line.decode("utf-8-sig"))), [])
+
+    async def body() -> AsyncIterator[bytes]:
+        if rest:
+            yield rest
+        async for chunk in source:
+            yield chunk
+
+    return [name.strip() for name in columns], body()
+
+
+def _check_columns(kind: str, columns: list[str], supabase_user_id: str | None) -> None:
+    unknown = set(columns) - set(IMPORT_COLUMNS[kind])
+    missing = _REQUIRED_COLUMNS[kind] - set(columns)
+    if supabase_user_id is None and "supabase_user_id" not in columns:
+        missing.add("supabase_user_id")
+    problems = [
+        f"{label}: {', '.join(sorted(names))}" for label, names in (("unknown", unknown), ("missing", missing)) if names
+    ]
+    if problems:
+        raise BulkImportError(
+            f"A {kind} import has the columns {', '.join(IMPORT_COLUMNS[kind])}"
+            f" (supabase_user_id unless a user is given); {'; '.join(problems)}"
+        )
+
+
+async def stage_import(
+    connection: AsyncConnection,
+    kind: str,
+    source: AsyncIterator[bytes],
+    file_format: str,
+    supabase_user_id: str | None = None,
+) -> int:
+    """
+    Load an import file into a temporary staging table with COPY FROM.
+
+    Values are staged as text, so a bad value fails the merge with Postgres' own error, not the load. The staging
+    table is import_<kind>; it lives until the connection closes.
+
+    Args:
+        connection (AsyncConnection): The connection the import runs on. The caller commits.
+        kind (str): "history" or "blocklist", see IMPORT_COLUMNS.
+        source (AsyncIterator[bytes]): The uncompressed file contents. CSV needs a header row naming its columns;
+            NDJSON has one object per line with those keys.
+        file_format (str): One of IMPORT_FORMATS.
+        supabase_user_id (str | None): The user of rows that do not name one.
+
+    Returns:
+        int: The number of rows staged.
+
+    Raises:
+        BulkImportError: If the file's columns do not fit the kind of import.
+    """
+    table = f"import_{kind}"
+    columns = IMPORT_COLUMNS[kind]
+    nullable = {"created_at"}
+    definitions = ", ".join(f"{name} text{'' if name in nullable else ' NOT NULL'}" for name in columns)
+    await connection.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    await connection.execute(
+        text(f"CREATE TEMP TABLE {table} (line bigint GENERATED BY DEFAULT AS IDENTITY, {definitions})")
+    )
+    if supabase_user_id is not None:
+        literal = await connection.scalar(text("SELECT quote_literal(:value)"), {"value": supabase_user_id})
+        await connection.execute(text(f"ALTER TABLE {table} ALTER supabase_user_id SET DEFAULT {literal}"))
+    driver = (await connection.get_raw_connection()).driver_connection
+
+    if file_format == "csv":
+        header, body = await _split_header(source)
+        _check_columns(kind, header, supabase_user_id)
+        status = await driver.copy_to_table(table, source=body, columns=header, format="csv")
+        staged = int(status.split()[-1])
+    else:
+        await connection.execute(text("DROP TABLE IF EXISTS import_lines"))
+        await connection.execute(
+            text("CREATE TEMP TABLE import_lines (line bigint GENERATED ALWAYS AS IDENTITY, document text)")
+        )
+        await driver.copy_to_table("import_lines", source=source, columns=["document"], **_JSON_LINES)
+        first = await connection.scalar(
+            text("SELECT document FROM import_lines WHERE document IS NOT NULL ORDER BY line LIMIT 1")
+        )
+        _check_columns(kind, list(json.loads(first)) if first else [], supabase_user_id)
+        record = ", ".join(f"{name} text" for name in columns)
+        values = ", ".join(
+            f"coalesce(r.{name}, :supabase_user_id)" if name == "supabase_user_id" else f"r.{name}" for name in columns
+        )
+        result = await connection.execute(
+            text(
+                f"INSERT INTO {table} (line, {', '.join(columns)}) SELECT l.line, {values} "
+                f"FROM import_lines l, json_to_record(l.document::json) AS r({record}) WHERE l.document IS NOT NULL"
+            ),
+            {"supabase_user_id": supabase_user_id},
+        )
+        staged = result.rowcount
+        await connection.execute(text("DROP TABLE import_lines"))
+
+    # Temporary tables are never analyzed automatically; the merges need the row counts per user.
+    await connection.execute(text(f"CREATE INDEX ON {table} (supabase_user_id)"))
+    await connection.execute(text(f"ANALYZE {table}"))
+    return staged
+
+
+async def plan_batches(
+    connection: AsyncConnection,
+    kind: str,
+    batch_rows: int = IMPORT_BATCH_ROWS,
+    batch_users: int = IMPORT_BATCH_USERS,
+) -> list[tuple[list[str], int]]:
+    """
+    Group the staged users into batches of about `batch_rows` rows and at most `batch_users` users.
+
+    Args:
+        connection (AsyncConnection): The connection holding the staging table.
+        kind (str): "history" or "blocklist".
+        batch_rows (int): Target rows per batch.
+        batch_users (int): Maximum users per batch.
+
+    Returns:
+        list[tuple[list[str], int]]: The users of each batch and its number of staged rows.
+    """
+    result = await connection.execute(
+        text(f"SELECT supabase_user_id, count(*) FROM import_{kind} GROUP BY 1 ORDER BY 1")
+    )
+    batches: list[tuple[list[str], int]] = []
+    users: list[str] = []
+    rows = 0
+    for supabase_user_id, count in result:
+        if users and (rows + count > batch_rows or len(users) >= batch_users):
+            batches.append((users, rows))
+            users, rows = [], 0
+        users.append(supabase_user_id)
+        rows += count
+    if users:
+        batches.append((users, rows))
+    return batches
+
+
+async def merge_history_batch(connection: AsyncConnection, users: list[str]) -> tuple[int, int]:
+    """
+    Merge the staged history of some users into blocking_history, in one set-based statement.
+
+    Rows are de-duplicated on (supabase_user_id, timestamp) exactly like uploads: the last staged row for a
+    timestamp wins, identical rows are left untouched, changed ones are updated, and history older than the
+    retention period is skipped. The stats rollups and history versions are updated in the same statement, under
+    the users' upload locks, so uploads and the write-behind queue can keep running during an import.
+
+    Args:
+        connection (AsyncConnection): The connection holding import_history. The caller commits.
+        users (list[str]): The users of this batch.
+
+    Returns:
+        tuple[int, int]: The numbers of rows inserted and updated.
+    """
+    cutoff = retention_cutoff(datetime.now(UTC).date()) or datetime.min
+    # Timestamps without an offset are UTC, like uploaded ones.
+    await connection.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+    await connection.execute(text("SELECT set_config('work_mem', :work_mem, true)"), {"work_mem": IMPORT_WORK_MEM})
+    await connection.execute(
+        text(
+            "SELECT pg_advisory_xact_lock(:lock_class, hashtext(key)) FROM unnest(:users) key ORDER BY hashtext(key)"
+        ).bindparams(bindparam("users", type_=ARRAY(String))),
+        {"lock_class": HISTORY_LOCK_CLASS, "users": users},
+    )
+    inserted, updated = (await connection.execute(_MERGE_HISTORY_SQL, {"users": users, "cutoff": cutoff})).one()
+    if updated:
+        await connection.execute(_DELETE_EMPTIED_PATTERNS_SQL, {"users": users})
+    return inserted, updated
+
+
+async def merge_blocklist_batch(connection: AsyncConnection, users: list[str]) -> tuple[int, int]:
+    """
+    Add the staged patterns of some users to their blocklists, in one set-based statement.
+
+    Patterns a user already has are skipped and removed ones are restored. Every user whose blocklist changes gets
+    one new revision, so synced clients pick up all imported patterns in their next delta.
+
+    Args:
+        connection (AsyncConnection): The connection holding import_blocklist. The caller commits.
+        users (list[str]): The users of this batch.
+
+    Returns:
+        tuple[int, int]: The numbers of patterns added and of users whose blocklist changed.
+    """
+    await connection.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+    added, changed_users = (await connection.execute(_MERGE_BLOCKLIST_SQL, {"users": users})).one()
+    return added, changed_users
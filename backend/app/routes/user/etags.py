@@ -0,0 +1,108 @@
+import hashlib
+
+from fastapi import Request
+from fastapi import Response
+from fastapi import status
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import BlockingHistoryVersion
+from database.models import BlocklistRevision
+
+# Responses may be reused only after revalidating with the ETag, and never by shared caches.
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(kind: str, supabase_user_id: str, version: int) -> str:
+    """
+    Build a strong ETag from a per-user version counter.
+
+    The user id is folded in so that a browser cache shared between accounts can never match across users.
+
+    Args:
+        kind (str): Which resource the version belongs to, e.g. "blocklist".
+        supabase_user_id (str): The user the resource belongs to.
+        version (int): The user's version counter for the resource.
+
+    Returns:
+        str: The quoted ETag.
+    """
+    user_tag = hashlib.sha256(supabase_user_id.encode("utf-8")).hexdigest()[:12]
+    return f'"{kind}-{user_tag}-{version}"'
+
+
+async def blocklist_revision(db: AsyncSession, supabase_user_id: str) -> int:
+    """Read the user's blocklist revision, 0 if the user never changed their blocklist."""
+    revision = await db.scalar(
+        select(BlocklistRevision.revision).where(BlocklistRevision.supabase_user_id == supabase_user_id)
+    )
+    return revision or 0
+
+
+async def blocklist_etag(db: AsyncSession, supabase_user_id: str) -> str:
+    """Compute the blocklist ETag from the user's blocklist revision."""
+    return make_etag("blocklist", supabase_user_id, await blocklist_revision(db, supabase_user_id))
+
+
+async def history_version(db: AsyncSession, supabase_user_id: str) -> int:
+    """Read the user's blocking history version, 0 if the user never uploaded history."""
+    version = await db.scalar(
+        select(BlockingHistoryVersion.version).where(BlockingHistoryVersion.supabase_user_id == supabase_user_id)
+    )
+    return version or 0
+
+
+async def bump_history_version(db: AsyncSession, supabase_user_id: str) -> None:
+    """
+    Invalidate the user's history and stats ETags.
+
+    Must run in the same transaction as the history write so the validator never runs ahead of the data.
+
+    Args:
+        db (AsyncSession): The session holding the history write. The caller commits.
+        supabase_user_id (str): The user whose history changed.
+    """
+    await db.execute(
+        pg_insert(BlockingHistoryVersion)
+        .values(supabase_user_id=supabase_user_id, version=1)
+        .on_conflict_do_update(
+            index_elements=[BlockingHistoryVersion.supabase_user_id],
+            set_={"version": BlockingHistoryVersion.version + 1},
+        )
+    )
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check a request's If-None-Match header against an ETag.
+
+    Args:
+        request (Request): The incoming request.
+        etag (str): The current ETag of the resource.
+
+    Returns:
+        bool: True if the client's cached representation is current.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so a W/ prefix added by a proxy still matches.
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    """Build a bodiless 304 response for a matching ETag."""
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+    )
+
+
+def set_etag(response: Response, etag: str) -> None:
+    """Attach the validator headers to a full response."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
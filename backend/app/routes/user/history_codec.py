@@ -0,0 +1,201 @@
+import os
+import zlib
+from collections.abc import Sequence
+from datetime import datetime
+from datetime import timedelta
+from functools import cache
+from itertools import accumulate
+from types import ModuleType
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+from routes.user.api import BlockingHistoryRecord
+from routes.user.api import BlockingHistoryRequest
+from routes.user.api import ColumnarBlockingHistoryRequest
+from routes.user.api import to_naive_utc
+from routes.user.history_ingest import HistoryEntry
+
+load_dotenv()
+
+# Upper bound on an upload, both as sent and decompressed, so a small compressed body cannot expand without limit.
+# The raw body, its decompressed copy and the parsed records are all held at once, several times this in total, by
+# each of the workers sharing the backend container's 512 MB.
+HISTORY_UPLOAD_MAX_BYTES = int(os.environ.get("HISTORY_UPLOAD_MAX_BYTES", str(8 * 1024 * 1024)))
+
+JSON_CONTENT_TYPE = "application/json"
+COLUMNAR_CONTENT_TYPE = "application/vnd.tablocker.history-columnar+json"
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class HistoryUploadError(Exception):
+    """
+    Raised when an upload cannot be decoded.
+
+    Attributes:
+        message (str): What was wrong with the upload.
+        status_code (int): The HTTP status to answer with.
+    """
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+@cache
+def get_zstandard() -> ModuleType:
+    """
+    Import the zstandard bindings on first use.
+
+    Returns:
+        ModuleType: The `zstandard` module.
+    """
+    import zstandard
+
+    return zstandard
+
+
+def decompress(body: bytes, content_encoding: str, max_bytes: int = HISTORY_UPLOAD_MAX_BYTES) -> bytes:
+    """
+    Undo the request's Content-Encoding.
+
+    Args:
+        body (bytes): The raw request body.
+        content_encoding (str): The Content-Encoding header: identity, gzip or zstd.
+        max_bytes (int): Maximum decompressed size.
+
+    Returns:
+        bytes: The decompressed body.
+
+    Raises:
+        HistoryUploadError: If the encoding is unsupported (415), or the body is corrupt or too large.
+    """
+    encoding = content_encoding.strip().lower()
+    if encoding in ("", "identity"):
+        return body
+    try:
+        if encoding in ("gzip", "x-gzip"):
+            decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+            data = decompressor.decompress(body, max_bytes + 1)
+            if not decompressor.eof and len(data) <= max_bytes:
+                raise HistoryUploadError("Truncated gzip body")
+        elif encoding == "zstd":
+            try:
+                zstandard = get_zstandard()
+            except ImportError:
+                raise HistoryUploadError("zstd request bodies are not supported by this server", 415)
+            try:
+                with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+                    data = reader.read(max_bytes + 1)
+            except zstandard.ZstdError as e:
+                raise HistoryUploadError(f"Could not decompress zstd body: {e}")
+        else:
+            raise HistoryUploadError(f"Unsupported Content-Encoding: {content_encoding}", 415)
+    except (zlib.error, ValueError) as e:
+        raise HistoryUploadError(f"Could not decompress {encoding} body: {e}")
+    if len(data) > max_bytes:
+        raise HistoryUploadError(f"Decompressed body exceeds {max_bytes} bytes", 413)
+    return data
+
+
+def decode_columnar(upload: ColumnarBlockingHistoryRequest) -> list[HistoryEntry]:
+    """
+    Expand a columnar upload into the entries the JSON format produces.
+
+    Args:
+        upload (ColumnarBlockingHistoryRequest): The parsed columnar upload.
+
+    Returns:
+        list[HistoryEntry]: One entry per record, with naive UTC timestamps.
+
+    Raises:
+        HistoryUploadError: If the columns differ in length or an index is out of range.
+    """
+    count = len(upload.url_suffixes)
+    if not len(upload.pattern_ids) == len(upload.url_prefix_ids) == len(upload.timestamp_deltas_ms) == count:
+        raise HistoryUploadError("Columnar upload columns differ in length")
+    try:
+        if min(upload.pattern_ids, default=0) < 0 or min(upload.url_prefix_ids, default=0) < 0:
+            raise IndexError
+        patterns = [upload.patterns[i] for i in upload.pattern_ids]
+        prefixes = [upload.url_prefixes[i] for i in upload.url_prefix_ids]
+    except IndexError:
+        raise HistoryUploadError("Columnar upload references an unknown pattern or url prefix")
+    try:
+        timestamps = [
+            _EPOCH + timedelta(milliseconds=ms)
+            for ms in accumulate(upload.timestamp_deltas_ms, initial=upload.base_timestamp_ms)
+        ][1:]
+    except OverflowError:
+        raise HistoryUploadError("Columnar upload timestamp out of range")
+    # Every column is already validated, so skip building a pydantic model per entry.
+    return [
+        HistoryEntry(prefix + suffix, pattern, timestamp)
+        for prefix, suffix, pattern, timestamp in zip(prefixes, upload.url_suffixes, patterns, timestamps)
+    ]
+
+
+def encode_columnar(records: Sequence[BlockingHistoryRecord | HistoryEntry]) -> ColumnarBlockingHistoryRequest:
+    """
+    Build the columnar encoding of some records, the inverse of `decode_columnar`.
+
+    Urls are split after their scheme and host. Timestamps are truncated to milliseconds.
+
+    Args:
+        records (Sequence[BlockingHistoryRecord | HistoryEntry]): The records to encode.
+
+    Returns:
+        ColumnarBlockingHistoryRequest: The columnar upload.
+    """
+    patterns: dict[str, int] = {}
+    prefixes: dict[str, int] = {}
+    pattern_ids, prefix_ids, suffixes, deltas = [], [], [], []
+    previous = 0
+    for record in records:
+        parts = urlsplit(record.url)
+        prefix = f"{parts.scheme}://{parts.netloc}" if parts.scheme else ""
+        pattern_ids.append(patterns.setdefault(record.pattern, len(patterns)))
+        prefix_ids.append(prefixes.setdefault(prefix, len(prefixes)))
+        suffixes.append(record.url[len(prefix) :])
+        ms = (to_naive_utc(record.timestamp) - _EPOCH) // timedelta(milliseconds=1)
+        deltas.append(ms - previous)
+        previous = ms
+    return ColumnarBlockingHistoryRequest(
+        patterns=list(patterns),
+        pattern_ids=pattern_ids,
+        url_prefixes=list(prefixes),
+        url_prefix_ids=prefix_ids,
+        url_suffixes=suffixes,
+        base_timestamp_ms=0,
+        timestamp_deltas_ms=deltas,
+    )
+
+
+def parse_history_upload(
+    body: bytes, content_type: str, content_encoding: str
+) -> list[BlockingHistoryRecord] | list[HistoryEntry]:
+    """
+    Decode a blocking history upload in whichever format the client declared.
+
+    Args:
+        body (bytes): The raw request body.
+        content_type (str): The Content-Type header, selecting the JSON or columnar format.
+        content_encoding (str): The Content-Encoding header, selecting the compression.
+
+    Returns:
+        list[BlockingHistoryRecord] | list[HistoryEntry]: The uploaded records.
+
+    Raises:
+        HistoryUploadError: If the format or encoding is unsupported or the body cannot be decoded.
+        pydantic.ValidationError: If the decoded body does not match the format's schema.
+    """
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type not in (JSON_CONTENT_TYPE, COLUMNAR_CONTENT_TYPE):
+        raise HistoryUploadError(f"Unsupported Content-Type: {content_type}", 415)
+    data = decompress(body, content_encoding)
+    # pydantic-core parses and validates in one pass, without building intermediate dicts.
+    if media_type == COLUMNAR_CONTENT_TYPE:
+        return decode_columnar(ColumnarBlockingHistoryRequest.model_validate_json(data))
+    return BlockingHistoryRequest.model_validate_json(data).blocking_history
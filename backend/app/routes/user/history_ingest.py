@@ -0,0 +1,182 @@
+import os
+from collections.abc import Mapping
+from collections.abc import Sequence
+from datetime import UTC
+from datetime import datetime
+from typing import NamedTuple
+
+from dotenv import load_dotenv
+from sqlalchemy import DateTime
+from sqlalchemy import String
+from sqlalchemy import column
+from sqlalchemy import func
+from sqlalchemy import literal
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import BlockingHistory
+from database.partitions import retention_cutoff
+from routes.user.api import BlockingHistoryRecord
+from routes.user.stats_rollups import apply_history_changes
+
+load_dotenv()
+
+# Rows per INSERT statement. Each chunk is sent as three arrays, so this bounds statement size, not bind parameters.
+HISTORY_UPSERT_CHUNK_SIZE = int(os.environ.get("HISTORY_UPSERT_CHUNK_SIZE", "10000"))
+
+# First key of the per-user advisory lock held while a user's history is written.
+HISTORY_LOCK_CLASS = 1001
+
+
+class HistoryEntry(NamedTuple):
+    """
+    A bare uploaded entry, for decoders that would otherwise build thousands of pydantic models.
+
+    Attributes:
+        url (str): The blocked URL.
+        pattern (str): The pattern that blocked it.
+        timestamp (datetime): When it was blocked, as naive UTC.
+    """
+
+    url: str
+    pattern: str
+    timestamp: datetime
+
+
+def _upsert_statement(rows: Sequence[tuple[str, BlockingHistoryRecord | HistoryEntry]]):
+    incoming = (
+        func.unnest(
+            literal([supabase_user_id for supabase_user_id, _ in rows], ARRAY(String)),
+            literal([record.url for _, record in rows], ARRAY(String)),
+            literal([record.pattern for _, record in rows], ARRAY(String)),
+            literal([record.timestamp for _, record in rows], ARRAY(DateTime)),
+        )
+        .table_valued(
+            column("supabase_user_id", String),
+            column("url", String),
+            column("pattern", String),
+            column("timestamp", DateTime),
+        )
+        .render_derived(name="incoming")
+    )
+    # Reads the statement's snapshot, i.e. the rows as they were before the upsert.
+    existing = (
+        select(BlockingHistory.supabase_user_id, BlockingHistory.timestamp, BlockingHistory.pattern)
+        .join(
+            incoming,
+            (BlockingHistory.supabase_user_id == incoming.c.supabase_user_id)
+            & (BlockingHistory.timestamp == incoming.c.timestamp),
+        )
+        .cte("existing")
+    )
+    statement = pg_insert(BlockingHistory).from_select(
+        ["supabase_user_id", "url", "pattern", "timestamp"],
+        select(incoming.c.supabase_user_id, incoming.c.url, incoming.c.pattern, incoming.c.timestamp),
+    )
+    upserted = (
+        statement.on_conflict_do_update(
+            constraint="uq_blocking_history_user_timestamp",
+            set_={
+                "url": statement.excluded.url,
+                "pattern": statement.excluded.pattern,
+                "updated_at": func.now(),
+            },
+            # Identical re-uploads are left untouched, and therefore not returned.
+            where=or_(
+                BlockingHistory.url != statement.excluded.url,
+                BlockingHistory.pattern != statement.excluded.pattern,
+            ),
+        )
+        .returning(
+            BlockingHistory.supabase_user_id, BlockingHistory.url, BlockingHistory.pattern, BlockingHistory.timestamp
+        )
+        .cte("upserted")
+    )
+    return select(
+        upserted.c.supabase_user_id,
+        upserted.c.url,
+        upserted.c.pattern,
+        upserted.c.timestamp,
+        existing.c.pattern.label("previous_pattern"),
+    ).select_from(
+        upserted.outerjoin(
+            existing,
+            (existing.c.supabase_user_id == upserted.c.supabase_user_id)
+            & (existing.c.timestamp == upserted.c.timestamp),
+        )
+    )
+
+
+async def upsert_blocking_history(
+    db: AsyncSession,
+    supabase_user_id: str,
+    records: Sequence[BlockingHistoryRecord | HistoryEntry],
+    chunk_size: int = HISTORY_UPSERT_CHUNK_SIZE,
+) -> list[HistoryEntry]:
+    """
+    Insert or update a user's blocking history entries, de-duplicated on timestamp, and update the stats rollups.
+
+    Each chunk is a single `INSERT ... ON CONFLICT DO UPDATE ... RETURNING` statement fed from arrays, so the cost
+    is one round trip per chunk however many rows are new, changed or unchanged. Uploads for the same user are
+    serialised until commit, so the rollups always see the pattern an updated entry had before.
+
+    Args:
+        db (AsyncSession): The database session. The caller commits.
+        supabase_user_id (str): The user whose history is uploaded.
+        records (Sequence[BlockingHistoryRecord | HistoryEntry]): The uploaded entries. The last entry for a
+            timestamp wins; entries older than the retention period (HISTORY_RETENTION_MONTHS) are ignored.
+        chunk_size (int): Maximum number of rows per statement.
+
+    Returns:
+        list[HistoryEntry]: The entries that were inserted or whose url or pattern changed.
+    """
+    changed = await upsert_blocking_history_many(db, {supabase_user_id: records}, chunk_size)
+    return changed.get(supabase_user_id, [])
+
+
+async def upsert_blocking_history_many(
+    db: AsyncSession,
+    uploads: Mapping[str, Sequence[BlockingHistoryRecord | HistoryEntry]],
+    chunk_size: int = HISTORY_UPSERT_CHUNK_SIZE,
+) -> dict[str, list[HistoryEntry]]:
+    """
+    Like `upsert_blocking_history`, for several users at once: their rows share the same multi-row statements.
+
+    Args:
+        db (AsyncSession): The database session. The caller commits.
+        uploads (Mapping[str, Sequence[BlockingHistoryRecord | HistoryEntry]]): Uploaded entries per user.
+        chunk_size (int): Maximum number of rows per statement, across users.
+
+    Returns:
+        dict[str, list[HistoryEntry]]: Per user with changes, the entries that were inserted or changed.
+    """
+    # Entries older than the retention period would only be removed again, and counted twice by the rollups.
+    cutoff = retention_cutoff(datetime.now(UTC).date()) or datetime.min
+    # ON CONFLICT cannot touch the same row twice in one statement, so drop duplicate timestamps first.
+    rows = [
+        (supabase_user_id, record)
+        for supabase_user_id, records in uploads.items()
+        for record in {record.timestamp: record for record in records}.values()
+        if record.timestamp >= cutoff
+    ]
+    if not rows:
+        return {}
+    # Lock in a fixed order, so two transactions writing overlapping sets of users cannot deadlock.
+    user_ids = [supabase_user_id for supabase_user_id, records in uploads.items() if records]
+    keys = func.unnest(literal(user_ids, ARRAY(String))).table_valued(column("key", String)).render_derived("keys")
+    hashed = func.hashtext(keys.c.key)
+    await db.execute(select(func.pg_advisory_xact_lock(HISTORY_LOCK_CLASS, hashed)).select_from(keys).order_by(hashed))
+
+    changed: dict[str, list[HistoryEntry]] = {}
+    rollup_changes: dict[str, list[tuple[datetime, str, str | None]]] = {}
+    for start in range(0, len(rows), chunk_size):
+        result = await db.execute(_upsert_statement(rows[start : start + chunk_size]))
+        for supabase_user_id, url, pattern, timestamp, previous_pattern in result:
+            changed.setdefault(supabase_user_id, []).append(HistoryEntry(url, pattern, timestamp))
+            rollup_changes.setdefault(supabase_user_id, []).append((timestamp, pattern, previous_pattern))
+    for supabase_user_id in sorted(rollup_changes):
+        await apply_history_changes(db, supabase_user_id, rollup_changes[supabase_user_id])
+    return changed
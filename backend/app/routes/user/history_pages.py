@@ -0,0 +1,158 @@
+import base64
+import os
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Any
+
+import orjson
+from dotenv import load_dotenv
+from sqlalchemy import Select
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.manager import AsyncSessionLocal
+from database.models import BlockingHistory
+from routes.user.api import to_naive_utc
+
+load_dotenv()
+
+HISTORY_PAGE_DEFAULT_LIMIT = int(os.environ.get("HISTORY_PAGE_DEFAULT_LIMIT", "500"))
+HISTORY_PAGE_MAX_LIMIT = int(os.environ.get("HISTORY_PAGE_MAX_LIMIT", "5000"))
+# Rows fetched from the server-side cursor per round trip while streaming.
+HISTORY_STREAM_BATCH_SIZE = int(os.environ.get("HISTORY_STREAM_BATCH_SIZE", "1000"))
+
+
+def encode_cursor(timestamp: datetime, entry_id: int) -> str:
+    """
+    Encode the position after a history entry as an opaque cursor.
+
+    Args:
+        timestamp (datetime): The entry's timestamp.
+        entry_id (int): The entry's id, which breaks ties between equal timestamps.
+
+    Returns:
+        str: A URL-safe cursor.
+    """
+    raw = f"{timestamp.isoformat()}|{entry_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decode a cursor produced by `encode_cursor`.
+
+    Args:
+        cursor (str): The cursor.
+
+    Returns:
+        tuple[datetime, int]: The timestamp and id of the last entry already returned.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, entry_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(entry_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def history_query(
+    supabase_user_id: str,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    after: tuple[datetime, int] | None = None,
+) -> Select:
+    """
+    Select a user's history entries in (timestamp, id) order.
+
+    Args:
+        supabase_user_id (str): The user whose history is read.
+        since (datetime | None): Only entries at or after this time.
+        until (datetime | None): Only entries before this time.
+        after (tuple[datetime, int] | None): Only entries after this (timestamp, id) position.
+
+    Returns:
+        Select: The query, selecting id, url, pattern and timestamp.
+    """
+    query = (
+        select(BlockingHistory.id, BlockingHistory.url, BlockingHistory.pattern, BlockingHistory.timestamp)
+        .where(BlockingHistory.supabase_user_id == supabase_user_id)
+        .order_by(BlockingHistory.timestamp, BlockingHistory.id)
+    )
+    if since is not None:
+        query = query.where(BlockingHistory.timestamp >= to_naive_utc(since))
+    if until is not None:
+        query = query.where(BlockingHistory.timestamp < to_naive_utc(until))
+    if after is not None:
+        query = query.where(tuple_(BlockingHistory.timestamp, BlockingHistory.id) > tuple_(*after))
+    return query
+
+
+async def history_page(
+    db: AsyncSession,
+    supabase_user_id: str,
+    limit: int,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    cursor: str | None = None,
+) -> dict[str, Any]:
+    """
+    Read one page of a user's history.
+
+    Args:
+        db (AsyncSession): The database session.
+        supabase_user_id (str): The user whose history is read.
+        limit (int): Maximum number of entries on the page.
+        since (datetime | None): Only entries at or after this time.
+        until (datetime | None): Only entries before this time.
+        cursor (str | None): The `next_cursor` of the previous page, or None for the first page.
+
+    Returns:
+        dict[str, Any]: The entries and the cursor for the following page, shaped like `BlockingHistoryPage`.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    # One extra row tells whether another page follows.
+    result = await db.execute(history_query(supabase_user_id, since, until, after).limit(limit + 1))
+    rows = result.all()
+    next_cursor = encode_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    return {
+        "items": [{"url": row.url, "pattern": row.pattern, "timestamp": row.timestamp} for row in rows[:limit]],
+        "next_cursor": next_cursor,
+    }
+
+
+async def stream_history_ndjson(
+    supabase_user_id: str,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Stream a user's history as newline-delimited JSON, one entry per line.
+
+    Rows are read through a server-side cursor in batches of HISTORY_STREAM_BATCH_SIZE and each batch is written
+    out before the next is fetched, so memory use does not grow with the size of the history. The stream has its
+    own session: request-scoped dependencies are closed before a streaming response body is sent.
+
+    Args:
+        supabase_user_id (str): The user whose history is read.
+        since (datetime | None): Only entries at or after this time.
+        until (datetime | None): Only entries before this time.
+
+    Yields:
+        bytes: One or more complete NDJSON lines.
+    """
+    query = history_query(supabase_user_id, since, until).execution_options(yield_per=HISTORY_STREAM_BATCH_SIZE)
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            # orjson writes naive datetimes as isoformat() does.
+            yield b"".join(
+                orjson.dumps({"url": row.url, "pattern": row.pattern, "timestamp": row.timestamp}) + b"\n"
+                for row in rows
+            )
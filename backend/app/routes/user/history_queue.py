@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from collections.abc import Sequence
+from typing import Any
+
+from dotenv import load_dotenv
+
+from database.manager import AsyncSessionLocal
+from routes.user.api import BlockingHistoryRecord
+from routes.user.etags import bump_history_version
+from routes.user.history_ingest import HistoryEntry
+from routes.user.history_ingest import upsert_blocking_history
+from routes.user.history_ingest import upsert_blocking_history_many
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# When enabled, POST /blocking_history queues uploads and answers 202; a background task writes them.
+HISTORY_WRITE_BEHIND = os.environ.get("HISTORY_WRITE_BEHIND", "false").lower() == "true"
+# Uploaded entries held in memory per worker process, queued or being written; beyond this uploads get a 429.
+HISTORY_QUEUE_MAX_ENTRIES = int(os.environ.get("HISTORY_QUEUE_MAX_ENTRIES", "100000"))
+# How long the writer waits for more uploads before writing what it has.
+HISTORY_FLUSH_INTERVAL_SECONDS = float(os.environ.get("HISTORY_FLUSH_INTERVAL_SECONDS", "0.5"))
+# Entries written per transaction; reaching this many queued entries triggers a write straight away.
+HISTORY_FLUSH_MAX_ENTRIES = int(os.environ.get("HISTORY_FLUSH_MAX_ENTRIES", "20000"))
+
+
+class HistoryWriteBehindQueue:
+    """
+    Bounded in-process queue of history uploads, written to the database in coalesced batches.
+
+    Uploads from all users that arrive within a flush interval are written in one transaction, through the same
+    multi-row statements, instead of one transaction per request. The queue must only be used from the event loop
+    that started it.
+
+    Attributes:
+        max_entries (int): The maximum number of entries queued or being written.
+        flush_interval (float): Seconds the writer waits for more uploads before writing.
+        flush_max_entries (int): The maximum number of entries written per transaction.
+    """
+
+    def __init__(self, max_entries: int, flush_interval: float, flush_max_entries: int):
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.flush_max_entries = flush_max_entries
+        self._pending: deque[tuple[str, Sequence[BlockingHistoryRecord | HistoryEntry]]] = deque()
+        self._depth = 0
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closed = False
+        self.peak_depth = 0
+        self.accepted_uploads = 0
+        self.accepted_entries = 0
+        self.rejected_uploads = 0
+        self.flushes = 0
+        self.written_entries = 0
+        self.dropped_entries = 0
+        self.last_flush_seconds = 0.0
+        self.last_flush_users = 0
+        self.last_error: str | None = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the writer has been started and not stopped."""
+        return self._task is not None and not self._closed
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait before retrying: about one flush."""
+        return max(1, math.ceil(self.flush_interval))
+
+    def submit(self, supabase_user_id: str, records: Sequence[BlockingHistoryRecord | HistoryEntry]) -> bool:
+        """
+        Queue an upload without waiting for it to be written.
+
+        Args:
+            supabase_user_id (str): The uploading user.
+            records (Sequence[BlockingHistoryRecord | HistoryEntry]): The validated entries.
+
+        Returns:
+            bool: False if the queue is full and the upload was not accepted.
+        """
+        if not records:
+            return True
+        # An upload larger than the whole queue is still accepted once the queue has drained.
+        if self._depth and self._depth + len(records) > self.max_entries:
+            self.rejected_uploads += 1
+            return False
+        self._pending.append((supabase_user_id, records))
+        self._depth += len(records)
+        self.peak_depth = max(self.peak_depth, self._depth)
+        self.accepted_uploads += 1
+        self.accepted_entries += len(records)
+        if self._depth >= self.flush_max_entries:
+            self._wakeup.set()
+        return True
+
+    async def start(self) -> None:
+        """Start the background writer."""
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Write everything still queued, then stop the background writer."""
+        self._closed = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    def _take(self) -> dict[str, list[BlockingHistoryRecord | HistoryEntry]]:
+        # Whole uploads in arrival order, so a user's later upload still wins on a duplicate timestamp.
+        batch: dict[str, list[BlockingHistoryRecord | HistoryEntry]] = {}
+        taken = 0
+        while self._pending and (not taken or taken + len(self._pending[0][1]) <= self.flush_max_entries):
+            supabase_user_id, records = self._pending.popleft()
+            batch.setdefault(supabase_user_id, []).extend(records)
+            taken += len(records)
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            if not self._closed:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            while self._pending:
+                batch = self._take()
+                try:
+                    await self._flush(batch)
+                finally:
+                    self._depth -= sum(len(records) for records in batch.values())
+                if not self._closed and self._depth < self.flush_max_entries:
+                    break
+            if self._closed and not self._pending:
+                return
+
+    async def _flush(self, batch: dict[str, list[BlockingHistoryRecord | HistoryEntry]]) -> None:
+        started = time.perf_counter()
+        dropped = 0
+        try:
+            async with AsyncSessionLocal() as db:
+                changed = await upsert_blocking_history_many(db, batch)
+                for supabase_user_id in sorted(changed):
+                    await bump_history_version(db, supabase_user_id)
+                await db.commit()
+        except Exception as e:
+            # Keep one bad upload from losing everyone else's: retry each user in a transaction of their own.
+            logger.warning("Coalesced history write of %s users failed (%s), retrying per user", len(batch), e)
+            self.last_error = repr(e)
+            for supabase_user_id, records in batch.items():
+                if not await self._flush_user(supabase_user_id, records):
+                    dropped += len(records)
+        self.flushes += 1
+        self.written_entries += sum(len(records) for records in batch.values()) - dropped
+        self.dropped_entries += dropped
+        self.last_flush_seconds = time.perf_counter() - started
+        self.last_flush_users = len(batch)
+
+    async def _flush_user(self, supabase_user_id: str, records: list[BlockingHistoryRecord | HistoryEntry]) -> bool:
+        try:
+            async with AsyncSessionLocal() as db:
+                if await upsert_blocking_history(db, supabase_user_id, records):
+                    await bump_history_version(db, supabase_user_id)
+                await db.commit()
+        except Exception as e:
+            logger.exception("Dropping %s history entries of user %s", len(records), supabase_user_id)
+            self.last_error = repr(e)
+            return False
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Report queue depth and writer activity.
+
+        Returns:
+            dict[str, Any]: Current and peak depth in entries, upload and write counters, and the duration and size
+            of the last flush.
+        """
+        return {
+            "enabled": self.running,
+            "depth": self._depth,
+            "queued_uploads": len(self._pending),
+            "max_entries": self.max_entries,
+            "peak_depth": self.peak_depth,
+            "accepted_uploads": self.accepted_uploads,
+            "accepted_entries": self.accepted_entries,
+            "rejected_uploads": self.rejected_uploads,
+            "flushes": self.flushes,
+            "written_entries": self.written_entries,
+            "dropped_entries": self.dropped_entries,
+            "last_flush_seconds": self.last_flush_seconds,
+            "last_flush_users": self.last_flush_users,
+            "last_error": self.last_error,
+        }
+
+
+history_queue = HistoryWriteBehindQueue(
+    max_entries=HISTORY_QUEUE_MAX_ENTRIES,
+    flush_interval=HISTORY_FLUSH_INTERVAL_SECONDS,
+    flush_max_entries=HISTORY_FLUSH_MAX_ENTRIES,
+)
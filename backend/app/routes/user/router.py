@@ -1,10 +1,21 @@
 import logging
 from datetime import datetime
+from typing import Literal
 
 from fastapi import APIRouter
 from fastapi import Depends
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
+from fastapi import status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.manager import get_db
 from database.models import BlockedPattern
@@ -12,199 +23,513 @@ from database.models import BlockingHistory
 from routes.auth.api import UserResponse
 from routes.auth.router import get_current_user
 from routes.user.api import BlockedPattern as BlockedPatternSchema
+from routes.user.api import BlockingHistoryPage
 from routes.user.api import BlockingHistoryRecord
 from routes.user.api import BlockingHistoryRequest
+from routes.user.api import BlocklistChange
+from routes.user.api import BlocklistCompactionResponse
+from routes.user.api import BlocklistDeltaRequest
+from routes.user.api import BlocklistDeltaResponse
+from routes.user.api import ClassifyUrlsRequest
+from routes.user.api import ClassifyUrlsResponse
+from routes.user.api import ColumnarBlockingHistoryRequest
 from routes.user.api import GetStatsResponse
+from routes.user.api import RedundantPattern
 from routes.user.api import SyncBlockedPatternsRequest
 from routes.user.api import SyncBlockedPatternsResponse
+from routes.user.api import to_naive_utc
+from routes.user.blocklist_compaction import compact_patterns
+from routes.user.blocklist_sync import apply_blocklist_changes
+from routes.user.etags import blocklist_etag
+from routes.user.etags import bump_history_version
+from routes.user.etags import etag_matches
+from routes.user.etags import history_version
+from routes.user.etags import make_etag
+from routes.user.etags import not_modified
+from routes.user.etags import set_etag
+from routes.user.history_codec import COLUMNAR_CONTENT_TYPE
+from routes.user.history_codec import HISTORY_UPLOAD_MAX_BYTES
+from routes.user.history_codec import JSON_CONTENT_TYPE
+from routes.user.history_codec import HistoryUploadError
+from routes.user.history_codec import parse_history_upload
+from routes.user.history_export import EXPORT_MEDIA_TYPES
+from routes.user.history_export import HistoryExportError
+from routes.user.history_export import export_history
+from routes.user.history_export import negotiate_export_encoding
+from routes.user.history_ingest import HistoryEntry
+from routes.user.history_ingest import upsert_blocking_history
+from routes.user.history_pages import HISTORY_PAGE_DEFAULT_LIMIT
+from routes.user.history_pages import HISTORY_PAGE_MAX_LIMIT
+from routes.user.history_pages import history_page
+from routes.user.history_pages import stream_history_ndjson
+from routes.user.history_queue import HISTORY_WRITE_BEHIND
+from routes.user.history_queue import history_queue
+from routes.user.serialization import fast_response
+from routes.user.stats_rollups import read_stats
+from routes.user.url_matcher import URL_CLASSIFY_MAX_URL_LENGTH
+from routes.user.url_matcher import URL_CLASSIFY_MAX_URLS
+from routes.user.url_matcher import load_matcher
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
 @router.get("/blocklist", response_model=list[BlockedPatternSchema])
-async def get_blocklist(current_user: UserResponse = Depends(get_current_user), db: Session = Depends(get_db)):
-    logger.info(f"Fetching blocklist for user {current_user.supabase_user_id}")
-    patterns = db.query(BlockedPattern).filter(BlockedPattern.supabase_user_id == current_user.supabase_user_id).all()
-    logger.info(f"Found {len(patterns)} patterns for user {current_user.supabase_user_id}")
-    return [
-        BlockedPatternSchema(
-            pattern=p.pattern,
-            created_at=p.created_at.isoformat(),
+async def get_blocklist(
+    request: Request,
+    response: Response,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    etag = await blocklist_etag(db, current_user.supabase_user_id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    logger.info("Fetching blocklist for user %s", current_user.supabase_user_id)
+    result = await db.execute(
+        select(BlockedPattern.pattern, BlockedPattern.created_at).where(
+            BlockedPattern.supabase_user_id == current_user.supabase_user_id,
+            BlockedPattern.deleted.is_(False),
         )
-        for p in patterns
-    ]
+    )
+    patterns = result.all()
+    logger.info("Found %s patterns for user %s", len(patterns), current_user.supabase_user_id)
+    return await fast_response(
+        request,
+        [{"pattern": p.pattern, "created_at": p.created_at.isoformat()} for p in patterns],
+        response.headers,
+    )
 
 
 @router.post("/blocklist/sync", response_model=SyncBlockedPatternsResponse)
 async def sync_blocklist(
     request: SyncBlockedPatternsRequest,
+    compact: bool = False,
     current_user: UserResponse = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    logger.info(f"Syncing blocklist for user {current_user.supabase_user_id}")
-    # Get existing patterns
-    existing_patterns = (
-        db.query(BlockedPattern).filter(BlockedPattern.supabase_user_id == current_user.supabase_user_id).all()
-    )
-    existing_pattern_set = {p.pattern for p in existing_patterns}
-    logger.info(f"Found {len(existing_patterns)} existing patterns for user {current_user.supabase_user_id}")
-
-    # Add new patterns and track patterns to keep
-    new_patterns_count = 0
-    patterns_to_keep: set[str] = set()
-    for pattern in request.patterns:
-        patterns_to_keep.add(pattern.pattern)
-        if pattern.pattern not in existing_pattern_set:
-            new_pattern = BlockedPattern(
-                supabase_user_id=current_user.supabase_user_id,
-                pattern=pattern.pattern,
-                created_at=datetime.fromisoformat(pattern.created_at),
-            )
-            db.add(new_pattern)
-            new_patterns_count += 1
+    """
+    Replace the user's blocklist with the full list sent by the client.
 
-    # Remove patterns not in the request
-    patterns_to_remove = existing_pattern_set - patterns_to_keep
-    if patterns_to_remove:
-        db.query(BlockedPattern).filter(
+    Kept for clients that do not speak the delta protocol (see `sync_blocklist_delta`). The differences are
+    applied through the same revisioned path, so delta clients see them as ordinary changes. With `compact`, the
+    patterns made redundant by others in the list are left out (removed if stored), and so missing from the
+    response.
+    """
+    logger.info("Syncing blocklist for user %s", current_user.supabase_user_id)
+    # Get existing patterns
+    result = await db.scalars(
+        select(BlockedPattern).where(
             BlockedPattern.supabase_user_id == current_user.supabase_user_id,
-            BlockedPattern.pattern.in_(patterns_to_remove),
-        ).delete(synchronize_session=False)
+            BlockedPattern.deleted.is_(False),
+        )
+    )
+    existing_patterns = {p.pattern: p for p in result.all()}
+    logger.info("Found %s existing patterns for user %s", len(existing_patterns), current_user.supabase_user_id)
+
+    requested_patterns = {p.pattern: p for p in request.patterns}
+    if compact:
+        kept, _ = compact_patterns(list(requested_patterns))
+        requested_patterns = {pattern: requested_patterns[pattern] for pattern in kept}
+    added = [
+        BlocklistChange(pattern=p.pattern, created_at=p.created_at)
+        for p in requested_patterns.values()
+        if p.pattern not in existing_patterns
+    ]
+    removed = [
+        BlocklistChange(pattern=pattern, deleted=True)
+        for pattern in existing_patterns
+        if pattern not in requested_patterns
+    ]
 
     logger.info(
-        f"Adding {new_patterns_count=}, removing {len(patterns_to_remove)=} for {current_user.supabase_user_id=}"
+        "Adding %s, removing %s patterns for user %s",
+        len(added),
+        len(removed),
+        current_user.supabase_user_id,
     )
-    db.commit()
+    if added or removed:
+        await apply_blocklist_changes(db, current_user.supabase_user_id, None, added + removed)
+        await db.commit()
 
-    # Fetch updated patterns
-    updated_patterns = (
-        db.query(BlockedPattern).filter(BlockedPattern.supabase_user_id == current_user.supabase_user_id).all()
-    )
     response_patterns = [
-        BlockedPatternSchema(pattern=p.pattern, created_at=p.created_at.isoformat()) for p in updated_patterns
+        BlockedPatternSchema(pattern=p.pattern, created_at=p.created_at.isoformat())
+        for p in existing_patterns.values()
+        if p.pattern in requested_patterns
+    ] + [
+        BlockedPatternSchema(
+            pattern=change.pattern,
+            created_at=to_naive_utc(datetime.fromisoformat(change.created_at)).isoformat(),
+        )
+        for change in added
     ]
-    logger.info(f"Returning {len(response_patterns)} total patterns for user {current_user.supabase_user_id}")
+    logger.info("Returning %s total patterns for user %s", len(response_patterns), current_user.supabase_user_id)
 
     return SyncBlockedPatternsResponse(success=True, blocked_patterns=response_patterns)
 
 
+@router.post("/blocklist/delta", response_model=BlocklistDeltaResponse)
+async def sync_blocklist_delta(
+    request: BlocklistDeltaRequest,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> BlocklistDeltaResponse:
+    """
+    Exchange blocklist changes since a known revision.
+
+    Args:
+        request: The client's last seen revision and its local changes since then.
+        current_user: The current authenticated user.
+        db: The database session.
+
+    Returns:
+        The new revision and the server-side changes the client has not seen yet.
+    """
+    revision, changes = await apply_blocklist_changes(
+        db, current_user.supabase_user_id, request.since_revision, request.changes
+    )
+    if request.changes:
+        await db.commit()
+    logger.info(
+        "Delta sync for user %s: applied %s, returning %s changes at revision %s",
+        current_user.supabase_user_id,
+        len(request.changes),
+        len(changes),
+        revision,
+    )
+    return BlocklistDeltaResponse(revision=revision, changes=changes)
+
+
+@router.get("/blocklist/compaction", response_model=BlocklistCompactionResponse)
+async def get_blocklist_compaction(
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> BlocklistCompactionResponse:
+    """
+    Find the patterns of the current user's blocklist that other patterns make redundant.
+
+    Args:
+        current_user: The current authenticated user.
+        db: The database session.
+
+    Returns:
+        The minimal equivalent blocklist and, for each redundant pattern, the pattern that covers it.
+    """
+    revision, matcher = await load_matcher(db, current_user.supabase_user_id)
+    kept, covered_by = await run_in_threadpool(compact_patterns, matcher.patterns)
+    return BlocklistCompactionResponse(
+        revision=revision,
+        patterns=kept,
+        redundant=[RedundantPattern(pattern=pattern, subsumed_by=cover) for pattern, cover in covered_by.items()],
+    )
+
+
+@router.post("/blocklist/classify", response_model=ClassifyUrlsResponse)
+async def classify_urls(
+    request: ClassifyUrlsRequest,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> ClassifyUrlsResponse:
+    """
+    Check a batch of URLs against the current user's blocklist, with the extension's wildcard semantics.
+
+    Args:
+        request: The URLs to classify, at most URL_CLASSIFY_MAX_URLS of at most URL_CLASSIFY_MAX_URL_LENGTH characters.
+        current_user: The current authenticated user.
+        db: The database session.
+
+    Returns:
+        The blocklist revision and, per URL, the first pattern that matches it.
+    """
+    if len(request.urls) > URL_CLASSIFY_MAX_URLS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {URL_CLASSIFY_MAX_URLS} URLs can be classified per request",
+        )
+    if any(len(url) > URL_CLASSIFY_MAX_URL_LENGTH for url in request.urls):
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"URLs longer than {URL_CLASSIFY_MAX_URL_LENGTH} characters cannot be classified",
+        )
+    revision, matcher = await load_matcher(db, current_user.supabase_user_id)
+    # Return the connection to the pool rather than hold it while matching.
+    await db.close()
+    # Matching is pure CPU; keep large batches off the event loop.
+    patterns = await run_in_threadpool(matcher.classify, request.urls)
+    return ClassifyUrlsResponse(revision=revision, patterns=patterns)
+
+
 @router.get("/blocking_history", response_model=list[BlockingHistoryRecord])
-async def get_blocking_history(current_user: UserResponse = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_blocking_history(
+    request: Request,
+    response: Response,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
     """
     Retrieve the blocking history for the current user.
     """
-    history = db.query(BlockingHistory).filter(BlockingHistory.supabase_user_id == current_user.supabase_user_id).all()
-    return history
+    # Read the validator before the data, so a concurrent write can only make the data newer than its ETag
+    version = await history_version(db, current_user.supabase_user_id)
+    etag = make_etag("history", current_user.supabase_user_id, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    result = await db.execute(
+        select(BlockingHistory.url, BlockingHistory.pattern, BlockingHistory.timestamp).where(
+            BlockingHistory.supabase_user_id == current_user.supabase_user_id
+        )
+    )
+    return await fast_response(request, [row._asdict() for row in result], response.headers)
 
 
-@router.post("/blocking_history", response_model=list[BlockingHistoryRecord])
-async def post_blocking_history(
-    request: BlockingHistoryRequest,
+@router.get("/blocking_history/page", response_model=BlockingHistoryPage)
+async def get_blocking_history_page(
+    request: Request,
+    limit: int = Query(HISTORY_PAGE_DEFAULT_LIMIT, ge=1, le=HISTORY_PAGE_MAX_LIMIT),
+    cursor: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
     current_user: UserResponse = Depends(get_current_user),
-    db: Session = Depends(get_db),
-) -> list[BlockingHistoryRecord]:
+    db: AsyncSession = Depends(get_db),
+) -> Response:
     """
-    Merge new blocking history entries with existing ones for the current user.
-
-    This function de-duplicates entries based on timestamps, updating existing entries
-    if necessary and creating new ones if they don't exist.
+    Retrieve the current user's blocking history one page at a time, oldest first.
 
     Args:
-        request: The BlockingHistoryRequest containing new history entries.
+        limit: Maximum number of entries to return.
+        cursor: The `next_cursor` of the previous page; omit for the first page.
+        since: Only entries at or after this time.
+        until: Only entries before this time.
         current_user: The current authenticated user.
         db: The database session.
 
     Returns:
-        A list of BlockingHistoryRecord representing the updated entries.
+        The page of entries and the cursor for the next one.
     """
-    user_id = current_user.supabase_user_id
+    try:
+        page = await history_page(db, current_user.supabase_user_id, limit, since, until, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return await fast_response(request, page)
+
+
+@router.get("/blocking_history/stream")
+async def stream_blocking_history(
+    since: datetime | None = None,
+    until: datetime | None = None,
+    current_user: UserResponse = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Stream the current user's whole blocking history as NDJSON, oldest first.
+
+    Args:
+        since: Only entries at or after this time.
+        until: Only entries before this time.
+        current_user: The current authenticated user.
+
+    Returns:
+        A streaming response with one JSON encoded entry per line.
+    """
+    return StreamingResponse(
+        stream_history_ndjson(current_user.supabase_user_id, since, until),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get(
+    "/blocking_history/export",
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {"content": {media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()}},
+        status.HTTP_501_NOT_IMPLEMENTED: {"description": "Parquet exports are not available on this server."},
+    },
+)
+async def export_blocking_history(
+    request: Request,
+    format: Literal["csv", "ndjson", "parquet"] = "csv",
+    since: datetime | None = None,
+    until: datetime | None = None,
+    current_user: UserResponse = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Download the current user's whole blocking history as a CSV, NDJSON or Parquet file, oldest first.
+
+    The file is streamed straight out of Postgres with COPY. CSV and NDJSON are compressed with zstd or gzip when
+    the client accepts it.
+
+    Args:
+        request: The incoming request, for content negotiation.
+        format: The file format.
+        since: Only entries at or after this time.
+        until: Only entries before this time.
+        current_user: The current authenticated user.
+
+    Returns:
+        A streaming response with the file as an attachment.
+    """
+    encoding = negotiate_export_encoding(request.headers.get("accept-encoding")) if format != "parquet" else None
+    try:
+        body = export_history(format, current_user.supabase_user_id, since, until, encoding)
+    except HistoryExportError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    headers = {"Content-Disposition": f'attachment; filename="blocking_history.{format}"', "Vary": "Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+
+
+async def read_capped_body(request: Request, max_bytes: int) -> bytes:
+    """
+    Read a request body, refusing it as soon as it is known to exceed a size.
+
+    Args:
+        request: The incoming request.
+        max_bytes: Maximum body size, as sent (before any Content-Encoding is undone).
 
-    # Create a dictionary of new entries, using timestamp as the key
-    new_entries = {entry.timestamp: entry for entry in request.blocking_history}
+    Returns:
+        The raw body.
 
-    # Fetch existing entries for the user with matching timestamps
-    existing_entries = (
-        db.query(BlockingHistory)
-        .filter(BlockingHistory.supabase_user_id == user_id)
-        .filter(BlockingHistory.timestamp.in_(new_entries.keys()))
-        .all()
+    Raises:
+        HTTPException: 413 if the declared Content-Length or the bytes received exceed `max_bytes`.
+    """
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Request body exceeds {max_bytes} bytes"
     )
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        raise too_large
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def read_history_upload(
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user),
+) -> list[BlockingHistoryRecord] | list[HistoryEntry]:
+    """
+    Decode a blocking history upload, negotiated through Content-Type and Content-Encoding.
 
-    updated_entries: list[BlockingHistory] = []
-
-    for entry in existing_entries:
-        new_entry = new_entries.pop(entry.timestamp)
-        if new_entry.url != entry.url or new_entry.pattern != entry.pattern:
-            entry.url = new_entry.url
-            entry.pattern = new_entry.pattern
-            updated_entries.append(entry)
-
-    # Add remaining new entries
-    for timestamp, entry in new_entries.items():
-        new_entry = BlockingHistory(
-            supabase_user_id=user_id,
-            url=entry.url,
-            pattern=entry.pattern,
-            timestamp=timestamp,
+    Depends on the current user so that unauthenticated uploads are refused before their body is read.
+
+    Args:
+        request: The incoming request.
+        current_user: The current authenticated user.
+
+    Returns:
+        The uploaded records.
+    """
+    body = await read_capped_body(request, HISTORY_UPLOAD_MAX_BYTES)
+    try:
+        return parse_history_upload(
+            body,
+            request.headers.get("content-type", JSON_CONTENT_TYPE),
+            request.headers.get("content-encoding", "identity"),
         )
-        db.add(new_entry)
-        updated_entries.append(new_entry)
+    except HistoryUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+
+
+# The body is decoded by read_history_upload, so describe the accepted formats explicitly.
+_HISTORY_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            # BlockingHistoryRecord is already in the components, as a response model.
+            JSON_CONTENT_TYPE: {
+                "schema": {
+                    key: value
+                    for key, value in BlockingHistoryRequest.model_json_schema(
+                        ref_template="#/components/schemas/{model}"
+                    ).items()
+                    if key != "$defs"
+                }
+            },
+            COLUMNAR_CONTENT_TYPE: {"schema": ColumnarBlockingHistoryRequest.model_json_schema()},
+        },
+    }
+}
+
+
+@router.post(
+    "/blocking_history",
+    response_model=list[BlockingHistoryRecord],
+    openapi_extra=_HISTORY_UPLOAD_OPENAPI,
+    responses={
+        status.HTTP_202_ACCEPTED: {"description": "Queued for writing (write-behind mode); the body is an empty list."},
+        status.HTTP_429_TOO_MANY_REQUESTS: {"description": "The write-behind queue is full; retry after Retry-After."},
+    },
+)
+async def post_blocking_history(
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user),
+    records: list[BlockingHistoryRecord] | list[HistoryEntry] = Depends(read_history_upload),
+    db: AsyncSession = Depends(get_db),
+) -> Response:
+    """
+    Merge new blocking history entries with existing ones for the current user.
 
-    if updated_entries:
-        db.commit()
-        for entry in updated_entries:
-            db.refresh(entry)
+    The body is either a `BlockingHistoryRequest` (application/json) or its columnar encoding
+    (application/vnd.tablocker.history-columnar+json), optionally gzip or zstd compressed (Content-Encoding).
 
-    return [
-        BlockingHistoryRecord(url=entry.url, pattern=entry.pattern, timestamp=entry.timestamp)
-        for entry in updated_entries
-    ]
+    Entries are de-duplicated on timestamp: new ones are inserted and existing ones updated if their url or
+    pattern changed, in one statement per chunk. With HISTORY_WRITE_BEHIND enabled the validated upload is queued
+    instead and written together with other users' uploads shortly after; the response is then 202 with an empty
+    list, or 429 when the queue is full.
+
+    Args:
+        request: The incoming request.
+        records: The uploaded history entries.
+        current_user: The current authenticated user.
+        db: The database session.
+
+    Returns:
+        A list of BlockingHistoryRecord representing the inserted or updated entries.
+    """
+    user_id = current_user.supabase_user_id
+    if HISTORY_WRITE_BEHIND:
+        if not history_queue.submit(user_id, records):
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many pending blocking history uploads",
+                headers={"Retry-After": str(history_queue.retry_after())},
+            )
+        return JSONResponse([], status_code=status.HTTP_202_ACCEPTED)
+
+    updated_entries = await upsert_blocking_history(db, user_id, records)
+    if updated_entries:
+        await bump_history_version(db, user_id)
+        await db.commit()
+    return await fast_response(request, [entry._asdict() for entry in updated_entries])
 
 
 @router.get("/stats", response_model=GetStatsResponse)
 async def get_stats(
+    request: Request,
+    response: Response,
     current_user: UserResponse = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
-    Retrieve user statistics derived from BlockingHistory.
+    Retrieve user statistics, read from the rollups maintained on upload.
     """
     user_id = current_user.supabase_user_id
 
-    # Calculate UserStats
-    total_tabs_blocked = (
-        db.query(func.count(BlockingHistory.id)).filter(BlockingHistory.supabase_user_id == user_id).scalar()
-    )
-
-    last_updated = (
-        db.query(func.max(BlockingHistory.timestamp)).filter(BlockingHistory.supabase_user_id == user_id).scalar()
-    )
-
-    # Calculate DailyStats
-    daily_stats = (
-        db.query(
-            func.date(BlockingHistory.timestamp).label("date"), func.count(BlockingHistory.id).label("tabs_blocked")
-        )
-        .filter(BlockingHistory.supabase_user_id == user_id)
-        .group_by(func.date(BlockingHistory.timestamp))
-        .all()
-    )
-
-    # Calculate BlockedPatternStats
-    pattern_stats = (
-        db.query(BlockingHistory.pattern, func.count(BlockingHistory.id).label("total_count"))
-        .filter(BlockingHistory.supabase_user_id == user_id)
-        .group_by(BlockingHistory.pattern)
-        .all()
-    )
+    # Stats are derived from history only, so they share its version
+    version = await history_version(db, user_id)
+    etag = make_etag("stats", user_id, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
 
-    return GetStatsResponse(
-        user_stats=GetStatsResponse.UserStats(total_tabs_blocked=total_tabs_blocked, last_updated=last_updated),
-        daily_stats=[
-            GetStatsResponse.DailyStats(date=stat.date, tabs_blocked=stat.tabs_blocked) for stat in daily_stats
-        ],
-        blocked_pattern_stats=[
-            GetStatsResponse.BlockedPatternStats(pattern=stat.pattern, count=stat.total_count) for stat in pattern_stats
-        ],
-    )
+    return await fast_response(request, await read_stats(db, user_id), response.headers)
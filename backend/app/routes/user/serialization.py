@@ -0,0 +1,152 @@
+import gzip
+import os
+from collections.abc import Mapping
+from datetime import date
+from functools import cache
+from types import ModuleType
+from typing import Any
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import Request
+from fastapi import Response
+from fastapi.concurrency import run_in_threadpool
+
+load_dotenv()
+
+# Bodies smaller than this are sent uncompressed; compressing them costs more CPU than it saves in transfer.
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", "4"))
+# Bodies at least this large are compressed in the thread pool; compressing them on the event loop would stall every
+# other request the worker is serving.
+RESPONSE_COMPRESSION_THREADPOOL_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_THREADPOOL_MIN_BYTES", "65536"))
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+@cache
+def get_msgpack() -> ModuleType | None:
+    """
+    Import msgpack on first use, if installed.
+
+    Returns:
+        ModuleType | None: The `msgpack` module, or None when MessagePack responses are unavailable.
+    """
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+
+@cache
+def get_brotli() -> ModuleType | None:
+    """
+    Import brotli on first use, if installed.
+
+    Returns:
+        ModuleType | None: The `brotli` module, or None when br compression is unavailable.
+    """
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def accepts(header: str | None, token: str) -> bool:
+    """
+    Check whether an Accept or Accept-Encoding header allows a token.
+
+    Args:
+        header (str | None): The header value.
+        token (str): A media type or content coding, e.g. "application/msgpack" or "br".
+
+    Returns:
+        bool: True if the token is listed without `q=0`.
+    """
+    for item in (header or "").split(","):
+        name, _, params = item.partition(";")
+        if name.strip().lower() != token:
+            continue
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, date):
+        # Same representation as the JSON responses.
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def compress_body(body: bytes, accept_encoding: str | None) -> tuple[bytes, str | None]:
+    """
+    Compress a response body with the best content coding the client accepts.
+
+    Args:
+        body (bytes): The encoded body.
+        accept_encoding (str | None): The request's Accept-Encoding header.
+
+    Returns:
+        tuple[bytes, str | None]: The body and its content coding, or the body unchanged and None.
+    """
+    brotli = get_brotli() if accepts(accept_encoding, "br") else None
+    if brotli is not None:
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY), "br"
+    if accepts(accept_encoding, "gzip"):
+        return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL), "gzip"
+    return body, None
+
+
+async def fast_response(request: Request, content: Any, headers: Mapping[str, str] | None = None) -> Response:
+    """
+    Serialize plain rows straight to a response body, skipping `response_model` validation.
+
+    The content must already have the shape of the route's response model; the model is still declared on the
+    route for the OpenAPI schema. Bodies are JSON (orjson), or MessagePack if the client asks for it and msgpack is
+    installed, and are compressed with br or gzip when large enough and accepted by the client, in the thread pool
+    above RESPONSE_COMPRESSION_THREADPOOL_MIN_BYTES.
+
+    Args:
+        request (Request): The incoming request, for content negotiation.
+        content (Any): Dicts, lists, strings, numbers, dates and datetimes.
+        headers (Mapping[str, str] | None): Extra response headers, e.g. the injected response's ETag.
+
+    Returns:
+        Response: The encoded response.
+    """
+    msgpack = get_msgpack() if accepts(request.headers.get("accept"), MSGPACK_MEDIA_TYPE) else None
+    if msgpack is not None:
+        body, media_type = msgpack.packb(content, default=_msgpack_default), MSGPACK_MEDIA_TYPE
+    else:
+        body, media_type = orjson.dumps(content), JSON_MEDIA_TYPE
+
+    response_headers = {key: value for key, value in (headers or {}).items() if key.lower() != "content-length"}
+    response_headers["Vary"] = "Accept, Accept-Encoding"
+    # JSON is the identity representation; MessagePack and each content coding are different representations of
+    # the same resource version, so their validators can only be weak.
+    weak = media_type != JSON_MEDIA_TYPE
+    if len(body) >= RESPONSE_COMPRESSION_MIN_BYTES:
+        accept_encoding = request.headers.get("accept-encoding")
+        if len(body) >= RESPONSE_COMPRESSION_THREADPOOL_MIN_BYTES:
+            body, encoding = await run_in_threadpool(compress_body, body, accept_encoding)
+        else:
+            body, encoding = compress_body(body, accept_encoding)
+        if encoding is not None:
+            response_headers["Content-Encoding"] = encoding
+            weak = True
+    if weak:
+        for key, value in list(response_headers.items()):
+            if key.lower() == "etag" and not value.startswith("W/"):
+                response_headers[key] = f"W/{value}"
+    return Response(body, media_type=media_type, headers=response_headers)
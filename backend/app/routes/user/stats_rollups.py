@@ -0,0 +1,244 @@
+from collections import Counter
+from datetime import date
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Date
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy import and_
+from sqlalchemy import column
+from sqlalchemy import delete
+from sqlalchemy import func
+from sqlalchemy import literal
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy import union_all
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import BlockingHistory
+from database.models import BlockingHistoryArchive
+from database.models import BlockingStatsDaily
+from database.models import BlockingStatsPattern
+from database.models import BlockingStatsUser
+
+ROLLUP_TABLES = (BlockingStatsUser, BlockingStatsDaily, BlockingStatsPattern)
+
+
+async def apply_history_changes(
+    db: AsyncSession,
+    supabase_user_id: str,
+    changes: list[tuple[datetime, str, str | None]],
+) -> None:
+    """
+    Fold inserted and updated history entries into the user's rollups.
+
+    Must run in the transaction that changed the history. An update keeps its timestamp, so it only moves one
+    count from the previous pattern to the new one.
+
+    Args:
+        db (AsyncSession): The database session. The caller commits.
+        supabase_user_id (str): The user whose history changed.
+        changes (list[tuple[datetime, str, str | None]]): Timestamp, pattern and previous pattern of each changed
+            entry; the previous pattern is None for new entries.
+    """
+    daily: Counter[date] = Counter()
+    patterns: Counter[str] = Counter()
+    last_blocked: datetime | None = None
+    for timestamp, pattern, previous_pattern in changes:
+        patterns[pattern] += 1
+        if previous_pattern is None:
+            daily[timestamp.date()] += 1
+            last_blocked = timestamp if last_blocked is None else max(last_blocked, timestamp)
+        else:
+            patterns[previous_pattern] -= 1
+    patterns = Counter({pattern: delta for pattern, delta in patterns.items() if delta})
+
+    if daily:
+        user = pg_insert(BlockingStatsUser).values(
+            supabase_user_id=supabase_user_id, total_tabs_blocked=daily.total(), last_blocked=last_blocked
+        )
+        await db.execute(
+            user.on_conflict_do_update(
+                index_elements=[BlockingStatsUser.supabase_user_id],
+                set_={
+                    "total_tabs_blocked": BlockingStatsUser.total_tabs_blocked + user.excluded.total_tabs_blocked,
+                    "last_blocked": func.greatest(BlockingStatsUser.last_blocked, user.excluded.last_blocked),
+                },
+            )
+        )
+        days = (
+            func.unnest(literal(list(daily), ARRAY(Date)), literal(list(daily.values()), ARRAY(Integer)))
+            .table_valued(column("day", Date), column("tabs_blocked", Integer))
+            .render_derived(name="days")
+        )
+        day_rows = pg_insert(BlockingStatsDaily).from_select(
+            ["supabase_user_id", "day", "tabs_blocked"],
+            select(literal(supabase_user_id, String), days.c.day, days.c.tabs_blocked),
+        )
+        await db.execute(
+            day_rows.on_conflict_do_update(
+                index_elements=[BlockingStatsDaily.supabase_user_id, BlockingStatsDaily.day],
+                set_={"tabs_blocked": BlockingStatsDaily.tabs_blocked + day_rows.excluded.tabs_blocked},
+            )
+        )
+
+    if patterns:
+        deltas = (
+            func.unnest(literal(list(patterns), ARRAY(String)), literal(list(patterns.values()), ARRAY(Integer)))
+            .table_valued(column("pattern", String), column("count", Integer))
+            .render_derived(name="deltas")
+        )
+        pattern_rows = pg_insert(BlockingStatsPattern).from_select(
+            ["supabase_user_id", "pattern", "count"],
+            select(literal(supabase_user_id, String), deltas.c.pattern, deltas.c.count),
+        )
+        await db.execute(
+            pattern_rows.on_conflict_do_update(
+                index_elements=[BlockingStatsPattern.supabase_user_id, BlockingStatsPattern.pattern],
+                set_={"count": BlockingStatsPattern.count + pattern_rows.excluded.count},
+            )
+        )
+        emptied = [pattern for pattern, delta in patterns.items() if delta < 0]
+        if emptied:
+            await db.execute(
+                delete(BlockingStatsPattern).where(
+                    BlockingStatsPattern.supabase_user_id == supabase_user_id,
+                    BlockingStatsPattern.pattern.in_(emptied),
+                    BlockingStatsPattern.count <= 0,
+                )
+            )
+
+
+async def read_stats(db: AsyncSession, supabase_user_id: str) -> dict[str, Any]:
+    """
+    Answer `/stats` from the rollups, without touching the user's history.
+
+    Args:
+        db (AsyncSession): The database session.
+        supabase_user_id (str): The user whose statistics are read.
+
+    Returns:
+        dict[str, Any]: Totals, per-day counts and per-pattern counts, shaped like `GetStatsResponse`.
+    """
+    user = await db.get(BlockingStatsUser, supabase_user_id)
+    daily = await db.execute(
+        select(BlockingStatsDaily.day, BlockingStatsDaily.tabs_blocked)
+        .where(BlockingStatsDaily.supabase_user_id == supabase_user_id)
+        .order_by(BlockingStatsDaily.day)
+    )
+    patterns = await db.execute(
+        select(BlockingStatsPattern.pattern, BlockingStatsPattern.count)
+        .where(BlockingStatsPattern.supabase_user_id == supabase_user_id)
+        .order_by(BlockingStatsPattern.pattern)
+    )
+    return {
+        "user_stats": {
+            "total_tabs_blocked": user.total_tabs_blocked if user else 0,
+            "last_updated": user.last_blocked if user else None,
+        },
+        "daily_stats": [{"date": row.day, "tabs_blocked": row.tabs_blocked} for row in daily],
+        "blocked_pattern_stats": [{"pattern": row.pattern, "count": row.count} for row in patterns],
+    }
+
+
+def _raw_aggregates(supabase_user_id: str | None):
+    """Aggregate blocking_history, plus the archived counts of history removed by retention, like each rollup."""
+    live = select(
+        BlockingHistory.supabase_user_id,
+        func.date(BlockingHistory.timestamp).label("day"),
+        BlockingHistory.pattern,
+        literal(1).label("count"),
+        BlockingHistory.timestamp.label("last_blocked"),
+    )
+    archived = select(
+        BlockingHistoryArchive.supabase_user_id,
+        BlockingHistoryArchive.day,
+        BlockingHistoryArchive.pattern,
+        BlockingHistoryArchive.count,
+        BlockingHistoryArchive.last_blocked,
+    )
+    if supabase_user_id is not None:
+        live = live.where(BlockingHistory.supabase_user_id == supabase_user_id)
+        archived = archived.where(BlockingHistoryArchive.supabase_user_id == supabase_user_id)
+    history = union_all(live, archived).subquery("history")
+    return {
+        BlockingStatsUser: select(
+            history.c.supabase_user_id,
+            func.sum(history.c.count).label("total_tabs_blocked"),
+            func.max(history.c.last_blocked).label("last_blocked"),
+        ).group_by(history.c.supabase_user_id),
+        BlockingStatsDaily: select(
+            history.c.supabase_user_id, history.c.day, func.sum(history.c.count).label("tabs_blocked")
+        ).group_by(history.c.supabase_user_id, history.c.day),
+        BlockingStatsPattern: select(
+            history.c.supabase_user_id, history.c.pattern, func.sum(history.c.count).label("count")
+        ).group_by(history.c.supabase_user_id, history.c.pattern),
+    }
+
+
+async def _lock_rollups(db: AsyncSession) -> None:
+    # Uploads update the rollups after writing history, so blocking them here means every upload is either fully
+    # visible to the rebuild or applies its deltas on top of it afterwards.
+    tables = ", ".join(table.__tablename__ for table in ROLLUP_TABLES)
+    await db.execute(text(f"LOCK TABLE {tables} IN EXCLUSIVE MODE"))
+
+
+async def rebuild_rollups(db: AsyncSession, supabase_user_id: str | None = None) -> None:
+    """
+    Recompute rollups from blocking_history and the archive of history removed by retention.
+
+    Args:
+        db (AsyncSession): The database session. The caller commits; uploads wait until then.
+        supabase_user_id (str | None): Rebuild only this user, or everyone when None.
+    """
+    await _lock_rollups(db)
+    for table, aggregate in _raw_aggregates(supabase_user_id).items():
+        statement = delete(table)
+        if supabase_user_id is not None:
+            statement = statement.where(table.supabase_user_id == supabase_user_id)
+        await db.execute(statement)
+        await db.execute(pg_insert(table).from_select([c.name for c in aggregate.selected_columns], aggregate))
+
+
+async def find_rollup_mismatches(
+    db: AsyncSession, supabase_user_id: str | None = None, limit: int = 100
+) -> list[dict[str, Any]]:
+    """
+    Compare the rollups with aggregates computed from blocking_history and its archive.
+
+    Args:
+        db (AsyncSession): The database session.
+        supabase_user_id (str | None): Check only this user, or everyone when None.
+        limit (int): Maximum number of mismatches reported per rollup table.
+
+    Returns:
+        list[dict[str, Any]]: One entry per differing row, with the table, key, and the expected (raw) and actual
+        (rollup) values.
+    """
+    mismatches = []
+    for table, aggregate in _raw_aggregates(supabase_user_id).items():
+        raw = aggregate.subquery("raw")
+        keys = [c.name for c in table.__table__.primary_key.columns]
+        values = [c.name for c in table.__table__.columns if c.name not in keys]
+        rollup = select(table)
+        if supabase_user_id is not None:
+            rollup = rollup.where(table.supabase_user_id == supabase_user_id)
+        rollup = rollup.subquery("rollup")
+        join_on = [raw.c[key] == rollup.c[key] for key in keys]
+        differs = [raw.c[value].is_distinct_from(rollup.c[value]) for value in values]
+        rows = await db.execute(
+            select(
+                *[func.coalesce(raw.c[key], rollup.c[key]).label(key) for key in keys],
+                *[raw.c[value].label(f"expected_{value}") for value in values],
+                *[rollup.c[value].label(f"actual_{value}") for value in values],
+            )
+            .select_from(raw.join(rollup, and_(*join_on), full=True))
+            .where(or_(*differs))
+            .limit(limit)
+        )
+        mismatches.extend({"table": table.__tablename__, **row._asdict()} for row in rows)
+    return mismatches
@@ -0,0 +1,308 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from collections.abc import Sequence
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import BlockedPattern
+from routes.user.etags import blocklist_revision
+
+load_dotenv()
+
+# Compiled blocklists kept in memory, one per user, per worker process.
+URL_MATCHER_CACHE_MAX_SIZE = int(os.environ.get("URL_MATCHER_CACHE_MAX_SIZE", "1000"))
+URL_CLASSIFY_MAX_URLS = int(os.environ.get("URL_CLASSIFY_MAX_URLS", "10000"))
+# Matching is linear in the URL length, but a batch of URLs this long is still a lot of work per request.
+URL_CLASSIFY_MAX_URL_LENGTH = int(os.environ.get("URL_CLASSIFY_MAX_URL_LENGTH", "8192"))
+
+# What `.` matches in a JavaScript RegExp: anything but a line terminator.
+_ANY_CHAR = "[^\n\r\u2028\u2029]"
+# Patterns are indexed on the first characters of their longest literal; shorter literals are checked every time.
+_NGRAM_SIZE = 3
+
+
+def wildcard_regex(pattern: str) -> str:
+    """
+    Translate a blocklist pattern to a regular expression, like the extension's `matchesWildcard`.
+
+    `*` matches any run of characters and `?` any single character; everything else is literal. Like
+    `matchesWildcard`, the result is meant to be searched for anywhere in the URL, case-insensitively. The regex
+    backtracks, exponentially on some patterns, so the server matches with `WildcardPattern` instead; this is the
+    reference it is checked against.
+
+    Args:
+        pattern (str): The blocklist pattern.
+
+    Returns:
+        str: The equivalent regular expression.
+    """
+    return "".join(f"{_ANY_CHAR}*" if c == "*" else _ANY_CHAR if c == "?" else re.escape(c) for c in pattern)
+
+
+# Neither `*` nor `?` matches a line terminator, so a pattern without one matches within a single line of the URL.
+_LINE_TERMINATORS = re.compile("[\n\r\u2028\u2029]")
+
+
+def _fold(text: str) -> str:
+    # Lowercase without changing the length, which `?` counts on: "İ" lowercases to two characters, and folds to "i"
+    # as in a case-insensitive regex.
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c.lower()[0] for c in text)
+
+
+def _search_form(pattern: str) -> str:
+    # A search can start and stop anywhere, so leading and trailing stars change nothing.
+    return re.sub(r"\*+", "*", pattern).strip("*")
+
+
+def _required_literal(pattern: str) -> str:
+    # Any URL the pattern matches contains each of its literal runs, in lower case once both are lowercased.
+    literal = max(re.split(r"[*?]", pattern), key=len).lower()
+    # Lowercasing non-ASCII text can change its length or fold differently from the regex, so only index ASCII.
+    return literal if literal.isascii() else ""
+
+
+class WildcardPattern:
+    """
+    A blocklist pattern matched without backtracking.
+
+    The pattern is split on `*` into segments of literal text and `?`. Every `*` matches any run of characters, so
+    the pattern is found when each segment is found, in order, after the previous one, and taking the leftmost
+    occurrence of each segment never rules out a match. Each segment is located with `str.find` on its first literal
+    run and checked at fixed offsets, so a search costs at most the URL length times the pattern length, however the
+    stars are arranged; the equivalent backtracking regex (`wildcard_regex`) takes exponential time on patterns such
+    as "a*a*a*a*a*b".
+
+    Attributes:
+        pattern (str): The blocklist pattern.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        # (length, [(offset, literal), ...]) per segment; literals are folded like the URLs they are compared with.
+        self._segments: list[tuple[int, list[tuple[int, str]]]] = []
+        for segment in _fold(_search_form(pattern)).split("*"):
+            pieces = []
+            offset = 0
+            for literal in segment.split("?"):
+                if literal:
+                    pieces.append((offset, literal))
+                offset += len(literal) + 1
+            self._segments.append((len(segment), pieces))
+        self._multiline = _LINE_TERMINATORS.search(pattern) is not None
+
+    @staticmethod
+    def _find(text: str, length: int, pieces: list[tuple[int, str]], start: int) -> int:
+        """The leftmost position at or after `start` where a segment occurs in `text`, or -1."""
+        if not pieces:
+            return start if start + length <= len(text) else -1
+        first_offset, first = pieces[0]
+        found = text.find(first, start + first_offset)
+        while found != -1:
+            begin = found - first_offset
+            if begin + length > len(text):
+                return -1
+            if all(text.startswith(literal, begin + offset) for offset, literal in pieces[1:]):
+                return begin
+            found = text.find(first, found + 1)
+        return -1
+
+    def _search_line(self, line: str) -> bool:
+        position = 0
+        for length, pieces in self._segments:
+            found = self._find(line, length, pieces, position)
+            if found == -1:
+                return False
+            position = found + length
+        return True
+
+    def search(self, folded_url: str) -> bool:
+        """
+        Check whether the pattern matches anywhere in a URL.
+
+        Args:
+            folded_url (str): The URL, lowercased with `_fold`.
+
+        Returns:
+            bool: True if the pattern matches.
+        """
+        if self._multiline or not _LINE_TERMINATORS.search(folded_url):
+            # A pattern spelling out a line terminator can only match where the URL has that same character; the
+            # wildcards around it are not checked for terminators.
+            return self._search_line(folded_url)
+        return any(self._search_line(line) for line in _LINE_TERMINATORS.split(folded_url))
+
+
+class PatternMatcher:
+    """
+    A user's blocklist compiled for matching many URLs.
+
+    Each pattern is compiled once. A URL is only tested against the patterns whose longest literal starts with one
+    of the URL's trigrams and occurs in it, so the cost per URL grows with the number of plausible patterns rather
+    than with the size of the blocklist.
+
+    Attributes:
+        patterns (list[str]): The patterns, in the order they are tried.
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+        self._wildcards = [WildcardPattern(p) for p in self.patterns]
+        self._literals = [_required_literal(p) for p in self.patterns]
+        self._index: dict[str, list[int]] = {}
+        self._unindexed: list[int] = []
+        for position, literal in enumerate(self._literals):
+            if len(literal) >= _NGRAM_SIZE:
+                self._index.setdefault(literal[:_NGRAM_SIZE], []).append(position)
+            else:
+                self._unindexed.append(position)
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def match(self, url: str) -> str | None:
+        """
+        Find the pattern that blocks a URL.
+
+        Args:
+            url (str): The URL to check.
+
+        Returns:
+            str | None: The first pattern, in blocklist order, that matches anywhere in the URL, or None.
+        """
+        lowered = url.lower()
+        folded = _fold(url)
+        candidates = set(self._unindexed)
+        index = self._index
+        for start in range(len(lowered) - _NGRAM_SIZE + 1):
+            positions = index.get(lowered[start : start + _NGRAM_SIZE])
+            if positions:
+                candidates.update(positions)
+        for position in sorted(candidates):
+            if self._literals[position] in lowered and self._wildcards[position].search(folded):
+                return self.patterns[position]
+        return None
+
+    def classify(self, urls: Iterable[str]) -> list[str | None]:
+        """
+        Match each of several URLs.
+
+        Args:
+            urls (Iterable[str]): The URLs to check.
+
+        Returns:
+            list[str | None]: The blocking pattern of each URL, or None where no pattern matches.
+        """
+        return [self.match(url) for url in urls]
+
+
+class MatcherCache:
+    """
+    Bounded LRU cache of compiled blocklists keyed by Supabase user id.
+
+    Entries are tagged with the blocklist revision they were compiled from, and only returned for that revision, so
+    a blocklist change needs no invalidation.
+
+    Attributes:
+        max_size (int): The maximum number of cached users.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that required compiling the blocklist.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[int, PatternMatcher]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, supabase_user_id: str, revision: int) -> PatternMatcher | None:
+        """
+        Look up a user's compiled blocklist.
+
+        Args:
+            supabase_user_id (str): The Supabase user id.
+            revision (int): The user's current blocklist revision.
+
+        Returns:
+            PatternMatcher | None: The cached matcher, or None if absent or compiled from another revision.
+        """
+        with self._lock:
+            entry = self._entries.get(supabase_user_id)
+            if entry is None or entry[0] != revision:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(supabase_user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, supabase_user_id: str, revision: int, matcher: PatternMatcher) -> None:
+        """
+        Cache a user's compiled blocklist.
+
+        Args:
+            supabase_user_id (str): The Supabase user id.
+            revision (int): The blocklist revision read before the patterns were.
+            matcher (PatternMatcher): The compiled patterns.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[supabase_user_id] = (revision, matcher)
+            self._entries.move_to_end(supabase_user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, int | float]:
+        """
+        Report cache effectiveness.
+
+        Returns:
+            dict[str, int | float]: Hit and miss counters, hit ratio, and current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+
+matcher_cache = MatcherCache(max_size=URL_MATCHER_CACHE_MAX_SIZE)
+
+
+async def load_matcher(db: AsyncSession, supabase_user_id: str) -> tuple[int, PatternMatcher]:
+    """
+    Get the compiled form of a user's current blocklist, compiling it on a cache miss.
+
+    Patterns are tried oldest first, the order the extension appends them to its list.
+
+    Args:
+        db (AsyncSession): The database session.
+        supabase_user_id (str): The user whose blocklist is compiled.
+
+    Returns:
+        tuple[int, PatternMatcher]: The blocklist revision and its matcher.
+    """
+    # Read the revision first: a concurrent change can then only make the cached patterns newer than their tag.
+    revision = await blocklist_revision(db, supabase_user_id)
+    matcher = matcher_cache.get(supabase_user_id, revision)
+    if matcher is None:
+        patterns = await db.scalars(
+            select(BlockedPattern.pattern)
+            .where(BlockedPattern.supabase_user_id == supabase_user_id, BlockedPattern.deleted.is_(False))
+            .order_by(BlockedPattern.created_at, BlockedPattern.id)
+        )
+        matcher = PatternMatcher(patterns.all())
+        matcher_cache.put(supabase_user_id, revision, matcher)
+    return revision, matcher
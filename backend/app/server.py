@@ -0,0 +1,91 @@
+import logging
+import math
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+from uvicorn.supervisors import Multiprocess
+
+from logging_config import configure_logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> float:
+    """
+    Count the CPUs this process may actually use.
+
+    Honours the cgroup v2 CPU quota (e.g. docker `cpus: "0.50"`), which `os.cpu_count()` does not.
+
+    Returns:
+        float: The number of usable CPUs, possibly fractional.
+    """
+    cpus = float(len(os.sched_getaffinity(0)))
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, int(quota) / int(period))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+SERVER_HOST = os.environ.get("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", "8000"))
+# One worker per usable core by default.
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", str(max(1, math.ceil(available_cpus())))))
+SERVER_LOOP = os.environ.get("SERVER_LOOP", "uvloop")
+SERVER_HTTP = os.environ.get("SERVER_HTTP", "httptools")
+SERVER_BACKLOG = int(os.environ.get("SERVER_BACKLOG", "2048"))
+SERVER_KEEPALIVE_TIMEOUT_SECONDS = int(os.environ.get("SERVER_KEEPALIVE_TIMEOUT_SECONDS", "75"))
+# Recycle a worker after this many requests to bound memory growth; 0 disables recycling.
+SERVER_MAX_REQUESTS = int(os.environ.get("SERVER_MAX_REQUESTS", "10000"))
+# How long in-flight requests may run after SIGTERM before the worker is stopped.
+SERVER_GRACEFUL_TIMEOUT_SECONDS = int(os.environ.get("SERVER_GRACEFUL_TIMEOUT_SECONDS", "20"))
+# Comma separated addresses of the proxies in front of us (nginx terminates TLS). The client address is the right-most
+# X-Forwarded-For entry that is not one of them; "*" would take the left-most entry, which the client controls and
+# could change on every request to escape the per-IP admission limits.
+SERVER_FORWARDED_ALLOW_IPS = os.environ.get("SERVER_FORWARDED_ALLOW_IPS", "127.0.0.1")
+SERVER_ACCESS_LOG = os.environ.get("SERVER_ACCESS_LOG", "false").lower() in ("1", "true", "yes")
+
+
+def main():
+    configure_logging()
+    logger.info(
+        "Starting %s worker(s) on %s:%s (loop=%s, http=%s)",
+        WEB_CONCURRENCY,
+        SERVER_HOST,
+        SERVER_PORT,
+        SERVER_LOOP,
+        SERVER_HTTP,
+    )
+    # Each worker imports main:app and runs its lifespan, so pools and clients are created per process.
+    config = uvicorn.Config(
+        "main:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=WEB_CONCURRENCY,
+        loop=SERVER_LOOP,
+        http=SERVER_HTTP,
+        backlog=SERVER_BACKLOG,
+        timeout_keep_alive=SERVER_KEEPALIVE_TIMEOUT_SECONDS,
+        limit_max_requests=SERVER_MAX_REQUESTS or None,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        proxy_headers=True,
+        forwarded_allow_ips=SERVER_FORWARDED_ALLOW_IPS,
+        log_config=None,
+        access_log=SERVER_ACCESS_LOG,
+    )
+    server = uvicorn.Server(config)
+    # Always run under the supervisor, even with a single worker, so that workers exiting after
+    # SERVER_MAX_REQUESTS are replaced. On SIGTERM it stops every worker, which drains in-flight requests.
+    supervisor = Multiprocess(config, target=server.run, sockets=[config.bind_socket()])
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
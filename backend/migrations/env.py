@@ -0,0 +1,66 @@
+import os
+from logging.config import fileConfig
+
+from alembic import context
+from dotenv import load_dotenv
+from sqlalchemy import engine_from_config
+from sqlalchemy import pool
+
+from database.models import Base
+from database.partitions import is_partition_table
+
+load_dotenv()
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+POSTGRES_DATABASE_URL = os.environ.get("POSTGRES_DATABASE_URL")
+if POSTGRES_DATABASE_URL is None:
+    raise ValueError("POSTGRES_DATABASE_URL environment variable is not set")
+config.set_main_option("sqlalchemy.url", POSTGRES_DATABASE_URL.replace("%", "%%"))
+
+target_metadata = Base.metadata
+
+
+def include_name(name, type_, parent_names) -> bool:
+    """Leave blocking_history's partitions out of autogenerate; they are managed by `commands.history_partitions`."""
+    return not (type_ == "table" and is_partition_table(name))
+
+
+def run_migrations_offline() -> None:
+    """Emit the migration SQL to stdout instead of running it (`alembic upgrade head --sql`)."""
+    context.configure(
+        url=config.get_main_option("sqlalchemy.url"),
+        target_metadata=target_metadata,
+        include_name=include_name,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """Run the migrations against the database, or on the connection passed in `config.attributes["connection"]`."""
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata, include_name=include_name)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+    connectable = engine_from_config(
+        config.get_section(config.config_ini_section, {}),
+        prefix="sqlalchemy.",
+        poolclass=pool.NullPool,
+    )
+    with connectable.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata, include_name=include_name)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
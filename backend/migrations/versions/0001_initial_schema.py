@@ -0,0 +1,70 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+from alembic import context
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases created by the old `Base.metadata.create_all` on startup already have these tables,
+    # so only create what is missing. This lets existing deployments adopt migrations without a manual stamp.
+    existing = set() if context.is_offline_mode() else set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "paying_user" not in existing:
+        op.create_table(
+            "paying_user",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("supabase_user_id", sa.String(), nullable=True),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("is_paying", sa.Boolean(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_paying_user_id", "paying_user", ["id"])
+        op.create_index("ix_paying_user_supabase_user_id", "paying_user", ["supabase_user_id"], unique=True)
+        op.create_index("ix_paying_user_email", "paying_user", ["email"], unique=True)
+
+    if "blocked_pattern" not in existing:
+        op.create_table(
+            "blocked_pattern",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("supabase_user_id", sa.String(), nullable=False),
+            sa.Column("pattern", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_blocked_pattern_id", "blocked_pattern", ["id"])
+
+    if "blocking_history" not in existing:
+        op.create_table(
+            "blocking_history",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("supabase_user_id", sa.String(), nullable=False),
+            sa.Column("url", sa.String(), nullable=False),
+            sa.Column("pattern", sa.String(), nullable=False),
+            sa.Column("timestamp", sa.DateTime(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_blocking_history_id", "blocking_history", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("blocking_history")
+    op.drop_table("blocked_pattern")
+    op.drop_table("paying_user")
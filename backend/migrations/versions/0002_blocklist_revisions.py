@@ -0,0 +1,56 @@
+"""blocklist revisions and tombstones
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The old sync never prevented duplicates; keep the oldest row of each (user, pattern) pair.
+    op.execute(
+        """
+        DELETE FROM blocked_pattern a
+        USING blocked_pattern b
+        WHERE a.supabase_user_id = b.supabase_user_id AND a.pattern = b.pattern AND a.id > b.id
+        """
+    )
+    op.add_column("blocked_pattern", sa.Column("revision", sa.Integer(), server_default="0", nullable=False))
+    op.add_column("blocked_pattern", sa.Column("deleted", sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_unique_constraint("uq_blocked_pattern_user_pattern", "blocked_pattern", ["supabase_user_id", "pattern"])
+
+    op.create_table(
+        "blocklist_revision",
+        sa.Column("supabase_user_id", sa.String(), nullable=False),
+        sa.Column("revision", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("supabase_user_id"),
+    )
+    # Existing blocklists start at revision 1, so a client syncing from 0 receives them in full.
+    op.execute("UPDATE blocked_pattern SET revision = 1")
+    op.execute(
+        """
+        INSERT INTO blocklist_revision (supabase_user_id, revision)
+        SELECT DISTINCT supabase_user_id, 1 FROM blocked_pattern
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM blocked_pattern WHERE deleted")
+    op.drop_table("blocklist_revision")
+    op.drop_constraint("uq_blocked_pattern_user_pattern", "blocked_pattern", type_="unique")
+    op.drop_column("blocked_pattern", "deleted")
+    op.drop_column("blocked_pattern", "revision")
@@ -0,0 +1,55 @@
+"""per-user indexes and uniqueness for blocking_history
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from typing import Sequence
+from typing import Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Uploads were de-duplicated on (user, timestamp) in application code only; keep the latest row of each pair.
+    op.execute(
+        """
+        DELETE FROM blocking_history a
+        USING blocking_history b
+        WHERE a.supabase_user_id = b.supabase_user_id AND a.timestamp = b.timestamp AND a.id < b.id
+        """
+    )
+    # Build the indexes without blocking writes; CONCURRENTLY cannot run inside the migration transaction.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "uq_blocking_history_user_timestamp",
+            "blocking_history",
+            ["supabase_user_id", "timestamp"],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_blocking_history_user_pattern",
+            "blocking_history",
+            ["supabase_user_id", "pattern"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+    op.execute(
+        "ALTER TABLE blocking_history ADD CONSTRAINT uq_blocking_history_user_timestamp "
+        "UNIQUE USING INDEX uq_blocking_history_user_timestamp"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_blocking_history_user_pattern", table_name="blocking_history")
+    op.drop_constraint("uq_blocking_history_user_timestamp", "blocking_history", type_="unique")
@@ -0,0 +1,68 @@
+"""blocking stats rollup tables
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blocking_stats_user",
+        sa.Column("supabase_user_id", sa.String(), nullable=False),
+        sa.Column("total_tabs_blocked", sa.BigInteger(), nullable=False),
+        sa.Column("last_blocked", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("supabase_user_id"),
+    )
+    op.create_table(
+        "blocking_stats_daily",
+        sa.Column("supabase_user_id", sa.String(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("tabs_blocked", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("supabase_user_id", "day"),
+    )
+    op.create_table(
+        "blocking_stats_pattern",
+        sa.Column("supabase_user_id", sa.String(), nullable=False),
+        sa.Column("pattern", sa.String(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("supabase_user_id", "pattern"),
+    )
+    # Backfill from the existing history; afterwards the upload path keeps the rollups up to date.
+    op.execute(
+        """
+        INSERT INTO blocking_stats_user (supabase_user_id, total_tabs_blocked, last_blocked)
+        SELECT supabase_user_id, count(*), max(timestamp) FROM blocking_history GROUP BY supabase_user_id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO blocking_stats_daily (supabase_user_id, day, tabs_blocked)
+        SELECT supabase_user_id, date(timestamp), count(*) FROM blocking_history GROUP BY 1, 2
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO blocking_stats_pattern (supabase_user_id, pattern, count)
+        SELECT supabase_user_id, pattern, count(*) FROM blocking_history GROUP BY 1, 2
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("blocking_stats_pattern")
+    op.drop_table("blocking_stats_daily")
+    op.drop_table("blocking_stats_user")
@@ -0,0 +1,119 @@
+"""partition blocking_history by month
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from datetime import UTC
+from datetime import date
+from datetime import datetime
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Months partitioned ahead of the current one; later months are added by `commands.history_partitions maintain`.
+MONTHS_AHEAD = 3
+# Months with older history are not partitioned; their rows stay in the default partition.
+MAX_MONTHS_BACK = 120
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _history_columns() -> list[sa.Column]:
+    return [
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("supabase_user_id", sa.String(), nullable=False),
+        sa.Column("url", sa.String(), nullable=False),
+        sa.Column("pattern", sa.String(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    ]
+
+
+def _swap_out_history() -> None:
+    # Constraint and index names are unique per schema, so free them for the new table.
+    op.rename_table("blocking_history", "blocking_history_old")
+    op.execute("ALTER TABLE blocking_history_old RENAME CONSTRAINT blocking_history_pkey TO blocking_history_old_pkey")
+    op.execute(
+        "ALTER TABLE blocking_history_old RENAME CONSTRAINT uq_blocking_history_user_timestamp "
+        "TO uq_blocking_history_old_user_timestamp"
+    )
+    op.execute("ALTER INDEX ix_blocking_history_id RENAME TO ix_blocking_history_old_id")
+    op.execute("ALTER INDEX ix_blocking_history_user_pattern RENAME TO ix_blocking_history_old_user_pattern")
+
+
+def _copy_and_drop_old() -> None:
+    op.execute("ALTER SEQUENCE blocking_history_id_seq OWNED BY blocking_history.id")
+    op.execute(
+        "INSERT INTO blocking_history (id, supabase_user_id, url, pattern, timestamp, created_at, updated_at) "
+        "SELECT id, supabase_user_id, url, pattern, timestamp, created_at, updated_at FROM blocking_history_old"
+    )
+    op.drop_table("blocking_history_old")
+
+
+def upgrade() -> None:
+    _swap_out_history()
+    op.create_table(
+        "blocking_history",
+        *_history_columns(),
+        sa.PrimaryKeyConstraint("id", "timestamp", name="blocking_history_pkey"),
+        sa.UniqueConstraint("supabase_user_id", "timestamp", name="uq_blocking_history_user_timestamp"),
+        postgresql_partition_by="RANGE (timestamp)",
+    )
+    op.execute("ALTER TABLE blocking_history ALTER COLUMN id SET DEFAULT nextval('blocking_history_id_seq')")
+    op.create_index("ix_blocking_history_id", "blocking_history", ["id"])
+    op.create_index("ix_blocking_history_user_pattern", "blocking_history", ["supabase_user_id", "pattern"])
+    op.execute("CREATE TABLE blocking_history_default PARTITION OF blocking_history DEFAULT")
+
+    current = datetime.now(UTC).date().replace(day=1)
+    oldest = op.get_bind().scalar(sa.text("SELECT min(timestamp) FROM blocking_history_old"))
+    month = max(oldest.date().replace(day=1) if oldest else current, _add_months(current, -MAX_MONTHS_BACK))
+    while month <= _add_months(current, MONTHS_AHEAD):
+        upper = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE blocking_history_p{month.year:04d}_{month.month:02d} PARTITION OF blocking_history "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        month = upper
+    _copy_and_drop_old()
+
+    op.create_table(
+        "blocking_history_archive",
+        sa.Column("supabase_user_id", sa.String(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("pattern", sa.String(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("last_blocked", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("supabase_user_id", "day", "pattern"),
+    )
+
+
+def downgrade() -> None:
+    # Archived counts of expired history cannot be turned back into rows; the rollups still include them.
+    op.drop_table("blocking_history_archive")
+    _swap_out_history()
+    op.create_table(
+        "blocking_history",
+        *_history_columns(),
+        sa.PrimaryKeyConstraint("id", name="blocking_history_pkey"),
+        sa.UniqueConstraint("supabase_user_id", "timestamp", name="uq_blocking_history_user_timestamp"),
+    )
+    op.execute("ALTER TABLE blocking_history ALTER COLUMN id SET DEFAULT nextval('blocking_history_id_seq')")
+    op.create_index("ix_blocking_history_id", "blocking_history", ["id"])
+    op.create_index("ix_blocking_history_user_pattern", "blocking_history", ["supabase_user_id", "pattern"])
+    # Dropping the partitioned table drops its partitions too.
+    _copy_and_drop_old()
@@ -0,0 +1,34 @@
+"""mirror stripe customer on paying_user
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 00:00:00
+
+"""
+
+from typing import Sequence
+from typing import Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("paying_user", sa.Column("stripe_customer_id", sa.String(), nullable=True))
+    op.add_column("paying_user", sa.Column("stripe_subscription_id", sa.String(), nullable=True))
+    op.add_column("paying_user", sa.Column("subscription_status", sa.String(), nullable=True))
+    # Existing users are filled in by `commands.backfill_stripe_customers`.
+    op.create_index("ix_paying_user_stripe_customer_id", "paying_user", ["stripe_customer_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_paying_user_stripe_customer_id", table_name="paying_user")
+    op.drop_column("paying_user", "subscription_status")
+    op.drop_column("paying_user", "stripe_subscription_id")
+    op.drop_column("paying_user", "stripe_customer_id")